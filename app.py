@@ -2,11 +2,36 @@
 Flask Application - Roommate Matching System
 Main application entry point with routes
 """
-from flask import Flask, render_template, request, redirect, url_for, flash
-from models import db, Student, Match
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, abort
+from models import (db, Student, Match, MatchGroup, MatchGroupMember, MatchRun, CompatibilityRow,
+                    upgrade_schema)
 from similarity_engine import SimilarityEngine, AStarMatcher
+from blossom_matcher import BlossomMatcher
+from local_search import LocalSearchMatcher
+from constraints import MatchConstraints
+from partitioned_matcher import PartitionedMatcher
+from group_matcher import GroupMatcher
+from incremental_matcher import IncrementalMatcher
+from stable_roommates import StableRoommatesMatcher
+from compatibility_cache import CompatibilityCache
+from similarity_store import SimilarityStore
+from candidate_index import CandidateIndex
+from feature_store import FeatureStore
+from student_import import StudentImporter, detect_format
+from match_jobs import MatchJobQueue
+from query_counter import init_query_counting
+from response_cache import ResponseCache
+from pagination import keyset_paginate
+from metrics import REGISTRY, RunMetrics, init_logging, peak_rss_bytes
+from sqlalchemy.orm import joinedload, selectinload
 from config import Config
+from datetime import datetime
+import click
+import hmac
+import io
+import json
 import os
+import time
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -16,15 +41,53 @@ app.config.from_object(Config)
 db.init_app(app)
 
 # Create database tables
+# Hobby vocabulary and packed per-student features, normalized at write time
+feature_store = FeatureStore()
+
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+    feature_store.backfill()
+
+# Persistent pairwise score cache, maintained on registration
+compatibility_cache = CompatibilityCache(feature_store=feature_store)
+
+# Memory-mapped score matrix, used in place of the SQLite cache when a path is configured
+similarity_store = SimilarityStore(feature_store=feature_store) if Config.SIMILARITY_STORE_PATH else None
+score_cache = compatibility_cache if similarity_store is None else similarity_store
+
+# In-memory top-K roommate index, built lazily on first use
+candidate_index = CandidateIndex()
+
+# Rendered read-only pages, dropped whenever the data changes
+response_cache = ResponseCache()
+
+# Background worker pool for blossom, A*, greedy, stable, group and incremental matching runs
+match_jobs = MatchJobQueue(app)
+
+# Optional per-request SQL statement count (X-Query-Count header)
+if Config.QUERY_COUNT_HEADER:
+    init_query_counting(app)
+
+# JSON log lines for matching runs, and the job queue's state on /metrics
+init_logging()
+REGISTRY.gauge('matching_jobs', 'Known matching jobs by status', ('status',)).set_function(match_jobs.status_counts)
+
+
+def get_candidate_index():
+    """Return the candidate index, rebuilding it if it is out of sync with the database"""
+    if len(candidate_index) != Student.query.count():
+        candidate_index.build([s.to_vector() for s in Student.query.all()])
+    return candidate_index
 
 
 @app.route('/')
+@response_cache.cached
 def index():
     """Home page with navigation"""
     student_count = Student.query.count()
-    match_count = Match.query.count()
+    run = latest_run()
+    match_count = run.pair_count if run else 0
     return render_template('index.html', 
                          student_count=student_count,
                          match_count=match_count)
@@ -66,10 +129,17 @@ def register():
                 personality=personality,
                 hobbies=hobbies
             )
+            feature_store.normalize(student)
             
             db.session.add(student)
             db.session.commit()
             
+            # Score only the new student against everyone else
+            score_cache.add_student(student)
+            if len(candidate_index):
+                candidate_index.add(student.to_vector())
+            response_cache.bump()
+            
             flash(f'Successfully registered {name}!', 'success')
             return redirect(url_for('students'))
             
@@ -81,10 +151,433 @@ def register():
 
 
 @app.route('/students')
+@response_cache.cached
 def students():
-    """Display all registered students"""
-    all_students = Student.query.order_by(Student.created_at.desc()).all()
-    return render_template('students.html', students=all_students)
+    """Display registered students, newest first, one page at a time"""
+    page = keyset_paginate(
+        Student.query,
+        [(Student.created_at, True), (Student.id, True)],
+        request.args.get('after')
+    )
+    return render_template('students.html', students=page.items, page=page,
+                           student_count=Student.query.count())
+
+
+@app.route('/students/import', methods=['GET', 'POST'])
+def import_students():
+    """Bulk import students from an uploaded CSV or JSONL file"""
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or JSONL file to import!', 'error')
+            return redirect(url_for('import_students'))
+        try:
+            fmt = detect_format(upload.filename, request.form.get('format'))
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('import_students'))
+        
+        # Decode the upload as it is read instead of loading it into memory
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = StudentImporter(feature_store).import_stream(stream, fmt).to_dict()
+        if report['imported']:
+            response_cache.bump()
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(report)
+        flash(f'Imported {report["imported"]} of {report["rows"]} students '
+              f'({report["rows_per_second"]:.0f} rows/s).',
+              'success' if report['imported'] else 'info')
+    
+    return render_template('import.html', report=report)
+
+
+@app.cli.command('import-students')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension')
+@click.option('--batch-size', type=int, default=None, help='Students per transaction')
+def import_students_command(path, fmt, batch_size):
+    """Bulk import students from a CSV or JSONL file"""
+    try:
+        fmt = detect_format(path, fmt)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        report = StudentImporter(feature_store, batch_size).import_stream(stream, fmt)
+    
+    for error in report.errors:
+        click.echo(f'line {error["line"]}: {error["error"]}', err=True)
+    if report.duplicates + report.invalid > len(report.errors):
+        click.echo(f'... {report.duplicates + report.invalid - len(report.errors)} more', err=True)
+    click.echo(f'{report.rows} rows: {report.imported} imported, {report.duplicates} duplicates, '
+               f'{report.invalid} invalid in {report.elapsed:.2f}s ({report.rows_per_second:.0f} rows/s)')
+
+
+def load_selection(student_ids):
+    """
+    Load the selected students with IN queries instead of one SELECT per id
+    
+    Returns:
+        Students in selection order; unknown ids are skipped
+    """
+    student_ids = [int(sid) for sid in student_ids]
+    by_id = {}
+    chunk_size = CompatibilityCache.QUERY_CHUNK
+    for start in range(0, len(student_ids), chunk_size):
+        chunk = student_ids[start:start + chunk_size]
+        for student in Student.query.filter(Student.id.in_(chunk)):
+            by_id[student.id] = student
+    return [by_id[sid] for sid in student_ids if sid in by_id]
+
+
+def start_run(mode, student_count, parameters):
+    """Create a MatchRun row for a matching run that is about to start"""
+    run = MatchRun(
+        mode=mode,
+        status='running',
+        student_count=student_count,
+        parameters=json.dumps(parameters)
+    )
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+
+def save_matches(run, matches, stats=None, timings=None):
+    """
+    Store a run's (id1, id2, score, reasons) pairs and aggregates in one transaction
+    
+    Pairs are written with a single Core executemany instead of one ORM
+    object per row.
+    """
+    started = time.perf_counter()
+    rows = [
+        {
+            'run_id': run.id,
+            'student1_id': student1_id,
+            'student2_id': student2_id,
+            'compatibility_score': score,
+            'reasons': ', '.join(reasons)
+        }
+        for student1_id, student2_id, score, reasons in matches
+    ]
+    if rows:
+        db.session.execute(Match.__table__.insert(), rows)
+    
+    scores = [row['compatibility_score'] for row in rows]
+    run.pair_count = len(rows)
+    finish_run(run, scores, sum(scores), stats, timings, started)
+
+
+def save_groups(run, groups, stats=None, timings=None):
+    """
+    Store a group run's (member ids, total, average, reasons) rooms in one transaction
+    
+    The database assigns the room ids: rooms are inserted with one
+    executemany that returns their ids in row order, then the members go
+    through a Core executemany.
+    """
+    started = time.perf_counter()
+    rows = [
+        {
+            'run_id': run.id,
+            'room_size': len(student_ids),
+            'compatibility_score': average,
+            'total_score': total,
+            'reasons': ', '.join(reasons)
+        }
+        for student_ids, total, average, reasons in groups
+    ]
+    if rows:
+        group_ids = db.session.scalars(
+            db.insert(MatchGroup).returning(MatchGroup.id, sort_by_parameter_order=True), rows
+        ).all()
+        members = [
+            {'group_id': group_id, 'student_id': student_id}
+            for group_id, (student_ids, _, _, _) in zip(group_ids, groups)
+            for student_id in student_ids
+        ]
+        db.session.execute(MatchGroupMember.__table__.insert(), members)
+    
+    run.group_count = len(rows)
+    finish_run(run, [row['compatibility_score'] for row in rows],
+               sum(row['total_score'] for row in rows), stats, timings, started)
+
+
+def finish_run(run, scores, total_score, stats, timings, started):
+    """Record a run's aggregates, statistics and timings, and commit it as done"""
+    run.total_score = round(total_score, 2)
+    run.average_score = round(sum(scores) / len(scores), 2) if scores else 0.0
+    run.min_score = round(min(scores), 2) if scores else 0.0
+    run.max_score = round(max(scores), 2) if scores else 0.0
+    run.stats = json.dumps(stats or {})
+    for phase, seconds in (timings or {}).items():
+        setattr(run, f'{phase}_time', round(seconds, 4))
+    run.saving_time = round(time.perf_counter() - started, 4)
+    run.status = 'done'
+    run.finished_at = datetime.utcnow()
+    db.session.commit()
+    response_cache.bump()
+
+
+def latest_run():
+    """Most recent completed matching run (None if there is none)"""
+    return MatchRun.query.filter_by(status='done').order_by(MatchRun.id.desc()).first()
+
+
+def latest_cohort_run():
+    """Most recent completed run that paired a whole cohort (None if there is none)"""
+    return MatchRun.query.filter(
+        MatchRun.status == 'done', MatchRun.mode.in_(('astar', 'blossom', 'greedy', 'stable', 'incremental'))
+    ).order_by(MatchRun.id.desc()).first()
+
+
+def describe_result(mode, result):
+    """
+    Summary message of a finished blossom, A*, greedy, stable, group or incremental run
+    
+    Returns:
+        (message, flash category)
+    """
+    if mode == 'group':
+        rooms = ', '.join(f'{count} for {size}' for size, count in result['rooms'].items())
+        summary = (f'Group matching completed! {len(result["groups"])} rooms ({rooms or "none"}) '
+                   f'from the best of {result["restarts"]} restarts '
+                   f'({result["swaps"]} swaps, {result["search_time"]:.2f}s). ')
+        category = 'success' if result['stop_reason'] == 'converged' else 'info'
+        if result['blocks'] > 1:
+            summary += (f'Constraints ({MatchConstraints().describe()}) split the cohort '
+                        f'into {result["blocks"]} blocks. ')
+        return summary, category
+    if mode == 'incremental':
+        summary = (f'Incremental matching completed! Repaired run #{result["base_run_id"]} for '
+                   f'{result["added"]} new or previously unmatched and {result["withdrawn"]} withdrawn students: '
+                   f'{result["kept_pairs"]} pairs kept, {result["changed_pairs"]} changed, '
+                   f'{result["new_pairs"]} new ({result["region_size"]} students re-matched '
+                   f'in {result["search_time"]:.2f}s). ')
+        category = 'success'
+    elif mode == 'blossom':
+        summary = f'Blossom matching completed! {len(result["matches"])} optimal pairs found. '
+        category = 'success'
+    elif mode == 'stable':
+        examples = ', '.join(f'#{id1} and #{id2}' for id1, id2 in result['blocking_examples'])
+        if result['blocking_scope'] == 'all_pairs':
+            scope = 'among all pairs'
+        else:
+            scope = f'with respect to the top-{result["candidate_k"]} preference lists'
+        if result['stable']:
+            summary = (f'Stable matching completed! {len(result["matches"])} pairs found with no '
+                       f'blocking pairs {scope} ({result["proposals"]} proposals, '
+                       f'{result["rotations"]} rotations, {result["search_time"]:.2f}s). ')
+            category = 'success'
+        elif result['stop_reason'] == 'stable':
+            summary = (f'Matching of {len(result["matches"])} pairs completed; it is stable with respect '
+                       f'to the top-{result["candidate_k"]} preference lists but has '
+                       f'{result["blocking_pairs"]} blocking pairs {scope} (e.g. {examples}). ')
+            category = 'info'
+        else:
+            summary = (f'No stable matching exists for the top-{result["candidate_k"]} preference lists. '
+                       f'A best-pair-first matching of {len(result["matches"])} pairs was used instead; '
+                       f'it has {result["blocking_pairs"]} blocking pairs {scope} (e.g. {examples}). ')
+            category = 'info'
+    elif mode == 'greedy':
+        summary = (f'Greedy matching completed! {len(result["matches"])} pairs found '
+                   f'({result["swaps"]} 2-opt swaps in {result["passes"]} passes, '
+                   f'{result["search_time"]:.2f}s). '
+                   f'Optimality gap: at most {result["optimality_gap"]:.2f}% '
+                   f'({result["bound_heuristic"].replace("_", " ")} bound). ')
+        category = 'success'
+    elif result['optimal']:
+        summary = (f'A* Search completed! {len(result["matches"])} optimal pairs found. '
+                   f'Nodes explored: {result["nodes_explored"]} in {result["search_time"]:.2f}s '
+                   f'({result["heuristic"].replace("_", " ")} heuristic). ')
+        category = 'success'
+    else:
+        summary = (f'A* Search stopped early ({result["stop_reason"].replace("_", " ")}): '
+                   f'best of {len(result["matches"])} pairs found so far. '
+                   f'Nodes explored: {result["nodes_explored"]} in {result["search_time"]:.2f}s '
+                   f'({result["heuristic"].replace("_", " ")} heuristic). '
+                   f'Optimality gap: at most {result["optimality_gap"]:.2f}%. ')
+        category = 'info'
+    if 'blocks' in result:
+        summary += (f'Constraints ({MatchConstraints(**result["constraints"]).describe()}) split the cohort '
+                    f'into {result["blocks"]} blocks of at most {result["largest_block"]} students. ')
+    return summary, category
+
+
+def run_match_job(job):
+    """
+    Run a queued blossom, A*, greedy, stable, group or incremental matching job
+    
+    Called by the job queue on a worker thread inside an application context.
+    """
+    if job.mode == 'blossom':
+        parameters = {'candidate_k': Config.BLOSSOM_CANDIDATES}
+    elif job.mode == 'greedy':
+        parameters = {
+            'candidate_k': Config.LOCAL_SEARCH_CANDIDATES,
+            'time_limit': Config.LOCAL_SEARCH_TIME_LIMIT,
+            'max_passes': Config.LOCAL_SEARCH_MAX_PASSES
+        }
+    elif job.mode == 'stable':
+        parameters = {'candidate_k': Config.STABLE_CANDIDATES}
+    elif job.mode == 'incremental':
+        parameters = {
+            'base_run_id': job.options['base_run_id'],
+            'candidate_k': Config.INCREMENTAL_CANDIDATES,
+            'keep_bonus': Config.INCREMENTAL_KEEP_BONUS
+        }
+    elif job.mode == 'group':
+        parameters = {
+            'room_sizes': list(Config.GROUP_ROOM_SIZES),
+            'room_mix': job.options.get('room_mix'),
+            'restarts': Config.GROUP_RESTARTS,
+            'time_limit': Config.GROUP_TIME_LIMIT,
+            'max_passes': Config.GROUP_MAX_PASSES
+        }
+    else:
+        parameters = {
+            'heuristic': Config.ASTAR_HEURISTIC,
+            'max_nodes': Config.ASTAR_MAX_NODES,
+            'time_limit': Config.ASTAR_TIME_LIMIT,
+            'beam_width': Config.ASTAR_BEAM_WIDTH
+        }
+    constraints = MatchConstraints()
+    if constraints.active:
+        parameters['constraints'] = constraints.to_dict()
+    run = start_run(job.mode, len(job.student_ids), parameters)
+    job.update(run_id=run.id)
+    instrumentation = RunMetrics(job.mode, len(job.student_ids), run.id)
+    
+    try:
+        with instrumentation:
+            job.update(phase='loading')
+            with instrumentation.phase('load'):
+                students = load_selection(job.student_ids)
+            
+            if len(students) < 2:
+                raise ValueError('Invalid student selection!')
+            
+            # Convert to vectors and load their cached scores
+            job.update(phase='scoring')
+            with instrumentation.phase('vectors'):
+                student_vectors = [s.to_vector() for s in students]
+            score_matrix = encoded = scores = None
+            with instrumentation.phase('scoring'):
+                if job.mode == 'incremental':
+                    # The previous pairs; only the students they no longer cover get scored
+                    previous_pairs = [
+                        (id1, id2, score, reasons.split(', ') if reasons else [])
+                        for id1, id2, score, reasons in db.session.query(
+                            Match.student1_id, Match.student2_id, Match.compatibility_score, Match.reasons
+                        ).filter_by(run_id=parameters['base_run_id'])
+                    ]
+                    encoded = feature_store.load_encoded([s.id for s in students])
+                elif job.mode in ('greedy', 'stable') or constraints.active:
+                    # Only top-K candidates, or only pairs inside a block, are scored
+                    encoded = feature_store.load_encoded([s.id for s in students])
+                elif not (similarity_store is not None and job.mode == 'blossom'
+                          and len(students) > Config.SIMILARITY_STORE_DENSE_MAX):
+                    score_matrix = score_cache.get_score_matrix(student_vectors)
+                if similarity_store is not None and (
+                        job.mode == 'incremental'
+                        or (job.mode == 'blossom' and score_matrix is None and not constraints.active)):
+                    # Rows and pairs are read from the store a block at a time; greedy and
+                    # stable keep the pruned top-K search, which never scores most pairs
+                    scores = similarity_store.cohort(student_vectors)
+            
+            job.update(phase='matching')
+            with instrumentation.phase('matching'):
+                if job.mode == 'incremental':
+                    # Keep the previous pairs, re-match only the affected region
+                    incremental = IncrementalMatcher(constraints=constraints, scores=scores)
+                    result = incremental.match_students(student_vectors, previous_pairs, encoded)
+                    result['base_run_id'] = parameters['base_run_id']
+                elif job.mode == 'group':
+                    # Rooms of three or more: greedy seeding + swap search, restarts in parallel
+                    group_matcher = GroupMatcher(constraints=constraints, progress=job.update)
+                    result = group_matcher.match_students(student_vectors, score_matrix,
+                                                          job.options.get('room_mix'), encoded)
+                elif constraints.active:
+                    # Independent blocks of allowed pairs, matched in parallel
+                    partitioned = PartitionedMatcher(job.mode, constraints, progress=job.update)
+                    result = partitioned.match_students(student_vectors, encoded)
+                elif job.mode == 'blossom':
+                    # Edmonds' blossom algorithm for optimal matching of large cohorts
+                    result = BlossomMatcher().match_students(student_vectors, score_matrix, scores)
+                elif job.mode == 'stable':
+                    # Irving's stable roommates over top-K preference lists, checked for blocking pairs
+                    stable_matcher = StableRoommatesMatcher(progress=job.update)
+                    result = stable_matcher.match_students(student_vectors, encoded=encoded)
+                elif job.mode == 'greedy':
+                    # Greedy construction + 2-opt local search for cohorts too large to score densely
+                    local_search = LocalSearchMatcher(progress=job.update)
+                    result = local_search.match_students(student_vectors, encoded=encoded)
+                else:
+                    # A* Search for optimal batch matching
+                    astar_matcher = AStarMatcher(progress=job.update)
+                    result = astar_matcher.match_students(student_vectors, score_matrix)
+            if 'nodes_explored' in result:
+                job.update(nodes_explored=result['nodes_explored'])
+            instrumentation.record_search(result)
+            summary, category = describe_result(job.mode, result)
+            
+            stats = {key: value for key, value in result.items() if key not in ('matches', 'groups')}
+            if job.mode == 'group':
+                stats['group_count'] = len(result['groups'])
+                save = lambda: save_groups(run, result['groups'], stats, timings)
+            else:
+                stats['pairs'] = len(result['matches'])
+                save = lambda: save_matches(run, result['matches'], stats, timings)
+            stats['phases'] = {name: round(seconds, 4) for name, seconds in instrumentation.phases.items()}
+            stats['peak_rss_bytes'] = peak_rss_bytes()
+            timings = {
+                'load': instrumentation.phases['load'],
+                'scoring': instrumentation.phases['vectors'] + instrumentation.phases['scoring'],
+                'matching': instrumentation.phases['matching']
+            }
+            
+            # Save the run's pairs (or rooms) in one transaction
+            job.update(phase='saving')
+            with instrumentation.phase('saving'):
+                saved = match_jobs.persist(job, save)
+            if not saved:
+                instrumentation.status = 'superseded'
+    except Exception:
+        db.session.rollback()
+        run.status = 'failed'
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+        raise
+    
+    if saved:
+        job.add_message(summary + f'Average compatibility: {result["average_score"]:.2f}%', category)
+    else:
+        job.add_message('All data was reset while this run was in progress; its results were not saved.', 'error')
+    if job.mode == 'group' and result['unmatched']:
+        reason = 'no room left or no allowed roommates' if constraints.active else 'no room left'
+        names = {s.id: s.name for s in students}
+        listed = ', '.join(names[student_id] for student_id in result['unmatched'][:Config.UNMATCHED_ALTERNATIVES])
+        more = len(result['unmatched']) - Config.UNMATCHED_ALTERNATIVES
+        job.add_message(f'Unassigned students ({reason}): {len(result["unmatched"])} - {listed}'
+                        + (f' and {more} more' if more > 0 else ''), 'info')
+    elif result['unmatched']:
+        reason = 'odd number or no allowed partner' if constraints.active else 'odd number'
+        job.add_message(f'Unmatched students ({reason}): {len(result["unmatched"])}', 'info')
+        names = {s.id: s.name for s in students}
+        for student_id in result['unmatched'][:Config.UNMATCHED_ALTERNATIVES]:
+            options = [
+                f'{option["name"]} ({option["score"]:.2f}%'
+                + (f', matched with {names[option["partner_id"]]})' if option['partner_id'] else ')')
+                for option in result['alternatives'].get(student_id, [])
+            ]
+            job.add_message(f'{names[student_id]} was left unmatched. Best alternatives: '
+                            f'{", ".join(options) if options else "none allowed"}', 'info')
+    
+    stats['run_id'] = run.id if saved else None
+    stats['saved'] = saved
+    return stats
 
 
 @app.route('/match', methods=['GET', 'POST'])
@@ -96,52 +589,52 @@ def match():
             selected_ids = request.form.getlist('selected_students')
             matching_mode = request.form.get('matching_mode', 'pairwise')
             
-            # Clear ALL previous matches
-            Match.query.delete()
-            db.session.commit()
+            # The selection list is paginated; batch modes may select everyone at once
+            if request.form.get('select_all') and matching_mode != 'pairwise':
+                selected_ids = [sid for (sid,) in db.session.query(Student.id).order_by(Student.id)]
             
-            if matching_mode == 'astar':
-                # A* Search for optimal batch matching
-                if len(selected_ids) < 2:
-                    flash('Please select at least 2 students for A* matching!', 'error')
+            if matching_mode == 'group':
+                # Rooms of three or more; room counts left blank are planned automatically
+                smallest = min(Config.GROUP_ROOM_SIZES)
+                if len(selected_ids) < smallest:
+                    flash(f'Please select at least {smallest} students for group matching!', 'error')
                     return redirect(url_for('match'))
+                room_mix = {}
+                for size in Config.GROUP_ROOM_SIZES:
+                    count = request.form.get(f'rooms_{size}', '').strip()
+                    if count:
+                        if not count.isdigit():
+                            flash(f'Number of rooms for {size} must be a whole number!', 'error')
+                            return redirect(url_for('match'))
+                        room_mix[size] = int(count)
+                options = {'room_mix': room_mix} if any(room_mix.values()) else {}
                 
-                # Get all selected students
-                students = [Student.query.get(int(sid)) for sid in selected_ids]
-                students = [s for s in students if s is not None]
-                
-                if len(students) < 2:
-                    flash('Invalid student selection!', 'error')
+                job = match_jobs.submit(matching_mode, [int(sid) for sid in selected_ids], run_match_job, options)
+                return redirect(url_for('match_job_page', job_id=job.id))
+            
+            elif matching_mode == 'incremental':
+                # Repair the latest cohort matching for the current selection
+                base = latest_cohort_run()
+                if base is None:
+                    flash('Incremental matching repairs an earlier run; run A*, blossom, greedy or stable matching first!', 'error')
+                    return redirect(url_for('match'))
+                if len(selected_ids) < 2:
+                    flash('Please select at least 2 students for incremental matching!', 'error')
                     return redirect(url_for('match'))
                 
-                # Convert to vectors
-                student_vectors = [s.to_vector() for s in students]
-                
-                # Run A* Search algorithm
-                astar_matcher = AStarMatcher()
-                result = astar_matcher.match_students(student_vectors)
-                
-                # Save matches to database
-                for match_tuple in result['matches']:
-                    student1_id, student2_id, score, reasons = match_tuple
-                    match = Match(
-                        student1_id=student1_id,
-                        student2_id=student2_id,
-                        compatibility_score=score,
-                        reasons=', '.join(reasons)
-                    )
-                    db.session.add(match)
-                
-                db.session.commit()
-                
-                flash(f'A* Search completed! {len(result["matches"])} optimal pairs found. '
-                      f'Nodes explored: {result["nodes_explored"]}. '
-                      f'Average compatibility: {result["average_score"]:.2f}%', 'success')
-                
-                if result['unmatched']:
-                    flash(f'Unmatched students (odd number): {len(result["unmatched"])}', 'info')
+                job = match_jobs.submit(matching_mode, [int(sid) for sid in selected_ids], run_match_job,
+                                        {'base_run_id': base.id})
+                return redirect(url_for('match_job_page', job_id=job.id))
+            
+            elif matching_mode in ('blossom', 'astar', 'greedy', 'stable'):
+                # Blossom, A*, greedy and stable runs go to the background job queue
+                if len(selected_ids) < 2:
+                    label = {'blossom': 'blossom', 'astar': 'A*', 'greedy': 'greedy', 'stable': 'stable'}[matching_mode]
+                    flash(f'Please select at least 2 students for {label} matching!', 'error')
+                    return redirect(url_for('match'))
                 
-                return redirect(url_for('results'))
+                job = match_jobs.submit(matching_mode, [int(sid) for sid in selected_ids], run_match_job)
+                return redirect(url_for('match_job_page', job_id=job.id))
             
             else:
                 # Original pairwise matching (for comparison)
@@ -165,19 +658,20 @@ def match():
                 vec1 = student1.to_vector()
                 vec2 = student2.to_vector()
                 
+                # Hard constraints apply to pairwise matches too
+                violation = MatchConstraints().violation(vec1, vec2)
+                if violation:
+                    flash(f'{student1.name} and {student2.name} cannot be roommates: {violation}.', 'error')
+                    return redirect(url_for('match'))
+                
                 # Calculate similarity score
                 similarity_engine = SimilarityEngine()
                 score, reasons = similarity_engine.calculate_similarity_score(vec1, vec2)
                 
-                # Save match to database
-                match = Match(
-                    student1_id=student1_id,
-                    student2_id=student2_id,
-                    compatibility_score=score,
-                    reasons=', '.join(reasons)
-                )
-                db.session.add(match)
-                db.session.commit()
+                # Save match to database as a single-pair run
+                run = start_run('pairwise', 2, {})
+                with match_jobs.persist_lock:
+                    save_matches(run, [(student1_id, student2_id, score, reasons)])
                 
                 flash(f'Pairwise compatibility calculated: {score:.2f}%', 'success')
                 return redirect(url_for('results'))
@@ -187,54 +681,188 @@ def match():
             return redirect(url_for('match'))
     
     # GET request - show student selection page
-    all_students = Student.query.order_by(Student.name).all()
-    student_count = len(all_students)
-    return render_template('match.html', student_count=student_count, students=all_students)
+    page = keyset_paginate(
+        Student.query,
+        [(Student.name, False), (Student.id, False)],
+        request.args.get('after')
+    )
+    student_count = Student.query.count()
+    return render_template('match.html', student_count=student_count, students=page.items, page=page,
+                           constraints=MatchConstraints(), room_sizes=Config.GROUP_ROOM_SIZES)
+
+
+@app.route('/match/jobs/<job_id>')
+def match_job_status(job_id):
+    """Return the status and progress of a matching job as JSON"""
+    job = match_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/match/jobs/<job_id>/view')
+def match_job_page(job_id):
+    """Progress page that polls a matching job until it finishes"""
+    job = match_jobs.get(job_id)
+    if job is None:
+        flash('Matching job not found.', 'error')
+        return redirect(url_for('match'))
+    return render_template('job.html', job=job.to_dict())
+
+
+@app.route('/match/jobs/<job_id>/finish')
+def match_job_finish(job_id):
+    """Show a finished job's messages and continue to its results"""
+    job = match_jobs.get(job_id)
+    if job is None:
+        flash('Matching job not found.', 'error')
+        return redirect(url_for('match'))
+    if not job.finished:
+        return redirect(url_for('match_job_page', job_id=job.id))
+    
+    for category, text in job.messages:
+        flash(text, category)
+    if job.status == 'failed' or not job.result['saved']:
+        return redirect(url_for('match'))
+    return redirect(url_for('results', run=job.result['run_id']))
 
 
 @app.route('/results')
+@response_cache.cached
 def results():
-    """Display matching results"""
-    matches = Match.query.order_by(Match.compatibility_score.desc()).all()
+    """Display the results of the latest matching run (or ?run=<id>)"""
+    run_id = request.args.get('run', type=int)
+    run = MatchRun.query.get(run_id) if run_id else latest_run()
     
-    if not matches:
+    if run is None or run.status != 'done':
         flash('No matches found. Please run the matching algorithm first.', 'info')
         return redirect(url_for('match'))
     
-    # Calculate statistics
-    scores = [match.compatibility_score for match in matches]
+    if run.mode == 'group':
+        # Rooms best first, with their members in one extra query per page
+        page = keyset_paginate(
+            MatchGroup.query.options(
+                selectinload(MatchGroup.members).joinedload(MatchGroupMember.student)
+            ).filter_by(run_id=run.id),
+            [(MatchGroup.compatibility_score, True), (MatchGroup.id, True)],
+            request.args.get('after')
+        )
+    else:
+        page = keyset_paginate(
+            Match.query.options(
+                joinedload(Match.student1), joinedload(Match.student2)
+            ).filter_by(run_id=run.id),
+            [(Match.compatibility_score, True), (Match.id, True)],
+            request.args.get('after')
+        )
+    
+    # Statistics were aggregated when the run was saved
     stats = {
-        'total_pairs': len(matches),
-        'average_score': round(sum(scores) / len(scores), 2) if scores else 0,
-        'min_score': round(min(scores), 2) if scores else 0,
-        'max_score': round(max(scores), 2) if scores else 0
+        'total_pairs': run.pair_count,
+        'total_groups': run.group_count,
+        'average_score': run.average_score,
+        'min_score': run.min_score,
+        'max_score': run.max_score
     }
     
+    # Recent runs for comparison
+    runs = MatchRun.query.filter_by(status='done').order_by(MatchRun.id.desc()).limit(
+        Config.RESULTS_RUN_HISTORY).all()
+    
     return render_template('results.html', 
-                         matches=matches, 
-                         stats=stats)
+                         matches=page.items if run.mode != 'group' else [],
+                         groups=page.items if run.mode == 'group' else [],
+                         page=page,
+                         stats=stats,
+                         run=run,
+                         runs=runs)
 
 
 @app.route('/student/<int:student_id>')
+@response_cache.cached
 def student_profile(student_id):
     """Display individual student profile"""
     student = Student.query.get_or_404(student_id)
     
-    # Get student's match if exists
-    match = Match.query.filter(
-        (Match.student1_id == student_id) | (Match.student2_id == student_id)
-    ).first()
+    # Get student's match (or room, after a group run) in the latest run if exists
+    run = latest_run()
+    match = None
+    group = None
+    if run is not None and run.mode == 'group':
+        group = MatchGroup.query.options(
+            selectinload(MatchGroup.members).joinedload(MatchGroupMember.student)
+        ).join(MatchGroupMember).filter(
+            MatchGroup.run_id == run.id, MatchGroupMember.student_id == student_id
+        ).first()
+    elif run is not None:
+        # Two indexed lookups; an OR across both columns would scan the whole run
+        run_matches = Match.query.options(
+            joinedload(Match.student1), joinedload(Match.student2)
+        ).filter(Match.run_id == run.id)
+        match = (run_matches.filter(Match.student1_id == student_id).first()
+                 or run_matches.filter(Match.student2_id == student_id).first())
     
-    return render_template('profile.html', student=student, match=match)
+    # Best alternative roommates from the candidate index, within the hard constraints
+    candidates = get_candidate_index().candidates(student.to_vector(), Config.CANDIDATE_PROFILE_K,
+                                                  MatchConstraints())
+    
+    return render_template('profile.html', student=student, match=match, group=group, candidates=candidates)
+
+
+@app.route('/student/<int:student_id>/candidates')
+def student_candidates(student_id):
+    """Return the top-K most compatible roommates for a student as JSON"""
+    student = Student.query.get_or_404(student_id)
+    k = request.args.get('k', Config.CANDIDATE_DEFAULT_K, type=int)
+    k = max(1, min(k, Config.CANDIDATE_MAX_K))
+    
+    candidates = get_candidate_index().candidates(student.to_vector(), k, MatchConstraints())
+    for candidate in candidates:
+        candidate['profile_url'] = url_for('student_profile', student_id=candidate['id'])
+    
+    return jsonify({
+        'student_id': student.id,
+        'k': k,
+        'candidates': candidates
+    })
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Matching run metrics in the Prometheus text format
+    
+    The peer address is the proxy's behind a reverse proxy, so access is
+    granted by a bearer token or an explicitly configured address only.
+    """
+    if not Config.METRICS_ENABLED:
+        abort(404)
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    token_ok = bool(Config.METRICS_TOKEN) and hmac.compare_digest(token.encode(), Config.METRICS_TOKEN.encode())
+    if not token_ok and request.remote_addr not in Config.METRICS_ALLOWED_ADDRESSES:
+        abort(403)
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/reset', methods=['POST'])
 def reset():
     """Reset all data (for testing purposes)"""
     try:
-        Match.query.delete()
-        Student.query.delete()
-        db.session.commit()
+        def delete_all():
+            Match.query.delete()
+            MatchGroupMember.query.delete()
+            MatchGroup.query.delete()
+            MatchRun.query.delete()
+            CompatibilityRow.query.delete()
+            Student.query.delete()
+            db.session.commit()
+            if similarity_store is not None:
+                similarity_store.clear()
+        
+        # Runs still in flight must not write matches for deleted students
+        match_jobs.supersede_all(delete_all)
+        candidate_index.clear()
+        response_cache.bump()
         flash('All data has been reset!', 'success')
     except Exception as e:
         flash(f'Error during reset: {str(e)}', 'error')
@@ -0,0 +1,215 @@
+"""
+A* Heuristics Module
+Admissible upper bounds on the remaining compatibility of a partial matching
+
+Every heuristic here is a feasible dual of the perfect-matching LP over the
+unmatched students: values u_i with u_i + u_j >= score(i, j) for every
+remaining pair, so sum(u) bounds the best total any completion can reach.
+Because the duals of a state stay feasible once a pair is removed, the bound
+of a child state follows from its parent in O(1) as h - u_a - u_b. That
+makes every heuristic consistent and lets A* evaluate successors without
+rescanning the unmatched set.
+
+Heuristics (Config.ASTAR_HEURISTIC):
+    best_partner  Each student's best remaining score, halved. Sorted
+                  neighbour lists keep it O(m) per state and the exact
+                  per-child value is maintained incrementally.
+    dual          best_partner tightened by coordinate descent on the duals.
+    assignment    Hungarian (assignment) relaxation, halved. Tightest, O(m^3).
+"""
+from config import Config
+
+
+def mask_indices(mask):
+    """List the indices whose bits are set in mask"""
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+class AStarHeuristic:
+    """Base class: dual-based bound with O(1) child updates"""
+
+    name = None
+
+    def __init__(self, scores):
+        """Initialize with dense score rows (scores[i][j] for indices 0..n-1)"""
+        self.scores = scores
+        self.evaluations = 0
+
+    def duals(self, mask):
+        """Feasible duals {index: u} for the students in mask"""
+        raise NotImplementedError
+
+    def prepare(self, mask):
+        """
+        Compute the bound of a state before expanding it
+
+        Returns:
+            Context tuple (bound, duals) passed to child_bound
+        """
+        self.evaluations += 1
+        duals = self.duals(mask)
+        return sum(duals.values()), duals
+
+    def child_bound(self, context, mask, a, b):
+        """Bound of the state reached by matching a and b (mask is the child's)"""
+        bound, duals = context
+        return bound - duals[a] - duals[b]
+
+    def bound(self, mask):
+        """Bound of a single state"""
+        if mask & (mask - 1) == 0:
+            return 0.0
+        return self.prepare(mask)[0]
+
+
+class BestPartnerHeuristic(AStarHeuristic):
+    """Half of each student's best remaining score, using sorted neighbour lists"""
+
+    name = 'best_partner'
+
+    def __init__(self, scores):
+        super().__init__(scores)
+        n = len(scores)
+        # Neighbours of every student, best score first
+        self.neighbors = [
+            sorted((j for j in range(n) if j != i), key=lambda j, row=scores[i]: -row[j])
+            for i in range(n)
+        ]
+
+    def best_partner(self, i, mask):
+        """Index of the best remaining partner of i, or -1"""
+        for j in self.neighbors[i]:
+            if mask >> j & 1:
+                return j
+        return -1
+
+    def prepare(self, mask):
+        self.evaluations += 1
+        duals = {}
+        followers = {}
+        for i in mask_indices(mask):
+            j = self.best_partner(i, mask)
+            duals[i] = self.scores[i][j] / 2 if j >= 0 else 0.0
+            followers.setdefault(j, []).append(i)
+        return sum(duals.values()), duals, followers
+
+    def duals(self, mask):
+        return self.prepare(mask)[1]
+
+    def child_bound(self, context, mask, a, b):
+        """Exact best-partner bound of the child: only students whose best was a or b change"""
+        bound, duals, followers = context
+        bound -= duals[a] + duals[b]
+        for i in followers.get(a, []) + followers.get(b, []):
+            if i == a or i == b:
+                continue
+            j = self.best_partner(i, mask)
+            bound -= duals[i] - (self.scores[i][j] / 2 if j >= 0 else 0.0)
+        return bound
+
+
+class DualHeuristic(BestPartnerHeuristic):
+    """Best-partner duals tightened by coordinate descent"""
+
+    name = 'dual'
+
+    def __init__(self, scores, passes=None):
+        super().__init__(scores)
+        self.passes = passes if passes is not None else Config.ASTAR_DUAL_PASSES
+
+    def prepare(self, mask):
+        duals = BestPartnerHeuristic.prepare(self, mask)[1]
+        remaining = list(duals)
+
+        # Lower each u_i to the smallest value that keeps all its pairs covered
+        for _ in range(self.passes):
+            for i in remaining:
+                row = self.scores[i]
+                duals[i] = max(row[j] - duals[j] for j in remaining if j != i)
+        return sum(duals.values()), duals
+
+    def child_bound(self, context, mask, a, b):
+        return AStarHeuristic.child_bound(self, context, mask, a, b)
+
+
+class AssignmentHeuristic(AStarHeuristic):
+    """
+    Assignment relaxation: a perfect matching is an assignment in which
+    every student points at its partner, so half the maximum-weight
+    assignment (no self-assignment) bounds the matching.
+    """
+
+    name = 'assignment'
+
+    # Cost of assigning a student to itself; large enough never to be chosen
+    FORBIDDEN = 1e9
+
+    def duals(self, mask):
+        remaining = mask_indices(mask)
+        m = len(remaining)
+        INF = float('inf')
+
+        # Hungarian algorithm (minimizing -score), 1-indexed potentials
+        cost = [[0.0] * (m + 1)]
+        for i in remaining:
+            row = self.scores[i]
+            cost.append([0.0] + [-row[j] if j != i else self.FORBIDDEN for j in remaining])
+        u = [0.0] * (m + 1)
+        v = [0.0] * (m + 1)
+        p = [0] * (m + 1)
+        way = [0] * (m + 1)
+        for i in range(1, m + 1):
+            p[0] = i
+            j0 = 0
+            minv = [INF] * (m + 1)
+            used = [False] * (m + 1)
+            while True:
+                used[j0] = True
+                i0 = p[j0]
+                delta = INF
+                j1 = 0
+                row = cost[i0]
+                ui0 = u[i0]
+                for j in range(1, m + 1):
+                    if not used[j]:
+                        cur = row[j] - ui0 - v[j]
+                        if cur < minv[j]:
+                            minv[j] = cur
+                            way[j] = j0
+                        if minv[j] < delta:
+                            delta = minv[j]
+                            j1 = j
+                for j in range(m + 1):
+                    if used[j]:
+                        u[p[j]] += delta
+                        v[j] -= delta
+                    else:
+                        minv[j] -= delta
+                j0 = j1
+                if p[j0] == 0:
+                    break
+            while j0:
+                j1 = way[j0]
+                p[j0] = p[j1]
+                j0 = j1
+
+        # u_i + v_j <= -score(i, j), so d_i = -(u_i + v_i) / 2 covers every pair
+        return {i: -(u[k + 1] + v[k + 1]) / 2 for k, i in enumerate(remaining)}
+
+
+HEURISTICS = {
+    cls.name: cls for cls in (BestPartnerHeuristic, DualHeuristic, AssignmentHeuristic)
+}
+
+
+def make_heuristic(name, scores):
+    """Instantiate a heuristic by name"""
+    try:
+        return HEURISTICS[name](scores)
+    except KeyError:
+        raise ValueError(f'Unknown A* heuristic: {name}')
@@ -0,0 +1,301 @@
+"""
+Benchmark Harness
+Reproducible timings of the similarity engine and the matchers as n grows
+
+Each engine is run on seeded synthetic cohorts whose values follow the
+domains of the Student model, for a sweep of cohort sizes. For every
+(engine, n) the harness records wall time (best and median of --repeat
+runs), peak traced memory (one extra run under tracemalloc, so tracing does
+not distort the timings), and for the matchers nodes explored, pairs and
+solution quality relative to the optimal blossom matching of the same
+cohort. Matchers get a precomputed score matrix, so their timings cover the
+matching alone; the 'matrix' engine measures scoring.
+
+Results are written as JSON (or CSV) together with the commit, interpreter
+and configuration they were measured with, and a previous results file can
+be passed to --compare to flag regressions:
+
+    python benchmark.py --sizes 16,24,32,64 --engines astar,blossom --output base.json
+    python benchmark.py --sizes 16,24,32,64 --engines astar,blossom --compare base.json
+"""
+from config import Config
+import argparse
+import csv
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from similarity_engine import SimilarityEngine, AStarMatcher
+from blossom_matcher import BlossomMatcher
+from local_search import LocalSearchMatcher
+
+HOBBIES = [
+    'reading', 'gaming', 'music', 'sports', 'cooking', 'hiking', 'art', 'movies',
+    'travel', 'coding', 'yoga', 'dance', 'photography', 'chess', 'gardening', 'writing'
+]
+
+DEFAULT_SIZES = [8, 16, 24, 32, 64, 128, 256, 512, 1024, 2048]
+
+# Largest n each engine is run at unless --max-n overrides it
+ENGINE_MAX_N = {
+    'pairwise_score': 1024,  # Scalar calculate_similarity_score over every pair
+    'all_similarities': 1024,  # Dictionary of n^2 entries
+    'matrix': None,
+    'blossom': None,
+    'astar': 128,
+    'greedy': None
+}
+
+MATCHERS = ('astar', 'blossom', 'greedy')
+
+
+def generate_students(n, seed=0):
+    """
+    Seeded synthetic student vectors within the value domains of models.Student
+
+    Returns:
+        List of vectors in the layout of Student.to_vector
+    """
+    rng = random.Random(seed)
+    return [{
+        'id': i + 1,
+        'name': f'Student {i + 1}',
+        'sleep_time': rng.randint(0, 2),
+        'study_time': rng.randint(0, 3),
+        'cleanliness': rng.randint(1, 5),
+        'noise_tolerance': rng.randint(1, 5),
+        'personality': rng.randint(0, 2),
+        'hobbies': rng.sample(HOBBIES, rng.randint(1, 5))
+    } for i in range(n)]
+
+
+def measure(func, repeat, trace_memory=True):
+    """
+    Time func over repeat runs, then trace its peak memory in one more run
+
+    Returns:
+        (result of the last timed run, list of wall times, peak bytes or None)
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, times, peak
+
+
+def make_task(engine, students, score_matrix, args):
+    """Zero-argument callable running one engine on one cohort"""
+    similarity_engine = SimilarityEngine()
+    if engine == 'pairwise_score':
+        def task():
+            n = len(students)
+            for i in range(n):
+                for j in range(i + 1, n):
+                    similarity_engine.calculate_similarity_score(students[i], students[j])
+        return task
+    if engine == 'all_similarities':
+        return lambda: similarity_engine.calculate_all_similarities(students)
+    if engine == 'matrix':
+        return lambda: similarity_engine.calculate_similarity_matrix(students)
+    if engine == 'blossom':
+        return lambda: BlossomMatcher(similarity_engine).match_students(students, score_matrix)
+    if engine == 'astar':
+        limits = {'max_nodes': args.astar_max_nodes, 'time_limit': args.astar_time_limit}
+        return lambda: AStarMatcher(similarity_engine, heuristic=args.astar_heuristic).match_students(
+            students, score_matrix, **limits)
+    if engine == 'greedy':
+        return lambda: LocalSearchMatcher(similarity_engine).match_students(students)
+    raise ValueError(f'Unknown engine {engine!r}')
+
+
+def run_benchmarks(args):
+    """Run the sweep and return one record per (engine, n)"""
+    records = []
+    for n in args.sizes:
+        students = generate_students(n, args.seed)
+        score_matrix = None
+        optimum = None
+        if any(engine in MATCHERS for engine in args.engines):
+            score_matrix = SimilarityEngine().calculate_similarity_matrix(students)
+            optimum = BlossomMatcher().match_students(students, score_matrix)['total_score']
+
+        for engine in args.engines:
+            max_n = args.max_n if args.max_n is not None else ENGINE_MAX_N[engine]
+            if max_n is not None and n > max_n:
+                continue
+
+            result, times, peak = measure(make_task(engine, students, score_matrix, args),
+                                          args.repeat, not args.no_memory)
+            record = {
+                'engine': engine,
+                'n': n,
+                'seed': args.seed,
+                'repeat': args.repeat,
+                'wall_time': round(min(times), 6),
+                'wall_time_median': round(statistics.median(times), 6),
+                'peak_memory_bytes': peak
+            }
+            if engine in MATCHERS:
+                record.update({
+                    'pairs': len(result['matches']),
+                    'total_score': result['total_score'],
+                    'average_score': result['average_score'],
+                    'quality': round(result['total_score'] / optimum, 6) if optimum else None,
+                    'nodes_explored': result.get('nodes_explored'),
+                    'optimal': result.get('optimal', True),
+                    'stop_reason': result.get('stop_reason')
+                })
+            records.append(record)
+            if not args.quiet:
+                print(format_record(record), file=sys.stderr, flush=True)
+    return records
+
+
+def format_record(record):
+    """One human-readable line"""
+    line = f'{record["engine"]:>16} n={record["n"]:<6} {record["wall_time"]:10.4f}s'
+    if record['peak_memory_bytes'] is not None:
+        line += f' {record["peak_memory_bytes"] / 2 ** 20:9.1f} MiB'
+    if 'quality' in record:
+        line += f'  quality={record["quality"]}'
+        if record['nodes_explored'] is not None:
+            line += f' nodes={record["nodes_explored"]} ({record["stop_reason"]})'
+    return line
+
+
+def environment():
+    """Commit, interpreter and configuration the results were measured with"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'config': {
+            'ASTAR_HEURISTIC': Config.ASTAR_HEURISTIC,
+            'ASTAR_MAX_NODES': Config.ASTAR_MAX_NODES,
+            'ASTAR_TIME_LIMIT': Config.ASTAR_TIME_LIMIT,
+            'BLOSSOM_CANDIDATES': Config.BLOSSOM_CANDIDATES,
+            'LOCAL_SEARCH_CANDIDATES': Config.LOCAL_SEARCH_CANDIDATES,
+            'LOCAL_SEARCH_TIME_LIMIT': Config.LOCAL_SEARCH_TIME_LIMIT,
+            'SCORING_WORKERS': Config.SCORING_WORKERS
+        }
+    }
+
+
+def write_results(path, meta, records):
+    """Write JSON, or CSV when path ends in .csv"""
+    if path.endswith('.csv'):
+        fields = []
+        for record in records:
+            fields.extend(key for key in record if key not in fields)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'meta': meta, 'results': records}, f, indent=2)
+
+
+def compare(baseline_path, records, threshold):
+    """
+    Print time and quality changes against a previous JSON results file (to stderr)
+
+    Returns:
+        Number of (engine, n) records slower than threshold times the baseline
+        or with lower quality
+    """
+    with open(baseline_path) as f:
+        baseline = {(r['engine'], r['n']): r for r in json.load(f)['results']}
+
+    regressions = 0
+    for record in records:
+        before = baseline.get((record['engine'], record['n']))
+        if not before or not before['wall_time']:
+            continue
+        ratio = record['wall_time'] / before['wall_time']
+        worse = ratio > threshold
+        if record.get('quality') is not None and before.get('quality') is not None:
+            worse = worse or record['quality'] < before['quality'] - 1e-9
+        regressions += worse
+        print(f'{record["engine"]:>16} n={record["n"]:<6} {before["wall_time"]:10.4f}s -> '
+              f'{record["wall_time"]:10.4f}s  x{ratio:.2f}'
+              f'{"  quality " + str(before.get("quality")) + " -> " + str(record.get("quality")) if "quality" in record else ""}'
+              f'{"  REGRESSION" if worse else ""}', file=sys.stderr)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--engines', default=','.join(ENGINE_MAX_N),
+                        type=lambda value: value.split(','),
+                        help=f'Comma-separated subset of {", ".join(ENGINE_MAX_N)}')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        type=lambda value: [int(n) for n in value.split(',')],
+                        help='Comma-separated cohort sizes')
+    parser.add_argument('--seed', type=int, default=0, help='Cohort generator seed')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per measurement')
+    parser.add_argument('--max-n', type=int, default=None,
+                        help='Run every engine up to this n (default: per-engine limits)')
+    parser.add_argument('--astar-heuristic', default=None, help='Default: Config.ASTAR_HEURISTIC')
+    parser.add_argument('--astar-max-nodes', type=int, default=Config.ASTAR_MAX_NODES)
+    parser.add_argument('--astar-time-limit', type=float, default=Config.ASTAR_TIME_LIMIT)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run')
+    parser.add_argument('--output', help='Write results to this .json or .csv file')
+    parser.add_argument('--compare', help='Previous JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Slowdown ratio reported as a regression')
+    parser.add_argument('--quiet', action='store_true', help='Do not print progress')
+    args = parser.parse_args(argv)
+
+    unknown = [engine for engine in args.engines if engine not in ENGINE_MAX_N]
+    if unknown:
+        parser.error(f'Unknown engines: {", ".join(unknown)}')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    meta = environment()
+    meta['arguments'] = {key: value for key, value in vars(args).items()
+                         if key not in ('output', 'compare', 'quiet')}
+    records = run_benchmarks(args)
+
+    if args.output:
+        write_results(args.output, meta, records)
+    else:
+        json.dump({'meta': meta, 'results': records}, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        return 1 if compare(args.compare, records, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,685 @@
+"""
+Blossom Matcher Module
+Maximum-weight roommate matching with Edmonds' blossom algorithm
+
+The A* search in similarity_engine.py explores a state space that grows like
+(n-1)!!, which limits it to small selections. The primal-dual blossom
+algorithm finds the same optimum in O(n^3) time. To keep dense cohorts
+tractable the solver first runs on a sparse candidate graph (each student's
+top-K partners) and then certifies the result against every pair using the
+dual variables; any pair that violates dual feasibility is added to the
+graph and the solve is repeated, so the final answer is always optimal for
+the complete graph.
+"""
+from config import Config
+import numpy as np
+
+from similarity_engine import SimilarityEngine
+
+
+def max_weight_matching(nvertex, edges, maxcardinality=False, jumpstart=False):
+    """
+    Compute a maximum-weight matching of a general graph
+
+    Implementation of the primal-dual blossom algorithm as described by
+    Galil ("Efficient algorithms for finding maximum matching in graphs",
+    1986) following the structure of Joris van Rantwijk's reference code.
+    Weights must be integers so that all dual updates stay exact.
+
+    With maxcardinality the result is the heaviest of the maximum-cardinality
+    matchings. A caller that expects a perfect matching can also ask for a
+    jump start: vertex duals are then free of sign, so every vertex dual is
+    lowered as far as its edges allow and the tight edges are matched
+    greedily, heaviest first. Each stage augments once and rescans every free
+    vertex, so starting with most vertices matched saves most of the stages.
+    Free vertices no longer share one dual, though, so a result that is not
+    perfect is only maximal in cardinality, not certified heaviest.
+
+    Args:
+        nvertex: Number of vertices, numbered 0..nvertex-1
+        edges: List of (i, j, weight) tuples with i != j
+        maxcardinality: Only accept maximum-cardinality matchings
+        jumpstart: Seed duals and matching greedily (needs maxcardinality;
+            optimal only if the result is a perfect matching)
+
+    Returns:
+        Tuple (mate, dualvar, blossomparent) where mate[v] is the vertex
+        matched to v (or -1), dualvar holds the final vertex duals
+        (indices < nvertex) and blossom duals (indices >= nvertex), and
+        blossomparent describes the final blossom nesting.
+    """
+    nedge = len(edges)
+    if nvertex == 0 or nedge == 0:
+        return [-1] * nvertex, [0] * (2 * nvertex), [-1] * (2 * nvertex)
+
+    maxweight = max(0, max(wt for (_, _, wt) in edges))
+
+    # endpoint[p] is the vertex at endpoint p; edge k has endpoints 2k and 2k+1
+    endpoint = [edges[p // 2][p % 2] for p in range(2 * nedge)]
+
+    # neighbend[v] lists the remote endpoints of the edges attached to v
+    neighbend = [[] for _ in range(nvertex)]
+    for k, (i, j, _) in enumerate(edges):
+        neighbend[i].append(2 * k + 1)
+        neighbend[j].append(2 * k)
+
+    # mate[v] is the remote endpoint of v's matched edge, or -1
+    mate = nvertex * [-1]
+
+    # label: 0 = free, 1 = S-vertex/blossom, 2 = T-vertex/blossom
+    label = (2 * nvertex) * [0]
+    labelend = (2 * nvertex) * [-1]
+
+    inblossom = list(range(nvertex))
+    blossomparent = (2 * nvertex) * [-1]
+    blossomchilds = (2 * nvertex) * [None]
+    blossombase = list(range(nvertex)) + nvertex * [-1]
+    blossomendps = (2 * nvertex) * [None]
+
+    bestedge = (2 * nvertex) * [-1]
+    blossombestedges = (2 * nvertex) * [None]
+    unusedblossoms = list(range(nvertex, 2 * nvertex))
+
+    # Duals: u(v) = maxweight initially, z(b) = 0 for all blossoms
+    dualvar = nvertex * [maxweight] + nvertex * [0]
+    if maxcardinality and jumpstart:
+        # Jump start: each vertex's best edge is a feasible dual, then each
+        # dual drops to the least value its edges allow
+        best = nvertex * [None]
+        for i, j, wt in edges:
+            if best[i] is None or wt > best[i]:
+                best[i] = wt
+            if best[j] is None or wt > best[j]:
+                best[j] = wt
+        dualvar[:nvertex] = [0 if wt is None else wt for wt in best]
+        for v in range(nvertex):
+            if neighbend[v]:
+                dualvar[v] = max(2 * edges[p >> 1][2] - dualvar[endpoint[p]] for p in neighbend[v])
+        for k in sorted(range(nedge), key=lambda k: -edges[k][2]):
+            i, j, wt = edges[k]
+            if mate[i] == -1 and mate[j] == -1 and dualvar[i] + dualvar[j] == 2 * wt:
+                mate[i] = 2 * k + 1
+                mate[j] = 2 * k
+
+    allowedge = nedge * [False]
+    queue = []
+
+    weight2 = [2 * wt for (_, _, wt) in edges]
+    edgefrom = endpoint[0::2]
+    edgeto = endpoint[1::2]
+
+    def slack(k):
+        """Return 2 * slack of edge k (does not work inside blossoms)"""
+        return dualvar[edgefrom[k]] + dualvar[edgeto[k]] - weight2[k]
+
+    def blossom_leaves(b):
+        """Generate the leaf vertices of a blossom"""
+        if b < nvertex:
+            yield b
+        else:
+            for t in blossomchilds[b]:
+                if t < nvertex:
+                    yield t
+                else:
+                    yield from blossom_leaves(t)
+
+    def assign_label(w, t, p):
+        """Assign label t to the top-level blossom containing vertex w"""
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(blossom_leaves(b))
+        elif t == 2:
+            base = blossombase[b]
+            assign_label(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scan_blossom(v, w):
+        """Trace back from v and w to find a new blossom base or an augmenting path"""
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                v = -1
+            else:
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def add_blossom(base, k):
+        """Construct a new blossom with the given base through S-S edge k"""
+        v, w, _ = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+        for v in blossom_leaves(b):
+            if label[inblossom[v]] == 2:
+                queue.append(v)
+            inblossom[v] = b
+
+        # Compute the least-slack edges from the new blossom to each S-blossom
+        bestedgeto = (2 * nvertex) * [-1]
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblists = [[p // 2 for p in neighbend[v]] for v in blossom_leaves(bv)]
+            else:
+                nblists = [blossombestedges[bv]]
+            for nblist in nblists:
+                for k in nblist:
+                    i, j, _ = edges[k]
+                    if inblossom[j] == b:
+                        i, j = j, i
+                    bj = inblossom[j]
+                    if (bj != b and label[bj] == 1 and
+                            (bestedgeto[bj] == -1 or slack(k) < slack(bestedgeto[bj]))):
+                        bestedgeto[bj] = k
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        blossombestedges[b] = [k for k in bestedgeto if k != -1]
+        bestedge[b] = -1
+        for k in blossombestedges[b]:
+            if bestedge[b] == -1 or slack(k) < slack(bestedge[b]):
+                bestedge[b] = k
+
+    def expand_blossom(b, endstage):
+        """Expand blossom b and relabel its sub-blossoms if needed"""
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < nvertex:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                expand_blossom(s, endstage)
+            else:
+                for v in blossom_leaves(s):
+                    inblossom[v] = s
+
+        if not endstage and label[b] == 2:
+            # Relabel the sub-blossoms on the path from the entry child to the base
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                jstep = -1
+                endptrick = 1
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[blossomendps[b][j - endptrick] ^ endptrick ^ 1]] = 0
+                assign_label(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in blossom_leaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    label[v] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    assign_label(v, 2, labelend[v])
+                j += jstep
+
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augment_blossom(b, v):
+        """Swap matched/unmatched edges along the even path from v to the base of b"""
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= nvertex:
+            augment_blossom(t, v)
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep = 1
+            endptrick = 0
+        else:
+            jstep = -1
+            endptrick = 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= nvertex:
+                augment_blossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= nvertex:
+                augment_blossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augment_matching(k):
+        """Augment the matching along the path through S-S edge k"""
+        v, w, _ = edges[k]
+        for s, p in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = inblossom[s]
+                if bs >= nvertex:
+                    augment_blossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= nvertex:
+                    augment_blossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    # Main loop: each stage either augments the matching or proves optimality
+    for _ in range(nvertex):
+        if not maxcardinality and mate.count(-1) <= 1:
+            # Nothing left to augment. A lone free vertex keeps its dual: it is
+            # the smallest vertex dual, so the duals already certify the best
+            # matching that leaves one vertex out
+            break
+
+        label[:] = (2 * nvertex) * [0]
+        bestedge[:] = (2 * nvertex) * [-1]
+        blossombestedges[nvertex:] = nvertex * [None]
+        allowedge[:] = nedge * [False]
+        queue[:] = []
+
+        for v in range(nvertex):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assign_label(v, 1, -1)
+
+        augmented = False
+        while True:
+            while queue and not augmented:
+                v = queue.pop()
+                dv = dualvar[v]
+                bv = inblossom[v]
+                for p in neighbend[v]:
+                    k = p >> 1
+                    w = endpoint[p]
+                    bw = inblossom[w]
+                    if bv == bw:
+                        continue
+                    # slack(k) and the slack of the best edges are inlined: this
+                    # loop dominates the running time
+                    if not allowedge[k]:
+                        kslack = dv + dualvar[w] - weight2[k]
+                        if kslack <= 0:
+                            allowedge[k] = True
+                    if allowedge[k]:
+                        if label[bw] == 0:
+                            assign_label(w, 2, p ^ 1)
+                        elif label[bw] == 1:
+                            base = scan_blossom(v, w)
+                            if base >= 0:
+                                add_blossom(base, k)
+                                bv = inblossom[v]
+                            else:
+                                augment_matching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[bw] == 1:
+                        best = bestedge[bv]
+                        if best == -1 or kslack < dualvar[edgefrom[best]] + dualvar[edgeto[best]] - weight2[best]:
+                            bestedge[bv] = k
+                    elif label[w] == 0:
+                        best = bestedge[w]
+                        if best == -1 or kslack < dualvar[edgefrom[best]] + dualvar[edgeto[best]] - weight2[best]:
+                            bestedge[w] = k
+
+            if augmented:
+                break
+
+            # No augmenting path with tight edges; compute the dual update
+            if maxcardinality:
+                # Vertex duals may go negative: only edges and blossoms bound the update
+                deltatype = -1
+                delta = None
+            else:
+                deltatype = 1
+                delta = min(dualvar[:nvertex])
+            deltaedge = deltablossom = None
+
+            for v, k in enumerate(bestedge[:nvertex]):
+                if k != -1 and label[inblossom[v]] == 0:
+                    d = dualvar[edgefrom[k]] + dualvar[edgeto[k]] - weight2[k]
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 2
+                        deltaedge = k
+
+            for b, k in enumerate(bestedge):
+                if k != -1 and label[b] == 1 and blossomparent[b] == -1:
+                    d = (dualvar[edgefrom[k]] + dualvar[edgeto[k]] - weight2[k]) // 2
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 3
+                        deltaedge = k
+
+            for b in range(nvertex, 2 * nvertex):
+                if (blossombase[b] >= 0 and blossomparent[b] == -1 and label[b] == 2 and
+                        (deltatype == -1 or dualvar[b] < delta)):
+                    delta = dualvar[b]
+                    deltatype = 4
+                    deltablossom = b
+
+            if deltatype == -1:
+                # No tree can grow any further: the cardinality is maximum
+                break
+
+            for v in range(nvertex):
+                vlabel = label[inblossom[v]]
+                if vlabel == 1:
+                    dualvar[v] -= delta
+                elif vlabel == 2:
+                    dualvar[v] += delta
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+
+            if deltatype == 1:
+                # A free vertex reached dual zero: the matching is optimal
+                break
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                i, j, _ = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                i, j, _ = edges[deltaedge]
+                queue.append(i)
+            elif deltatype == 4:
+                expand_blossom(deltablossom, False)
+
+        if not augmented:
+            break
+
+        # End of stage: expand S-blossoms whose dual reached zero
+        for b in range(nvertex, 2 * nvertex):
+            if (blossomparent[b] == -1 and blossombase[b] >= 0 and
+                    label[b] == 1 and dualvar[b] == 0):
+                expand_blossom(b, True)
+
+    for v in range(nvertex):
+        if mate[v] >= 0:
+            mate[v] = endpoint[mate[v]]
+
+    return mate, dualvar, blossomparent
+
+
+class BlossomMatcher:
+    """
+    Optimal roommate matching using Edmonds' blossom algorithm
+
+    Drop-in alternative to AStarMatcher: match_students() returns the same
+    result dictionary, but runs in polynomial time so it scales to whole
+    cohorts instead of hand-picked selections.
+    """
+
+    # Scores carry two decimals; scale them to integers for exact dual updates
+    SCORE_SCALE = 100
+
+    # Weights read per block of rows when scanning the complete graph
+    BLOCK_ENTRIES = 1 << 22
+
+    def __init__(self, similarity_engine=None, candidate_k=None):
+        """Initialize blossom matcher with similarity engine"""
+        self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.candidate_k = candidate_k or Config.BLOSSOM_CANDIDATES
+        self.rounds = 0
+        self.edges_used = 0
+
+    def build_weight_matrix(self, student_vectors, score_matrix=None):
+        """
+        Build the dense integer weight matrix for a list of student vectors
+
+        Returns:
+            Int64 array where weights[i, j] is the scaled compatibility
+            score between students i and j
+        """
+        scores = score_matrix
+        if scores is None:
+            scores = self.similarity_engine.calculate_similarity_matrix(student_vectors)
+        return self.to_weights(scores)
+
+    def to_weights(self, scores):
+        """Scores as scaled integer weights"""
+        return np.rint(scores * self.SCORE_SCALE).astype(np.int64)
+
+    def block_rows(self, n):
+        """Rows per block when scanning the complete graph"""
+        return max(1, self.BLOCK_ENTRIES // max(n, 1))
+
+    def candidate_edges(self, n, weight_rows, labels=None):
+        """
+        Return the set of (i, j) pairs linking each student to its top-K partners
+
+        Args:
+            n: Number of vertices
+            weight_rows: Callable rows -> int64 weights of those rows against every vertex
+            labels: Optional array naming the vertices in the pairs (default: 0..n-1)
+        """
+        k = min(self.candidate_k, n - 1)
+        pairs = set()
+        if k < 1:
+            return pairs
+        step = self.block_rows(n)
+        for start in range(0, n, step):
+            rows = np.arange(start, min(start + step, n))
+            masked = weight_rows(rows)
+            masked[np.arange(len(rows)), rows] = -1
+            best = np.argpartition(-masked, k - 1, axis=1)[:, :k]
+            block_rows = np.repeat(rows, k)
+            cols = best.ravel()
+            if labels is not None:
+                block_rows, cols = labels[block_rows], labels[cols]
+            pairs.update(zip(np.minimum(block_rows, cols).tolist(), np.maximum(block_rows, cols).tolist()))
+        return pairs
+
+    def find_violations(self, n, weight_rows, dualvar, blossomparent):
+        """
+        Check dual feasibility of every pair against the complete graph
+
+        Returns:
+            List of (i, j) pairs whose reduced cost is negative, i.e. edges
+            outside the candidate graph that could still improve the matching
+        """
+        duals = np.array(dualvar[:n], dtype=np.int64)
+
+        # Leaf membership of every blossom that still carries a positive dual
+        members = {}
+        for v in range(n):
+            b = blossomparent[v]
+            while b != -1:
+                if dualvar[b] > 0:
+                    members.setdefault(b, np.zeros(n, dtype=bool))[v] = True
+                b = blossomparent[b]
+
+        violations = []
+        step = self.block_rows(n)
+        for start in range(0, n, step):
+            rows = slice(start, min(start + step, n))
+            slack = duals[rows, None] + duals[None, :] - 2 * weight_rows(rows)
+            for b, mask in members.items():
+                slack += 2 * dualvar[b] * (mask[rows, None] & mask[None, :])
+            i, j = np.nonzero(slack < 0)
+            i += start
+            upper = i < j
+            violations.extend(zip(i[upper].tolist(), j[upper].tolist()))
+        return violations
+
+    def solve(self, weights):
+        """
+        Compute an optimal matching for a dense weight matrix
+
+        Returns:
+            mate list where mate[i] is the index matched to i, or -1
+        """
+        return self.solve_rows(weights.shape[0], lambda rows: weights[rows], lambda i, j: weights[i, j])
+
+    def solve_rows(self, n, weight_rows, weight_pairs):
+        """
+        Compute an optimal matching, reading the weights a block of rows at a time
+
+        Args:
+            n: Number of vertices
+            weight_rows: Callable rows -> int64 weights of those rows against
+                every vertex (rows is an index array or a slice)
+            weight_pairs: Callable (i, j) -> int64 weights of the pairs (i[t], j[t])
+
+        Returns:
+            mate list where mate[i] is the index matched to i, or -1
+        """
+        self.rounds = 0
+        pairs = self.candidate_edges(n, weight_rows)
+
+        # Scores are nonnegative, so some optimal matching pairs everyone (but
+        # one): solve for the best perfect matching, which lets the solver
+        # jump start. An odd cohort gets a dummy vertex scoring 0 with
+        # everyone; whoever it takes is the student left out.
+        dummy = [(v, n, 0) for v in range(n)] if n % 2 else []
+        size = n + len(dummy)
+
+        while True:
+            self.rounds += 1
+            ends = np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+            edges = list(zip(ends[:, 0].tolist(), ends[:, 1].tolist(),
+                             weight_pairs(ends[:, 0], ends[:, 1]).tolist())) + dummy
+            self.edges_used = len(edges)
+            mate, dualvar, blossomparent = max_weight_matching(size, edges, maxcardinality=True, jumpstart=True)
+
+            free = np.flatnonzero(np.array(mate[:n]) == -1)
+            if len(free):
+                # The candidate graph has no perfect matching: link the free students too
+                pairs.update(self.candidate_edges(len(free), lambda rows: weight_rows(free[rows])[:, free],
+                                                  free))
+                continue
+
+            violations = self.find_violations(n, weight_rows, dualvar, blossomparent)
+            if not violations:
+                break
+            pairs.update(violations)
+
+        return [-1 if v == n else v for v in mate[:n]]
+
+    def match_students(self, student_vectors, score_matrix=None, scores=None):
+        """
+        Main method to match students using the blossom algorithm
+
+        Args:
+            student_vectors: List of student vector dictionaries
+            score_matrix: Optional precomputed score matrix aligned with student_vectors
+            scores: Optional row-block view of the cohort's scores (see
+                SimilarityStore.cohort), read block by block instead of
+                building the n x n matrix
+
+        Returns:
+            Dictionary with matches and statistics
+        """
+        if len(student_vectors) < 2:
+            return {
+                'matches': [],
+                'total_score': 0.0,
+                'average_score': 0.0,
+                'rounds': 0,
+                'unmatched': [s['id'] for s in student_vectors],
+                'alternatives': {}
+            }
+
+        if scores is None:
+            weights = self.build_weight_matrix(student_vectors, score_matrix)
+            weight_rows, weight_pairs = (lambda rows: weights[rows]), (lambda i, j: weights[i, j])
+        else:
+            weight_rows = lambda rows: self.to_weights(scores.block(rows))
+            weight_pairs = lambda i, j: self.to_weights(scores.pair_scores(i, j))
+        mate = np.array(self.solve_rows(len(student_vectors), weight_rows, weight_pairs), dtype=np.int64)
+
+        first = np.flatnonzero(mate > np.arange(len(mate)))
+        pair_scores = (weight_pairs(first, mate[first]) / self.SCORE_SCALE).tolist()
+        matched_pairs = [(student_vectors[i]['id'], student_vectors[j]['id'], score)
+                         for i, j, score in zip(first.tolist(), mate[first].tolist(), pair_scores)]
+        unmatched_students = [student_vectors[i]['id'] for i in np.flatnonzero(mate < 0).tolist()]
+
+        # Only the selected pairs need reasons
+        matched_pairs = self.similarity_engine.attach_reasons(matched_pairs, student_vectors)
+
+        total_score = sum(pair[2] for pair in matched_pairs)
+        average_score = total_score / len(matched_pairs) if matched_pairs else 0.0
+
+        return {
+            'matches': matched_pairs,
+            'total_score': round(total_score, 2),
+            'average_score': round(average_score, 2),
+            'rounds': self.rounds,
+            'edges_used': self.edges_used,
+            'unmatched': unmatched_students,
+            'alternatives': self.similarity_engine.unmatched_alternatives(
+                unmatched_students, student_vectors, matched_pairs,
+                lambda rows: weight_rows(rows) / self.SCORE_SCALE)
+        }
@@ -0,0 +1,353 @@
+"""
+Candidate Index Module
+Top-K nearest-roommate lookup without scoring every student
+
+The five ordinal features have tiny domains (at most 3 x 4 x 5 x 5 x 3 = 900
+combinations), so students are bucketed by their ordinal lattice cell. Every
+student in a cell has the same ordinal distance to the query; only the hobby
+overlap differs, and the score is non-decreasing in the overlap. A cell's
+best possible score is therefore its score at overlap 1.0. Cells are visited
+in order of that bound and the search stops as soon as no remaining cell can
+beat the current K-th candidate. Inside a cell an inverted hobby index finds
+the students sharing a hobby with the query; everyone else in the cell has
+the same overlap and therefore the same score.
+"""
+import heapq
+import numpy as np
+
+from similarity_engine import SimilarityEngine, ORDINAL_FEATURES
+
+
+class CandidateIndex:
+    """In-memory index answering "best K roommates for this student" queries"""
+
+    # With constraints, candidates fetched per kept candidate (forbidden ones are dropped)
+    OVERSAMPLE = 4
+
+    def __init__(self, similarity_engine=None):
+        """Initialize an empty index"""
+        self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.clear()
+
+    def clear(self):
+        """Remove every student from the index"""
+        self.cells = {}  # lattice key -> {'members', 'hobby_index', 'no_hobbies'}
+        self.vectors = {}  # student id -> student vector
+        self._bounds = {}  # query lattice key -> cells sorted by upper bound
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def __contains__(self, student_id):
+        return student_id in self.vectors
+
+    @staticmethod
+    def cell_key(student_vector):
+        """Ordinal lattice cell of a student"""
+        return tuple(student_vector[name] for name, _ in ORDINAL_FEATURES)
+
+    def build(self, student_vectors):
+        """Rebuild the index from a list of student vectors"""
+        self.clear()
+        for vector in student_vectors:
+            self.add(vector)
+
+    def add(self, student_vector):
+        """Insert (or replace) a single student"""
+        student_id = student_vector['id']
+        if student_id in self.vectors:
+            self.remove(student_id)
+
+        hobbies = frozenset(student_vector['hobbies'])
+        key = self.cell_key(student_vector)
+        if key not in self.cells:
+            self._bounds.clear()
+        cell = self.cells.setdefault(key, {
+            'members': {},
+            'hobby_index': {},
+            'no_hobbies': set()
+        })
+        cell['members'][student_id] = hobbies
+        for hobby in hobbies:
+            cell['hobby_index'].setdefault(hobby, set()).add(student_id)
+        if not hobbies:
+            cell['no_hobbies'].add(student_id)
+        self.vectors[student_id] = student_vector
+
+    def remove(self, student_id):
+        """Remove a single student if present"""
+        vector = self.vectors.pop(student_id, None)
+        if vector is None:
+            return
+        key = self.cell_key(vector)
+        cell = self.cells[key]
+        hobbies = cell['members'].pop(student_id)
+        for hobby in hobbies:
+            cell['hobby_index'][hobby].discard(student_id)
+        cell['no_hobbies'].discard(student_id)
+        if not cell['members']:
+            del self.cells[key]
+            self._bounds.clear()
+
+    def cell_bounds(self, student_vector):
+        """
+        Cells sorted by the best score they can offer a query student
+
+        Depends only on the query's lattice cell, so it is memoized per cell.
+
+        Returns:
+            List of (-upper_bound, cell_key, ordinal_distance) tuples
+        """
+        query_key = self.cell_key(student_vector)
+        bounds = self._bounds.get(query_key)
+        if bounds is None:
+            engine = self.similarity_engine
+            bounds = []
+            for key in self.cells:
+                cell_vector = dict(zip((name for name, _ in ORDINAL_FEATURES), key))
+                distance = engine.calculate_ordinal_distance(student_vector, cell_vector)
+                bounds.append((-engine.score_from_parts(distance, 1.0), key, distance))
+            bounds.sort()
+            self._bounds[query_key] = bounds
+        return bounds
+
+    def query(self, student_vector, k=10):
+        """
+        Find the K most compatible students for a student
+
+        Args:
+            student_vector: Student vector dictionary of the query student
+            k: Number of candidates to return
+
+        Returns:
+            List of (student_id, score) tuples, best first; ties are broken
+            by ascending student id
+        """
+        engine = self.similarity_engine
+        query_id = student_vector['id']
+        query_hobbies = student_vector['hobbies']
+        query_set = set(query_hobbies)
+
+        # Upper bound per cell: the score at full hobby overlap
+        bounds = self.cell_bounds(student_vector)
+
+        # Min-heap of (score, -id): heap[0] is the current K-th candidate
+        best = []
+
+        def offer(score, student_id):
+            item = (score, -student_id)
+            if len(best) < k:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+
+        for neg_bound, key, distance in bounds:
+            if len(best) == k and -neg_bound < best[0][0]:
+                break
+            cell = self.cells[key]
+            members = cell['members']
+
+            # Students sharing at least one hobby get an exact overlap
+            sharing = set()
+            for hobby in query_set:
+                sharing.update(cell['hobby_index'].get(hobby, ()))
+            sharing.discard(query_id)
+            for student_id in sharing:
+                overlap = engine.calculate_hobby_overlap(query_hobbies, members[student_id])
+                offer(engine.score_from_parts(distance, overlap), student_id)
+
+            # Everyone else in the cell shares the same overlap, hence the same score
+            if query_set:
+                groups = ((0.0, members.keys() - sharing),)
+            else:
+                groups = ((0.5, cell['no_hobbies']), (0.0, members.keys() - cell['no_hobbies']))
+            for overlap, student_ids in groups:
+                score = engine.score_from_parts(distance, overlap)
+                if len(best) == k and score < best[0][0]:
+                    continue
+                for student_id in student_ids:
+                    if student_id != query_id:
+                        offer(score, student_id)
+
+        return [(-neg_id, score) for score, neg_id in sorted(best, reverse=True)]
+
+    def allowed_query(self, student_vector, k=10, constraints=None):
+        """
+        Find the K most compatible students a student may be paired with
+
+        OVERSAMPLE times as many candidates are fetched and the forbidden
+        ones dropped; the fetch grows until K allowed candidates are found or
+        the index runs out, so students with many forbidden neighbours still
+        get K suggestions.
+
+        Args:
+            student_vector: Student vector dictionary of the query student
+            k: Number of candidates to return
+            constraints: Optional MatchConstraints the candidates must satisfy
+
+        Returns:
+            List of (student_id, score) tuples, best first
+        """
+        if constraints is None or not constraints.active:
+            return self.query(student_vector, k)
+        fetch = k * self.OVERSAMPLE
+        while True:
+            found = self.query(student_vector, fetch)
+            kept = [(student_id, score) for student_id, score in found
+                    if constraints.allowed(student_vector, self.vectors[student_id])]
+            if len(kept) >= k or len(found) < fetch:
+                return kept[:k]
+            fetch *= self.OVERSAMPLE
+
+    def candidates(self, student_vector, k=10, constraints=None):
+        """
+        Top-K candidates with reasons, ready for display
+
+        Args:
+            student_vector: Student vector dictionary of the query student
+            k: Number of candidates to return
+            constraints: Optional MatchConstraints; forbidden roommates are never suggested
+
+        Returns:
+            List of dicts with id, name, score and reasons
+        """
+        results = []
+        for student_id, score in self.allowed_query(student_vector, k, constraints):
+            other = self.vectors[student_id]
+            results.append({
+                'id': student_id,
+                'name': other['name'],
+                'score': score,
+                'reasons': self.similarity_engine.generate_match_reasons(student_vector, other)
+            })
+        return results
+
+
+def top_k_candidates(similarity_engine, encoded, k, block_columns=512):
+    """
+    Exact top-K partners of every student of an encoded cohort
+
+    The batch form of CandidateIndex.query. Students are grouped by lattice
+    cell and hobby count: the overlap of two hobby sets is at most
+    min(a, b) / max(a, b) of their sizes, so the score of a group pair at
+    that overlap bounds every pair in it. The students of one group are
+    scored together against the groups with the highest bounds, and groups
+    are added until none left can beat a row's K-th candidate (rows drop out
+    as soon as their own list is final). Only those blocks are scored, so
+    the cost grows with n times the candidates actually examined rather than
+    with n^2.
+
+    Args:
+        similarity_engine: SimilarityEngine providing weights and scoring
+        encoded: Output of SimilarityEngine.encode_students (or FeatureStore.load_encoded)
+        k: Candidates per student
+        block_columns: Minimum columns scored per block
+
+    Returns:
+        (indices, scores): int64 and float64 arrays of shape (n, k), best
+        first; rows with fewer than k other students are padded with -1
+        and -inf
+    """
+    n = len(encoded['ids'])
+    k = max(int(k), 1)
+    indices = np.full((n, k), -1, dtype=np.int64)
+    scores = np.full((n, k), -np.inf)
+    if n < 2:
+        return indices, scores
+
+    # Ordinal distance between lattice cells, accumulated exactly like calculate_similarity_block
+    cells, cell_of = np.unique(encoded['ordinals'], axis=0, return_inverse=True)
+    cell_of = cell_of.ravel()
+    cell_distance = np.zeros((len(cells), len(cells)), dtype=np.float64)
+    for f, (name, scale) in enumerate(ORDINAL_FEATURES):
+        diff = np.abs(cells[:, None, f] - cells[None, :, f]) / scale
+        cell_distance += similarity_engine.weights[name] * diff
+
+    # Group students by (cell, hobby count)
+    counts = encoded['hobby_counts']
+    group_keys, group_of = np.unique(np.stack([cell_of, counts], axis=1), axis=0, return_inverse=True)
+    group_of = group_of.ravel()
+    group_cell, group_count = group_keys[:, 0], group_keys[:, 1]
+    order = np.argsort(group_of, kind='stable')
+    starts = np.searchsorted(group_of[order], np.arange(len(group_keys) + 1))
+
+    # Groups (about 8 blocks' worth) ranked per row group before falling back to sorting all of them
+    sizes = np.diff(starts)
+    prefix = min(len(group_keys), max(64, 8 * block_columns * len(group_keys) // n))
+
+    for first in range(0, len(group_keys), 64):
+        # Best score any member of each group can reach with the members of groups first..first+63
+        chunk = np.arange(first, min(first + 64, len(group_keys)))
+        chunk_bounds = similarity_engine.combine_scores(
+            cell_distance[group_cell[chunk][:, None], group_cell[None, :]],
+            np.minimum(group_count[chunk][:, None], group_count[None, :]),
+            group_count[chunk][:, None], group_count[None, :]
+        )
+        chunk_visits = np.argpartition(-chunk_bounds, prefix - 1, axis=1)[:, :prefix]
+
+        for g, bounds, visit in zip(chunk, chunk_bounds, chunk_visits):
+            rows = order[starts[g]:starts[g + 1]]
+            visit = visit[np.argsort(-bounds[visit], kind='stable')]
+            best_idx, best = _scan_groups(similarity_engine, encoded, rows, k, bounds, visit, order,
+                                          starts, sizes, cell_distance, cell_of, block_columns)
+            best_idx[best == -np.inf] = -1
+            indices[rows] = best_idx
+            scores[rows] = best
+    return indices, scores
+
+
+def _scan_groups(similarity_engine, encoded, rows, k, bounds, visit, order, starts, sizes,
+                 cell_distance, cell_of, block_columns):
+    """Top-K of rows, scoring column groups in order of their bound (see top_k_candidates)"""
+    counts = encoded['hobby_counts']
+    hobbies = encoded['hobbies']
+    best_idx = np.full((len(rows), k), -1, dtype=np.int64)
+    best = np.full((len(rows), k), -np.inf)
+    complete = len(visit) == len(bounds)
+    pos = 0
+    while True:
+        if pos == len(visit):
+            if complete:
+                break
+            # Every group of the partial order was scored: append the others, best first
+            rest = np.ones(len(bounds), dtype=bool)
+            rest[visit] = False
+            rest = np.nonzero(rest)[0]
+            visit = np.concatenate([visit, rest[np.argsort(-bounds[rest], kind='stable')]])
+            complete = True
+        descending = -bounds[visit]  # Ascending, for searchsorted
+        ends = np.cumsum(sizes[visit])  # Columns covered up to each visited group
+
+        while pos < len(visit):
+            # Rows whose K-th score already reaches the next group's bound are final
+            active = np.nonzero(best[:, -1] < -descending[pos])[0]
+            if not len(active):
+                return best_idx, best
+
+            # Next groups that can still beat some row's K-th score, about block_columns columns
+            kth = best[active, -1].min()
+            limit = np.searchsorted(descending, -kth, side='left')
+            covered = ends[pos - 1] if pos else 0
+            stop = min(np.searchsorted(ends, covered + block_columns, side='left') + 1, limit)
+            selected = visit[pos:stop]
+            pos = stop
+            lengths = sizes[selected]
+            offsets = np.repeat(starts[selected] - (np.cumsum(lengths) - lengths), lengths)
+            cols = order[offsets + np.arange(lengths.sum())]
+            active_rows = rows[active]
+
+            block = similarity_engine.combine_scores(
+                cell_distance[cell_of[active_rows][:, None], cell_of[cols][None, :]],
+                (hobbies[active_rows] @ hobbies[cols].T).astype(np.int64),
+                counts[active_rows][:, None], counts[cols][None, :]
+            )
+            block[active_rows[:, None] == cols[None, :]] = -np.inf
+
+            merged = np.concatenate([best[active], block], axis=1)
+            merged_idx = np.concatenate([best_idx[active], np.broadcast_to(cols, block.shape)], axis=1)
+            top = np.argpartition(-merged, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(merged, top, axis=1)
+            ranked = np.argsort(-top_scores, axis=1, kind='stable')
+            best[active] = np.take_along_axis(top_scores, ranked, axis=1)
+            best_idx[active] = np.take_along_axis(np.take_along_axis(merged_idx, top, axis=1), ranked, axis=1)
+    return best_idx, best
@@ -0,0 +1,174 @@
+"""
+Compatibility Cache Module
+Persistent, incrementally maintained pairwise score matrix
+
+Scores are stored in SQLite next to the students table, one row per student
+holding that student's scores against every student with a smaller id. This
+keeps every pair exactly once, lets a registration add its O(n) row without
+touching the rest, and lets a student deletion evict its row through the ORM
+cascade. Rows carry a fingerprint of the scoring weights; changing
+Config.WEIGHTS invalidates the cache and triggers a full (vectorized) rebuild.
+Features are read through the FeatureStore, one query straight into arrays.
+"""
+from config import Config
+import hashlib
+import json
+import threading
+import numpy as np
+
+from models import db, Student, CompatibilityRow
+from similarity_engine import SimilarityEngine
+from feature_store import FeatureStore
+
+
+class CompatibilityCache:
+    """Read and maintain the cached compatibility matrix"""
+
+    # Scores carry two decimals and are stored as hundredths
+    SCORE_SCALE = 100
+
+    # Bump when the storage layout or the scoring formula changes
+    FORMAT_VERSION = 1
+
+    # Stay well below SQLite's bound-parameter limit in IN queries
+    QUERY_CHUNK = 900
+
+    def __init__(self, similarity_engine=None, feature_store=None):
+        """Initialize cache with similarity engine and feature store"""
+        self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.feature_store = feature_store or FeatureStore()
+
+        # Background matching jobs and registrations may sync concurrently
+        self._lock = threading.RLock()
+
+    @property
+    def version(self):
+        """Fingerprint of everything the cached scores depend on"""
+        payload = json.dumps({
+            'format': self.FORMAT_VERSION,
+            'weights': self.similarity_engine.weights,
+            'bonus': Config.HOBBY_OVERLAP_BONUS
+        }, sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def _make_row(self, student_id, partner_ids, scores):
+        """Pack a score row into a CompatibilityRow mapping"""
+        return {
+            'student_id': int(student_id),
+            'version': self.version,
+            'partner_ids': np.asarray(partner_ids, dtype=np.int64).tobytes(),
+            'scores': np.rint(np.asarray(scores) * self.SCORE_SCALE).astype(np.uint16).tobytes()
+        }
+
+    def add_student(self, student):
+        """
+        Compute and store the row for a newly registered student (O(n))
+
+        Only the students the row holds (smaller ids) are loaded and scored.
+        A stale cache is left alone; sync() rebuilds it at match time.
+
+        Args:
+            student: Student instance that has already been committed
+        """
+        with self._lock:
+            if self.is_stale():
+                return
+
+            partner_ids = [sid for (sid,) in db.session.query(Student.id).filter(
+                Student.id < student.id).order_by(Student.id)]
+            encoded = self.feature_store.load_encoded(partner_ids + [student.id])
+            row = len(partner_ids)
+            scores = self.similarity_engine.calculate_similarity_block(
+                encoded, slice(row, row + 1), slice(0, row)
+            )[0]
+
+            db.session.merge(CompatibilityRow(**self._make_row(student.id, partner_ids, scores)))
+            db.session.commit()
+
+    def clear(self):
+        """Drop every cached row"""
+        CompatibilityRow.query.delete()
+        db.session.commit()
+
+    def is_stale(self):
+        """Check whether any cached row was computed with different weights"""
+        return db.session.query(
+            CompatibilityRow.query.filter(CompatibilityRow.version != self.version).exists()
+        ).scalar()
+
+    def rebuild(self):
+        """Recompute the whole cache with the current weights"""
+        with self._lock:
+            CompatibilityRow.query.delete()
+            encoded = self.feature_store.load_encoded()
+            self._store_rows(encoded, range(len(encoded['ids'])))
+            db.session.commit()
+
+    def _store_rows(self, encoded, positions, block_size=512):
+        """Score and insert the rows at the given positions of an id-ordered encoded cohort"""
+        ids = encoded['ids']
+        positions = list(positions)
+        for start in range(0, len(positions), block_size):
+            chunk = positions[start:start + block_size]
+            block = self.similarity_engine.calculate_similarity_block(encoded, chunk)
+            rows = [self._make_row(ids[p], ids[:p], block[k, :p]) for k, p in enumerate(chunk)]
+            db.session.execute(CompatibilityRow.__table__.insert(), rows)
+
+    def sync(self):
+        """
+        Bring the cache up to date with the students table
+
+        Rebuilds everything if the weights changed; otherwise only scores
+        students that have no cached row yet.
+        """
+        with self._lock:
+            if self.is_stale():
+                self.rebuild()
+                return
+
+            cached = {sid for (sid,) in db.session.query(CompatibilityRow.student_id)}
+            student_ids = [sid for (sid,) in db.session.query(Student.id).order_by(Student.id)]
+            missing = [p for p, sid in enumerate(student_ids) if sid not in cached]
+            if missing:
+                self._store_rows(self.feature_store.load_encoded(), missing)
+                db.session.commit()
+
+    def get_score_matrix(self, student_vectors):
+        """
+        Assemble the n x n score matrix for a selection from cached rows
+
+        Args:
+            student_vectors: List of student vector dictionaries
+
+        Returns:
+            Float64 array aligned with student_vectors (diagonal is zero),
+            bit-identical to SimilarityEngine.calculate_similarity_matrix
+        """
+        self.sync()
+
+        ids = np.array([s['id'] for s in student_vectors], dtype=np.int64)
+        n = len(ids)
+        order = np.argsort(ids)
+        sorted_ids = ids[order]
+
+        centi = np.zeros((n, n), dtype=np.int64)
+        id_list = ids.tolist()
+        for start in range(0, n, self.QUERY_CHUNK):
+            chunk = id_list[start:start + self.QUERY_CHUNK]
+            rows = db.session.query(
+                CompatibilityRow.student_id, CompatibilityRow.partner_ids, CompatibilityRow.scores
+            ).filter(CompatibilityRow.student_id.in_(chunk))
+            for student_id, partner_blob, score_blob in rows:
+                partners = np.frombuffer(partner_blob, dtype=np.int64)
+                scores = np.frombuffer(score_blob, dtype=np.uint16)
+
+                # Keep only partners that are part of this selection
+                pos = np.searchsorted(sorted_ids, partners)
+                pos[pos == n] = 0
+                selected = sorted_ids[pos] == partners
+                i = order[np.searchsorted(sorted_ids, student_id)]
+                j = order[pos[selected]]
+                centi[i, j] = scores[selected]
+                centi[j, i] = scores[selected]
+
+        return centi / float(self.SCORE_SCALE)
@@ -15,6 +15,20 @@ class Config:
     # Disable modification tracking to save resources
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Report the number of SQL statements per request in an X-Query-Count header
+    QUERY_COUNT_HEADER = os.environ.get('QUERY_COUNT_HEADER', '').lower() in ('1', 'true', 'yes')
+    
+    # Matching run instrumentation: /metrics (Prometheus), JSON logs and cProfile dumps
+    METRICS_ENABLED = True
+    # /metrics requires 'Authorization: Bearer <METRICS_TOKEN>' or a peer address listed in
+    # METRICS_ALLOWED_ADDRESSES (comma-separated); with neither configured it is closed
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_ADDRESSES = tuple(
+        address.strip() for address in os.environ.get('METRICS_ALLOWED_ADDRESSES', '').split(',') if address.strip()
+    )
+    MATCH_STRUCTURED_LOGS = os.environ.get('MATCH_STRUCTURED_LOGS', '1').lower() in ('1', 'true', 'yes')
+    MATCH_PROFILE_DIR = os.environ.get('MATCH_PROFILE_DIR')  # Unset disables profiling
+    
     # Similarity calculation weights (must sum to 1.0)
     WEIGHTS = {
         'sleep_time': 0.25,
@@ -30,4 +44,79 @@ class Config:
     
     # A* Search Algorithm Parameters
     ASTAR_MAX_NODES = 10000  # Maximum nodes to explore (prevent infinite loops)
+    ASTAR_TIME_LIMIT = 10.0  # Wall-clock limit in seconds (0 disables it)
+    ASTAR_BEAM_WIDTH = 0  # Keep only this many open states (0 = exact A*)
+    ASTAR_HEURISTIC = 'assignment'  # Bound: 'best_partner', 'dual' or 'assignment'
+    ASTAR_DUAL_PASSES = 2  # Coordinate-descent passes of the 'dual' heuristic
+    ASTAR_PROGRESS_INTERVAL = 1000  # Report search progress every N nodes
     ASTAR_ENABLED = True  # Enable A* search algorithm
+    
+    # Pairwise Scoring Parameters
+    SCORING_WORKERS = 1  # Processes for the score matrix (1 = serial, 0 = one per CPU core)
+    SCORING_PARALLEL_THRESHOLD = 4000  # Smaller cohorts are always scored serially
+    SCORING_TILE_SIZE = 1024  # Edge length of the tiles handed to each worker
+    
+    # Background Matching Jobs
+    MATCH_JOB_WORKERS = 2  # Matching runs executed concurrently
+    MATCH_JOB_HISTORY = 100  # Finished jobs kept in memory for polling
+    
+    # Bulk Student Import
+    IMPORT_BATCH_SIZE = 500  # Students inserted per transaction
+    IMPORT_MAX_ERRORS = 100  # Row errors listed in an import report
+    
+    # Best alternative partners reported for each unmatched student
+    UNMATCHED_ALTERNATIVES = 3
+    
+    # Rendered home, students, results and profile pages (see response_cache.py)
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_SIZE = 256  # Pages kept at most (least recently used are evicted)
+    RESPONSE_CACHE_TTL = 60.0  # Seconds a page stays valid; bounds staleness after writes by other processes
+    
+    # Rows per page on the students, match and results pages
+    PAGE_SIZE = 50
+    
+    # Matching runs listed on the results page for comparison
+    RESULTS_RUN_HISTORY = 10
+    
+    # Hard Matching Constraints (see constraints.py); blocks no allowed pair crosses are matched separately
+    MATCH_SAME_GENDER = os.environ.get('MATCH_SAME_GENDER', '').lower() in ('1', 'true', 'yes')
+    MATCH_MAX_AGE_GAP = int(os.environ['MATCH_MAX_AGE_GAP']) if os.environ.get('MATCH_MAX_AGE_GAP') else None
+    MATCH_BLOCK_WORKERS = 0  # Processes matching blocks concurrently (1 = serial, 0 = one per CPU core)
+    MATCH_BLOCK_PARALLEL_THRESHOLD = 500  # Smaller cohorts always match their blocks serially
+    
+    # Greedy + 2-opt Local Search Matcher Parameters
+    LOCAL_SEARCH_CANDIDATES = 10  # Top-K partners per student considered by greedy and 2-opt
+    LOCAL_SEARCH_TIME_LIMIT = 5.0  # 2-opt time budget in seconds (0 disables it)
+    LOCAL_SEARCH_MAX_PASSES = 50  # 2-opt passes at most
+    LOCAL_SEARCH_DENSE_BOUND_MAX = 200  # Up to this size the bound uses ASTAR_HEURISTIC on the full matrix
+    
+    # Group Matcher Parameters (rooms of three or more, see group_matcher.py)
+    GROUP_ROOM_SIZES = (4, 3)  # Room sizes combined when no room mix is given
+    GROUP_RESTARTS = 4  # Seeded greedy + swap search restarts; the best one wins
+    GROUP_WORKERS = 0  # Processes running restarts (1 = serial, 0 = one per CPU core)
+    GROUP_PARALLEL_THRESHOLD = 500  # Smaller cohorts always run their restarts serially
+    GROUP_TIME_LIMIT = 20.0  # Swap search time budget per restart in seconds (0 disables it)
+    GROUP_MAX_PASSES = 500  # Swap passes per restart at most
+    GROUP_TARGET_ROOMS = 8  # Rooms per student searched by the cheap swap passes
+    GROUP_SEED = 0  # Random seed of the first restart
+    
+    # Stable Roommates Matcher Parameters (see stable_roommates.py)
+    STABLE_CANDIDATES = 10  # Top-K partners in each student's own preference list
+    STABLE_FULL_CHECK_MAX = 5000  # Up to this size blocking pairs are searched among all pairs, not just the lists
+    
+    # Incremental Re-matching Parameters (see incremental_matcher.py)
+    INCREMENTAL_CANDIDATES = 5  # Best partners per free student pulled into the repair region
+    INCREMENTAL_KEEP_BONUS = 10.0  # Extra score of an existing pair: it is only broken for a gain above 10 points
+    
+    # Memory-mapped Similarity Store (see similarity_store.py); unset keeps scores in the SQLite cache
+    SIMILARITY_STORE_PATH = os.environ.get('SIMILARITY_STORE_PATH')
+    SIMILARITY_STORE_DTYPE = os.environ.get('SIMILARITY_STORE_DTYPE', 'float32')  # 'float32' (exact) or 'uint8' (whole points)
+    SIMILARITY_STORE_DENSE_MAX = 5000  # Larger blossom runs read the store in row blocks instead of an n x n matrix
+    
+    # Blossom Matcher Parameters
+    BLOSSOM_CANDIDATES = 30  # Top-K partners per student in the initial sparse graph
+    
+    # Top-K Candidate Index Parameters
+    CANDIDATE_DEFAULT_K = 10  # Candidates returned when ?k= is not given
+    CANDIDATE_MAX_K = 100  # Upper limit for ?k=
+    CANDIDATE_PROFILE_K = 5  # Candidates shown on the profile page
@@ -0,0 +1,161 @@
+"""
+Constraints Module
+Hard matching constraints: pairs of students that may never be roommates
+
+Two rules are supported, both configured in Config:
+
+    - MATCH_SAME_GENDER: only students of the same gender are paired
+    - MATCH_MAX_AGE_GAP: students whose ages differ by more than this many
+      years are not paired
+
+Rather than scoring forbidden pairs and filtering them afterwards, the
+cohort is split into independent blocks that no allowed pair crosses: one
+block per gender, further cut wherever the age-sorted students of a gender
+have a gap wider than MATCH_MAX_AGE_GAP. Scores are only ever computed
+inside a block, so B blocks shrink the pair space (and the exponential A*
+search) by roughly a factor of B. Inside a block the age rule can still
+forbid the youngest and oldest students of a long age chain; those pairs are
+reported by forbidden_mask and excluded by the matchers.
+"""
+from config import Config
+import numpy as np
+
+
+class MatchConstraints:
+    """Which pairs of students may be matched"""
+
+    def __init__(self, same_gender=None, max_age_gap=None):
+        """
+        Initialize the constraints
+
+        Args:
+            same_gender: Only pair students of the same gender (default: Config.MATCH_SAME_GENDER)
+            max_age_gap: Largest allowed age difference in years, None for no limit
+                (default: Config.MATCH_MAX_AGE_GAP)
+        """
+        self.same_gender = Config.MATCH_SAME_GENDER if same_gender is None else same_gender
+        self.max_age_gap = Config.MATCH_MAX_AGE_GAP if max_age_gap is None else max_age_gap
+
+    @property
+    def active(self):
+        """Whether any pair can be forbidden at all"""
+        return bool(self.same_gender) or self.max_age_gap is not None
+
+    def to_dict(self):
+        return {'same_gender': bool(self.same_gender), 'max_age_gap': self.max_age_gap}
+
+    def describe(self):
+        """Human-readable list of the active rules"""
+        rules = []
+        if self.same_gender:
+            rules.append('same gender only')
+        if self.max_age_gap is not None:
+            rules.append(f'age gap of at most {self.max_age_gap} years')
+        return ', '.join(rules)
+
+    def violation(self, student1_vector, student2_vector):
+        """
+        Reason two students may not be paired
+
+        Returns:
+            A short explanation, or None if the pair is allowed
+        """
+        if self.same_gender and student1_vector['gender'] != student2_vector['gender']:
+            return 'different genders'
+        if self.max_age_gap is not None:
+            gap = abs(student1_vector['age'] - student2_vector['age'])
+            if gap > self.max_age_gap:
+                return f'age gap of {gap} years (at most {self.max_age_gap} allowed)'
+        return None
+
+    def allowed(self, student1_vector, student2_vector):
+        """Check whether two students may be paired"""
+        return self.violation(student1_vector, student2_vector) is None
+
+    def partition(self, student_vectors):
+        """
+        Split a cohort into blocks that no allowed pair crosses
+
+        Students of different genders (with MATCH_SAME_GENDER) and students
+        separated by an age gap wider than MATCH_MAX_AGE_GAP, with nobody in
+        between, end up in different blocks.
+
+        Returns:
+            List of blocks, each a list of positions into student_vectors in
+            selection order; blocks are ordered by gender, then age
+        """
+        groups = {}
+        for position, student in enumerate(student_vectors):
+            key = student['gender'] if self.same_gender else None
+            groups.setdefault(key, []).append(position)
+
+        blocks = []
+        for key in sorted(groups, key=str):
+            positions = groups[key]
+            if self.max_age_gap is None:
+                blocks.append(positions)
+                continue
+
+            # Cut the age-sorted students wherever consecutive ages are too far apart
+            ordered = sorted(positions, key=lambda p: student_vectors[p]['age'])
+            block = [ordered[0]]
+            for previous, position in zip(ordered, ordered[1:]):
+                if student_vectors[position]['age'] - student_vectors[previous]['age'] > self.max_age_gap:
+                    blocks.append(sorted(block))
+                    block = []
+                block.append(position)
+            blocks.append(sorted(block))
+        return blocks
+
+    def allowed_mask(self, student_vectors, rows, cols):
+        """
+        Vectorized allowed-pair test across a whole cohort (any rule)
+
+        Args:
+            student_vectors: Student vectors of the cohort
+            rows: Index array of cohort positions
+            cols: Index array of cohort positions
+
+        Returns:
+            Boolean len(rows) x len(cols) array, True where a pair is allowed
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        allowed = np.ones((len(rows), len(cols)), dtype=bool)
+        if self.same_gender:
+            genders = np.array([s['gender'] for s in student_vectors], dtype=object)
+            allowed &= genders[rows, None] == genders[None, cols]
+        if self.max_age_gap is not None:
+            ages = np.array([s['age'] for s in student_vectors], dtype=np.int64)
+            allowed &= np.abs(ages[rows, None] - ages[None, cols]) <= self.max_age_gap
+        return allowed
+
+    def forbidden_mask(self, student_vectors):
+        """
+        Forbidden pairs inside one block
+
+        Returns:
+            Boolean n x n array (True where a pair may not be matched), or
+            None if every pair of the block is allowed
+        """
+        allowed = self.pair_filter(student_vectors)
+        if allowed is None:
+            return None
+        positions = np.arange(len(student_vectors))
+        return ~allowed(positions[:, None], positions[None, :])
+
+    def pair_filter(self, student_vectors):
+        """
+        Vectorized allowed-pair test for positions within one block
+
+        Returns:
+            Callable (rows, cols) -> boolean array, or None if every pair of
+            the block is allowed
+        """
+        if self.max_age_gap is None or len(student_vectors) < 2:
+            return None
+        ages = np.array([s['age'] for s in student_vectors], dtype=np.int64)
+        if ages.max() - ages.min() <= self.max_age_gap:
+            return None
+        max_age_gap = self.max_age_gap
+        return lambda rows, cols: np.abs(ages[rows] - ages[cols]) <= max_age_gap
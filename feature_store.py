@@ -0,0 +1,171 @@
+"""
+Feature Store Module
+Write-time normalization of student features and bulk loading into arrays
+
+Student.hobbies is free text, so every read used to re-split and lowercase
+it and the engine rebuilt hobby sets from the result. Instead, each student
+is normalized once when it is written:
+
+    features   the five ordinal features (ORDINAL_FEATURES order) as uint8
+    hobby_ids  the sorted, distinct ids of its hobbies in the Hobby
+               vocabulary table, as uint32
+
+A cohort is then loaded with one query over (id, features, hobby_ids) and
+decoded straight into the arrays SimilarityEngine.calculate_similarity_block
+works on, without building a Student object or a vector dict per row.
+"""
+import threading
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Student, Hobby
+from similarity_engine import ORDINAL_FEATURES
+
+
+class FeatureStore:
+    """Normalize students at write time and load cohorts as NumPy arrays"""
+
+    # Stay well below SQLite's bound-parameter limit in IN queries
+    QUERY_CHUNK = 900
+
+    def __init__(self):
+        """Initialize with an empty in-memory copy of the hobby vocabulary"""
+        self._hobby_ids = {}  # name -> id
+        self._hobby_names = {}  # id -> name
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Forget the cached vocabulary (e.g. after the hobbies table was emptied)"""
+        with self._lock:
+            self._hobby_ids.clear()
+            self._hobby_names.clear()
+
+    def resolve_hobbies(self, names):
+        """
+        Map hobby names to vocabulary ids, adding unknown names to the table
+
+        New names are committed on a separate connection, so the vocabulary
+        (append-only) stays valid even if the caller's transaction rolls back.
+
+        Args:
+            names: Iterable of normalized hobby names
+
+        Returns:
+            Dictionary {name: id}
+        """
+        names = set(names)
+        with self._lock:
+            missing = [name for name in names if name not in self._hobby_ids]
+            for attempt in range(3):
+                if not missing:
+                    break
+                with db.engine.begin() as conn:
+                    for start in range(0, len(missing), self.QUERY_CHUNK):
+                        chunk = missing[start:start + self.QUERY_CHUNK]
+                        query = db.select(Hobby.id, Hobby.name).where(Hobby.name.in_(chunk))
+                        for hobby_id, name in conn.execute(query):
+                            self._hobby_ids[name] = hobby_id
+                            self._hobby_names[hobby_id] = name
+                missing = [name for name in missing if name not in self._hobby_ids]
+                if missing:
+                    try:
+                        with db.engine.begin() as conn:
+                            conn.execute(Hobby.__table__.insert(), [{'name': name} for name in missing])
+                    except IntegrityError:
+                        pass  # Added concurrently; pick the ids up on the next pass
+            return {name: self._hobby_ids[name] for name in names}
+
+    @staticmethod
+    def pack_features(student):
+        """Pack a student's ordinal features as bytes"""
+        return bytes(getattr(student, name) for name, _ in ORDINAL_FEATURES)
+
+    def normalize(self, students):
+        """
+        Fill in the features and hobby_ids columns of students before they are committed
+
+        Args:
+            students: A Student or a list of Students
+        """
+        if isinstance(students, Student):
+            students = [students]
+        hobby_sets = [set(student.get_hobbies_list()) for student in students]
+        vocabulary = self.resolve_hobbies(set().union(*hobby_sets))
+        for student, hobbies in zip(students, hobby_sets):
+            student.features = self.pack_features(student)
+            student.hobby_ids = np.array(sorted(vocabulary[h] for h in hobbies), dtype=np.uint32).tobytes()
+
+    def backfill(self, batch_size=1000):
+        """Normalize students stored before these columns existed"""
+        while True:
+            students = Student.query.filter(
+                (Student.features.is_(None)) | (Student.hobby_ids.is_(None))
+            ).limit(batch_size).all()
+            if not students:
+                break
+            self.normalize(students)
+            db.session.commit()
+
+    def load_rows(self, student_ids=None):
+        """Fetch (id, features, hobby_ids) rows, ordered by id or by student_ids"""
+        columns = db.session.query(Student.id, Student.features, Student.hobby_ids)
+        if student_ids is None:
+            rows = columns.order_by(Student.id).all()
+        else:
+            student_ids = [int(sid) for sid in student_ids]
+            by_id = {}
+            for start in range(0, len(student_ids), self.QUERY_CHUNK):
+                chunk = student_ids[start:start + self.QUERY_CHUNK]
+                for row in columns.filter(Student.id.in_(chunk)):
+                    by_id[row[0]] = row
+            rows = [by_id[sid] for sid in student_ids if sid in by_id]
+
+        if any(row[1] is None or row[2] is None for row in rows):
+            self.backfill()
+            db.session.expire_all()
+            return self.load_rows(student_ids)
+        return rows
+
+    def load_encoded(self, student_ids=None):
+        """
+        Load a cohort's features into arrays
+
+        Args:
+            student_ids: Ids to load in this order (default: every student by id)
+
+        Returns:
+            Dictionary in the layout of SimilarityEngine.encode_students
+            (ids, ordinals, hobbies, hobby_counts, vocabulary), producing
+            identical scores
+        """
+        rows = self.load_rows(student_ids)
+        n = len(rows)
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=n)
+        ordinals = np.frombuffer(b''.join(row[1] for row in rows), dtype=np.uint8)
+        ordinals = ordinals.reshape(n, len(ORDINAL_FEATURES)).astype(np.int64)
+
+        blobs = [row[2] for row in rows]
+        counts = np.fromiter((len(blob) // 4 for blob in blobs), dtype=np.int64, count=n)
+        flat = np.frombuffer(b''.join(blobs), dtype=np.uint32)
+        vocabulary, columns = np.unique(flat, return_inverse=True)
+
+        # float32 keeps the matrix product on BLAS; counts stay exact integers
+        hobbies = np.zeros((n, len(vocabulary)), dtype=np.float32)
+        hobbies[np.repeat(np.arange(n), counts), columns] = 1.0
+
+        return {
+            'ids': ids,
+            'ordinals': ordinals,
+            'hobbies': hobbies,
+            'hobby_counts': counts,
+            'vocabulary': self.hobby_names(vocabulary.tolist())
+        }
+
+    def hobby_names(self, hobby_ids):
+        """Vocabulary names of hobby ids (loads the vocabulary in one query if needed)"""
+        if any(hobby_id not in self._hobby_names for hobby_id in hobby_ids):
+            with self._lock:
+                for hobby_id, name in db.session.query(Hobby.id, Hobby.name):
+                    self._hobby_ids[name] = hobby_id
+                    self._hobby_names[hobby_id] = name
+        return [self._hobby_names.get(hobby_id) for hobby_id in hobby_ids]
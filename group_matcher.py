@@ -0,0 +1,461 @@
+"""
+Group Matcher Module
+Room assignment for triples and quads: k-way partitioning of a cohort
+
+A room's score is the sum of the pair scores of its members, and the engine
+maximizes the total over all rooms for a mix of room sizes (see plan_rooms).
+Exact partitioning into rooms of three or more is NP-hard, so each restart:
+
+    1. Seeds the rooms greedily, largest first: a random unassigned student
+       opens a room and the student with the highest total score to the
+       members so far joins it, until the room is full.
+    2. Improves the assignment by swapping two students between rooms (or
+       with an unassigned student). With M[i, r] the total score of student
+       i to the members of room r, swapping i (room a) and j (room b) gains
+       M[i, b] - M[i, a] + M[j, a] - M[j, b] - 2 s(i, j), so one vectorized
+       O(n^2) sweep evaluates every swap. Cheap passes only try swaps into
+       the few rooms each student scores highest with; the best swaps
+       touching distinct rooms are applied, updating M in O(n) each, and a
+       full sweep runs whenever the cheap passes stall, until no swap
+       improves or the time budget runs out.
+
+Restarts differ in their random seeds and run on a process pool sharing the
+score matrix; the best assignment wins. With hard constraints (see
+constraints.py) every block of the cohort gets its own rooms, and pairs
+forbidden inside a block carry a penalty larger than any room can gain.
+"""
+from config import Config
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+from similarity_engine import SimilarityEngine
+from parallel_scoring import process_pool, resolve_workers
+from constraints import MatchConstraints
+from local_search import LocalSearchMatcher
+
+# Highest score a single pair can have
+MAX_PAIR_SCORE = 100.0
+
+# Per-process state installed by _init_worker
+_worker = {}
+
+
+def forbidden_penalty(room_size):
+    """Score of a forbidden pair: more than all pairs of a room of room_size can gain"""
+    return MAX_PAIR_SCORE * room_size * (room_size - 1) / 2 + 1
+
+
+def _cover(n, sizes):
+    """Counts of each size (largest first) summing to exactly n, or None"""
+    if len(sizes) == 1:
+        return [n // sizes[0]] if n % sizes[0] == 0 else None
+    for count in range(n // sizes[0], -1, -1):
+        counts = _cover(n - count * sizes[0], sizes[1:])
+        if counts is not None:
+            return [count] + counts
+    return None
+
+
+def plan_rooms(n, mix=None, sizes=None):
+    """
+    Room sizes for a cohort of n students, largest first
+
+    Args:
+        n: Number of students
+        mix: Optional {room size: number of rooms}; rooms that no longer fit
+            the cohort stay empty, students beyond the capacity are unassigned
+        sizes: Room sizes to combine when no mix is given (default:
+            Config.GROUP_ROOM_SIZES); the cohort is covered exactly, with as
+            many of the largest rooms as possible, or leaving as few students
+            unassigned as possible
+
+    Returns:
+        List of room sizes
+    """
+    if mix:
+        rooms = []
+        for size in sorted(mix, reverse=True):
+            for _ in range(mix[size]):
+                if sum(rooms) + size <= n:
+                    rooms.append(size)
+        return rooms
+
+    sizes = sorted(set(sizes or Config.GROUP_ROOM_SIZES), reverse=True)
+    for covered in range(n, -1, -1):
+        counts = _cover(covered, sizes)
+        if counts is not None:
+            return [size for size, count in zip(sizes, counts) for _ in range(count)]
+    return []
+
+
+def seed_rooms(scores, rooms, rng):
+    """
+    Greedy initial assignment
+
+    Returns:
+        room_of array: room index of every student, -1 if unassigned
+    """
+    n = len(scores)
+    room_of = np.full(n, -1, dtype=np.int64)
+    free = np.ones(n, dtype=bool)
+    for room, size in enumerate(rooms):
+        member = int(rng.choice(np.flatnonzero(free)))
+        gain = np.zeros(n)
+        for _ in range(size):
+            room_of[member] = room
+            free[member] = False
+            gain += scores[member]
+            member = int(np.argmax(np.where(free, gain, -np.inf)))
+    return room_of
+
+
+def room_totals(scores, room_of, n_rooms):
+    """
+    Total pair score inside each room
+
+    Returns:
+        Float array of length n_rooms
+    """
+    totals = np.zeros(n_rooms)
+    assigned = np.flatnonzero(room_of >= 0)
+    order = assigned[np.argsort(room_of[assigned], kind='stable')]
+    for members in np.split(order, np.flatnonzero(np.diff(room_of[order])) + 1):
+        if len(members):
+            totals[room_of[members[0]]] = scores[np.ix_(members, members)].sum() / 2
+    return totals
+
+
+def _targeted_swaps(scores, M, group, slots, assigned, own, target_rooms):
+    """
+    Best swap of every student with a member of one of its target rooms
+
+    The targets of a student are the rooms it has the highest total score
+    to; only swaps into those rooms can gain much, and evaluating them costs
+    O(n * target_rooms * room size) instead of O(n^2).
+    """
+    n, n_rooms = len(scores), len(slots)
+    rows = np.arange(n)
+    affinity = M[:, :n_rooms].copy()
+    mask = group < n_rooms
+    affinity[rows[mask], group[mask]] = -np.inf
+    target_rooms = min(target_rooms, n_rooms)
+    if target_rooms < n_rooms:
+        targets = np.argpartition(-affinity, target_rooms - 1, axis=1)[:, :target_rooms]
+    else:
+        targets = np.broadcast_to(np.arange(n_rooms), (n, n_rooms))
+
+    partners = slots[targets].reshape(n, -1)
+    valid = (partners >= 0) & (group[partners] != group[:, None])
+    partners = np.where(valid, partners, 0)
+    target_of = np.repeat(targets, slots.shape[1], axis=1)
+    gain = M[rows[:, None], target_of] - own[:, None]
+    gain += M[partners, group[:, None]] - own[partners]
+    gain -= scores[rows[:, None], partners] * (assigned[:, None] + assigned[partners])
+    gain[~valid] = -np.inf
+
+    best = np.argmax(gain, axis=1)
+    return partners[rows, best], gain[rows, best]
+
+
+def _dense_swaps(scores, M, group, assigned, own, block_rows):
+    """Best swap of every student with anybody in another room, in O(n^2)"""
+    n = len(scores)
+    best_partner = np.empty(n, dtype=np.int64)
+    best_gain = np.empty(n)
+    for start in range(0, n, block_rows):
+        rows = np.arange(start, min(start + block_rows, n))
+        gain = M[rows][:, group]
+        gain -= own[rows, None]
+        gain += M[:, group[rows]].T
+        gain -= own[None, :]
+        # s(i, j) is lost once for each of the two that leaves a real room
+        gain -= scores[rows] * (assigned[rows, None] + assigned[None, :])
+        gain[group[rows, None] == group[None, :]] = -np.inf
+        partner = np.argmax(gain, axis=1)
+        best_partner[rows] = partner
+        best_gain[rows] = gain[np.arange(len(rows)), partner]
+    return best_partner, best_gain
+
+
+def improve_rooms(scores, room_of, n_rooms, deadline=None, max_passes=None, progress=None,
+                  target_rooms=None, block_rows=512):
+    """
+    Swap-based local search
+
+    Passes evaluate the swaps into each student's target rooms; once none of
+    them improves, a full O(n^2) pass over every swap either finds more or
+    confirms the assignment is swap-optimal.
+
+    Args:
+        scores: Dense n x n score matrix (zero diagonal)
+        room_of: Initial assignment (modified in place)
+        n_rooms: Number of rooms
+        deadline: time.monotonic() value to stop at (None: no limit)
+        max_passes: Maximum passes (default: Config.GROUP_MAX_PASSES)
+        progress: Optional callable receiving passes and swaps
+        target_rooms: Rooms per student searched by the cheap passes
+            (default: Config.GROUP_TARGET_ROOMS)
+        block_rows: Students whose swaps are evaluated per block of a full pass
+
+    Returns:
+        (room_of, passes, swaps, stop_reason)
+    """
+    max_passes = max_passes or Config.GROUP_MAX_PASSES
+    target_rooms = target_rooms or Config.GROUP_TARGET_ROOMS
+    n = len(scores)
+    unassigned = n_rooms  # Pseudo-room of the unassigned students; its column of M stays 0
+    group = np.where(room_of >= 0, room_of, unassigned)
+
+    # M[i, r]: total score of student i to the members of room r; slots[r]: members of room r
+    M = np.zeros((n, n_rooms + 1))
+    order = np.argsort(group, kind='stable')
+    rooms = [members for members in np.split(order, np.flatnonzero(np.diff(group[order])) + 1)
+             if len(members) and group[members[0]] != unassigned]
+    slots = np.full((n_rooms, max((len(members) for members in rooms), default=1)), -1, dtype=np.int64)
+    slot_of = np.full(n, -1, dtype=np.int64)
+    for members in rooms:
+        M[:, group[members[0]]] = scores[:, members].sum(axis=1)
+        slots[group[members[0]], :len(members)] = members
+        slot_of[members] = np.arange(len(members))
+
+    passes = swaps = 0
+    stop_reason = 'converged'
+    full = False
+    while True:
+        if passes >= max_passes:
+            stop_reason = 'max_passes'
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            stop_reason = 'time_limit'
+            break
+        passes += 1
+
+        own = M[np.arange(n), group]
+        assigned = (group != unassigned).astype(np.float64)
+        if full:
+            best_partner, best_gain = _dense_swaps(scores, M, group, assigned, own, block_rows)
+        else:
+            best_partner, best_gain = _targeted_swaps(scores, M, group, slots, assigned, own, target_rooms)
+
+        improving = np.flatnonzero(best_gain > 1e-9)
+        if not len(improving):
+            if full:
+                break
+            full = True
+            continue
+        full = False
+
+        # Apply the best swaps first; each room and each student changes at most once
+        # per pass, so every applied gain is still exact (the unassigned pseudo-room is
+        # never touched, but its members' gains go stale once they move)
+        touched = np.zeros(n_rooms + 1, dtype=bool)
+        moved = np.zeros(n, dtype=bool)
+        applied = 0
+        for i in improving[np.argsort(-best_gain[improving], kind='stable')].tolist():
+            j = int(best_partner[i])
+            a, b = group[i], group[j]
+            if touched[a] or touched[b] or moved[i] or moved[j]:
+                continue
+            touched[a] = a != unassigned
+            touched[b] = b != unassigned
+            moved[i] = moved[j] = True
+            group[i], group[j] = b, a
+            if a != unassigned:
+                M[:, a] += scores[:, j] - scores[:, i]
+                slots[a, slot_of[i]] = j
+            if b != unassigned:
+                M[:, b] += scores[:, i] - scores[:, j]
+                slots[b, slot_of[j]] = i
+            slot_of[i], slot_of[j] = slot_of[j], slot_of[i]
+            applied += 1
+        swaps += applied
+
+        if progress:
+            progress(passes=passes, swaps=swaps)
+
+    room_of[:] = np.where(group == unassigned, -1, group)
+    return room_of, passes, swaps, stop_reason
+
+
+def run_restart(scores, rooms, seed, time_limit=None, max_passes=None, progress=None):
+    """
+    One seeded restart: greedy seeding followed by swap local search
+
+    Returns:
+        Dictionary with room_of, total, seed_total, passes, swaps and stop_reason
+    """
+    deadline = time.monotonic() + time_limit if time_limit else None
+    room_of = seed_rooms(scores, rooms, np.random.default_rng(seed))
+    seed_total = float(room_totals(scores, room_of, len(rooms)).sum())
+    room_of, passes, swaps, stop_reason = improve_rooms(scores, room_of, len(rooms), deadline,
+                                                        max_passes, progress)
+    return {
+        'seed': seed,
+        'room_of': room_of,
+        'total': float(room_totals(scores, room_of, len(rooms)).sum()),
+        'seed_total': seed_total,
+        'passes': passes,
+        'swaps': swaps,
+        'stop_reason': stop_reason
+    }
+
+
+def _init_worker(shm_name, n):
+    """Attach a worker to the shared score matrix"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['scores'] = np.ndarray((n, n), dtype=np.float64, buffer=shm.buf)
+
+
+def _run_shared_restart(rooms, seed, time_limit, max_passes):
+    """run_restart on the worker's shared score matrix"""
+    return run_restart(_worker['scores'], rooms, seed, time_limit, max_passes)
+
+
+class GroupMatcher:
+    """Assigns students to rooms of several sizes, maximizing intra-room compatibility"""
+
+    def __init__(self, similarity_engine=None, restarts=None, workers=None, time_limit=None,
+                 constraints=None, progress=None):
+        """
+        Initialize the group matcher
+
+        Args:
+            similarity_engine: SimilarityEngine used for scoring and reasons
+            restarts: Seeded restarts (default: Config.GROUP_RESTARTS)
+            workers: Processes running restarts (default: Config.GROUP_WORKERS;
+                1 = serial, 0 = one per CPU core)
+            time_limit: Local search budget per restart in seconds (default:
+                Config.GROUP_TIME_LIMIT, 0 disables it)
+            constraints: MatchConstraints (default: from Config)
+            progress: Optional callable receiving progress keyword arguments
+        """
+        self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.restarts = max(restarts or Config.GROUP_RESTARTS, 1)
+        self.workers = resolve_workers(Config.GROUP_WORKERS if workers is None else workers)
+        self.time_limit = time_limit if time_limit is not None else Config.GROUP_TIME_LIMIT
+        self.constraints = constraints or MatchConstraints()
+        self.progress = progress
+
+    def best_restart(self, scores, rooms):
+        """Run every restart on one score matrix and keep the best assignment"""
+        seeds = [Config.GROUP_SEED + r for r in range(self.restarts)]
+        workers = min(self.workers, self.restarts)
+        if workers <= 1 or len(scores) < Config.GROUP_PARALLEL_THRESHOLD:
+            results = []
+            for r, seed in enumerate(seeds):
+                progress = (lambda r=r, **kw: self.progress(restart=r + 1, **kw)) if self.progress else None
+                results.append(run_restart(scores, rooms, seed, self.time_limit, None, progress))
+        else:
+            n = len(scores)
+            shm = shared_memory.SharedMemory(create=True, size=max(scores.nbytes, 1))
+            try:
+                np.ndarray((n, n), dtype=np.float64, buffer=shm.buf)[:] = scores
+                with process_pool(workers, initializer=_init_worker, initargs=(shm.name, n)) as pool:
+                    futures = [pool.submit(_run_shared_restart, rooms, seed, self.time_limit, None)
+                               for seed in seeds]
+                    results = []
+                    for future in futures:
+                        results.append(future.result())
+                        if self.progress:
+                            self.progress(restarts_done=len(results))
+            finally:
+                shm.close()
+                shm.unlink()
+        return max(results, key=lambda result: result['total'])
+
+    def match_students(self, student_vectors, score_matrix=None, room_mix=None, encoded=None):
+        """
+        Assign students to rooms
+
+        Args:
+            student_vectors: List of student vector dictionaries
+            score_matrix: Optional precomputed score matrix aligned with student_vectors
+                (unconstrained runs only; constrained runs score each block)
+            room_mix: Optional {room size: number of rooms} (default: plan_rooms)
+            encoded: Optional pre-encoded cohort aligned with student_vectors
+
+        Returns:
+            Dictionary with groups (member ids, total score, average pair
+            score, reasons), unmatched ids and statistics
+        """
+        started = time.perf_counter()
+        if self.constraints.active:
+            if encoded is None:
+                encoded = self.similarity_engine.encode_students(student_vectors)
+            blocks = self.constraints.partition(student_vectors)
+        else:
+            blocks = [list(range(len(student_vectors)))]
+        # A mix of room counts cannot be split across blocks: each block combines its sizes
+        sizes = [size for size, count in (room_mix or {}).items() if count] or None
+        if len(blocks) > 1:
+            room_mix = None
+
+        groups = []
+        unmatched = []
+        rooms_used = {}
+        stats = {'seed_total': 0.0, 'passes': 0, 'swaps': 0, 'stop_reason': 'converged'}
+        for block in blocks:
+            vectors = [student_vectors[p] for p in block]
+            rooms = plan_rooms(len(block), room_mix, sizes)
+            if not rooms:
+                unmatched.extend(s['id'] for s in vectors)
+                continue
+
+            if len(blocks) == 1 and score_matrix is not None:
+                scores = np.array(score_matrix, dtype=np.float64)
+            elif encoded is not None:
+                scores = self.similarity_engine.calculate_similarity_matrix(
+                    None, encoded=LocalSearchMatcher.subset(encoded, block))
+            else:
+                scores = self.similarity_engine.calculate_similarity_matrix(vectors)
+            forbidden = self.constraints.forbidden_mask(vectors)
+            if forbidden is not None:
+                scores[forbidden] = -forbidden_penalty(max(rooms))
+                np.fill_diagonal(scores, 0.0)
+
+            result = self.best_restart(scores, rooms)
+            stats['seed_total'] += result['seed_total']
+            stats['passes'] = max(stats['passes'], result['passes'])
+            stats['swaps'] += result['swaps']
+            if result['stop_reason'] != 'converged':
+                stats['stop_reason'] = result['stop_reason']
+
+            room_of = result['room_of']
+            unmatched.extend(vectors[p]['id'] for p in np.flatnonzero(room_of < 0).tolist())
+            order = np.argsort(room_of, kind='stable')
+            order = order[room_of[order] >= 0]
+            for members in np.split(order, np.flatnonzero(np.diff(room_of[order])) + 1):
+                members = members.tolist()
+                block_scores = scores[np.ix_(members, members)]
+                if forbidden is not None and forbidden[np.ix_(members, members)].any():
+                    # The penalty could not be avoided: nobody may share this room
+                    unmatched.extend(vectors[p]['id'] for p in members)
+                    continue
+                pair_count = len(members) * (len(members) - 1) // 2
+                total = float(block_scores.sum()) / 2
+                groups.append((
+                    tuple(vectors[p]['id'] for p in members),
+                    round(total, 2),
+                    round(total / pair_count, 2),
+                    self.similarity_engine.generate_group_reasons([vectors[p] for p in members])
+                ))
+                rooms_used[len(members)] = rooms_used.get(len(members), 0) + 1
+
+        total_score = sum(group[1] for group in groups)
+        average_score = sum(group[2] for group in groups) / len(groups) if groups else 0.0
+        return {
+            'groups': groups,
+            'total_score': round(total_score, 2),
+            'average_score': round(average_score, 2),
+            'seed_score': round(stats['seed_total'], 2),
+            'rooms': {size: rooms_used[size] for size in sorted(rooms_used, reverse=True)},
+            'restarts': self.restarts,
+            'passes': stats['passes'],
+            'swaps': stats['swaps'],
+            'stop_reason': stats['stop_reason'],
+            'blocks': len(blocks),
+            'search_time': round(time.perf_counter() - started, 3),
+            'unmatched': unmatched
+        }
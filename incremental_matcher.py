@@ -0,0 +1,161 @@
+"""
+Incremental Matcher Module
+Repairs an existing matching after students join or withdraw
+
+A full rerun reshuffles everyone. Instead, the pairs of a previous run whose
+students are both still in the cohort are kept, and only the affected
+region is re-matched:
+
+    - free students: new students, students whose roommate withdrew, and
+      students left unmatched before
+    - each free student's top partners (INCREMENTAL_CANDIDATES), scored with
+      one vectorized row per free student, together with their current
+      roommates, so a free student can take over a partner and the partner's
+      old roommate can move on (augmenting paths of length three)
+
+The region is solved exactly with the blossom algorithm. Existing pairs get
+INCREMENTAL_KEEP_BONUS extra score points there, so an existing pair is only
+broken when that gains more than the bonus. Scoring and matching cost grows
+with the number of changed students, not with the cohort; pairs outside the
+region, and their reasons, are carried over untouched.
+"""
+from config import Config
+import time
+import numpy as np
+
+from similarity_engine import SimilarityEngine
+from blossom_matcher import BlossomMatcher
+from constraints import MatchConstraints
+
+
+class IncrementalMatcher:
+    """Re-matches only the students affected by changes to a cohort"""
+
+    def __init__(self, similarity_engine=None, candidate_k=None, keep_bonus=None, constraints=None,
+                 scores=None):
+        """
+        Initialize the incremental matcher
+
+        Args:
+            similarity_engine: SimilarityEngine used for scoring and reasons
+            candidate_k: Partners per free student pulled into the region
+                (default: Config.INCREMENTAL_CANDIDATES)
+            keep_bonus: Extra score of an existing pair inside the region
+                (default: Config.INCREMENTAL_KEEP_BONUS)
+            constraints: MatchConstraints (default: from Config)
+            scores: Optional row-block view of the cohort's scores (see
+                SimilarityStore.cohort), read instead of scoring from features
+        """
+        self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.candidate_k = candidate_k or Config.INCREMENTAL_CANDIDATES
+        self.keep_bonus = Config.INCREMENTAL_KEEP_BONUS if keep_bonus is None else keep_bonus
+        self.constraints = constraints or MatchConstraints()
+        self.scores = scores
+
+    def score_rows(self, student_vectors, encoded, rows, cols=None):
+        """Scores of some students against others, with forbidden pairs at 0"""
+        if self.scores is None:
+            scores = self.similarity_engine.calculate_similarity_block(encoded, rows, cols)
+        else:
+            scores = self.scores.block(rows, cols)
+        if self.constraints.active:
+            cols = np.arange(len(student_vectors)) if cols is None else cols
+            scores[~self.constraints.allowed_mask(student_vectors, rows, cols)] = 0.0
+        return scores
+
+    def match_students(self, student_vectors, previous_pairs, encoded=None):
+        """
+        Repair a previous matching for the current cohort
+
+        Args:
+            student_vectors: List of student vector dictionaries (current cohort)
+            previous_pairs: (student1_id, student2_id, score, reasons) pairs of
+                the matching to repair, reasons as a list of strings
+            encoded: Optional pre-encoded cohort aligned with student_vectors
+
+        Returns:
+            Dictionary with matches and statistics, including how many
+            previous pairs were kept, broken (changed_pairs) and newly made;
+            added counts students without a previous pair (new or unmatched)
+        """
+        started = time.perf_counter()
+        if encoded is None:
+            encoded = self.similarity_engine.encode_students(student_vectors)
+        n = len(student_vectors)
+        position = {s['id']: p for p, s in enumerate(student_vectors)}
+        previous_ids = {sid for pair in previous_pairs for sid in pair[:2]}
+
+        # Pairs whose students are both still here (and still allowed) stay
+        mate = np.full(n, -1, dtype=np.int64)
+        kept = {}
+        for id1, id2, score, reasons in previous_pairs:
+            if id1 in position and id2 in position:
+                i, j = position[id1], position[id2]
+                if self.constraints.allowed(student_vectors[i], student_vectors[j]):
+                    mate[i], mate[j] = j, i
+                    kept[(min(i, j), max(i, j))] = (id1, id2, score, reasons)
+        free = np.flatnonzero(mate < 0)
+
+        # The region: free students, their best partners and those partners' roommates
+        region = free
+        if len(free) and n > 1:
+            k = min(self.candidate_k, n - 1)
+            rows = self.score_rows(student_vectors, encoded, free)
+            rows[np.arange(len(free)), free] = -np.inf
+            best = np.argpartition(-rows, k - 1, axis=1)[:, :k].ravel()
+            partners = mate[best]
+            region = np.unique(np.concatenate([free, best, partners[partners >= 0]]))
+
+        new_pairs = []
+        if len(region) >= 2:
+            scores = self.score_rows(student_vectors, encoded, region, region)
+            np.fill_diagonal(scores, 0.0)
+            local = {p: r for r, p in enumerate(region.tolist())}
+            weights = scores.copy()
+            for i, j in kept:
+                if i in local and j in local:
+                    weights[local[i], local[j]] += self.keep_bonus
+                    weights[local[j], local[i]] += self.keep_bonus
+
+            # Forbidden pairs weigh 0, no more than leaving both students alone; allowed
+            # pairs are scaled so that the heaviest matching with the most pairs wins,
+            # which keeps allowed pairs scoring 0 apart from forbidden ones
+            blossom = BlossomMatcher(self.similarity_engine)
+            allowed = np.ones(scores.shape, dtype=bool)
+            if self.constraints.active:
+                allowed = self.constraints.allowed_mask(student_vectors, region, region)
+            weights = blossom.build_weight_matrix(None, weights)
+            weights = np.where(allowed, weights * (len(region) // 2 + 1) + 1, 0)
+            np.fill_diagonal(weights, 0)
+            region_mate = blossom.solve(weights)
+            mate[region] = -1
+            for r, s in enumerate(region_mate):
+                if s > r and allowed[r, s]:
+                    i, j = int(region[r]), int(region[s])
+                    mate[i], mate[j] = j, i
+                    if (min(i, j), max(i, j)) not in kept:
+                        new_pairs.append((student_vectors[i]['id'], student_vectors[j]['id'],
+                                          float(scores[r, s])))
+
+        matches = [pair for (i, j), pair in kept.items() if mate[i] == j]
+        matches.extend(self.similarity_engine.attach_reasons(new_pairs, student_vectors))
+        unmatched = [student_vectors[p]['id'] for p in np.flatnonzero(mate < 0).tolist()]
+
+        total_score = sum(pair[2] for pair in matches)
+        kept_count = len(matches) - len(new_pairs)
+        return {
+            'matches': matches,
+            'total_score': round(total_score, 2),
+            'average_score': round(total_score / len(matches), 2) if matches else 0.0,
+            'kept_pairs': kept_count,
+            'changed_pairs': len(previous_pairs) - kept_count,
+            'new_pairs': len(new_pairs),
+            'added': sum(1 for s in student_vectors if s['id'] not in previous_ids),
+            'withdrawn': sum(1 for sid in previous_ids if sid not in position),
+            'region_size': int(len(region)),
+            'search_time': round(time.perf_counter() - started, 3),
+            'unmatched': unmatched,
+            'alternatives': self.similarity_engine.unmatched_alternatives(
+                unmatched, student_vectors, matches,
+                lambda rows: self.score_rows(student_vectors, encoded, rows))
+        }
@@ -0,0 +1,388 @@
+"""
+Local Search Module
+Greedy matching refined by 2-opt pair swaps, for cohorts too large for exact matching
+
+Blossom and A* need the full n x n score matrix, which stops being practical
+somewhere past ten thousand students. This matcher only ever looks at each
+student's top-K candidates (see candidate_index.top_k_candidates):
+
+    1. Greedy: the n*k candidate edges are sorted once and taken best first
+       whenever both students are still free. Students left over (all of
+       their candidates were taken) are matched the same way among
+       themselves, with candidate lists recomputed for that smaller set.
+    2. 2-opt: for every student a (partner b) and candidate c (partner d),
+       re-pairing to (a, c) + (b, d) gains s(a,c) + s(b,d) - s(a,b) - s(c,d).
+       Each pass evaluates all n*k moves at once, applies the improving ones
+       best first (skipping moves that touch a student already moved in the
+       pass), and repeats until no move improves or the time budget runs out.
+
+Both steps are O(n*k log n) per pass. The result is reported against the
+best-partner upper bound of AStarMatcher (every student's best score, halved),
+or against Config.ASTAR_HEURISTIC's bound for cohorts small enough to score
+densely, so the optimality gap is always visible.
+"""
+from config import Config
+import time
+import numpy as np
+
+from similarity_engine import SimilarityEngine
+from candidate_index import top_k_candidates
+from astar_heuristics import make_heuristic
+
+
+class LocalSearchMatcher:
+    """Greedy best-pair-first matching improved by 2-opt pair swaps"""
+
+    # With a pair filter, candidates fetched per kept candidate (forbidden ones are dropped)
+    OVERSAMPLE = 4
+
+    def __init__(self, similarity_engine=None, candidate_k=None, time_limit=None, progress=None,
+                 allowed=None):
+        """
+        Initialize the matcher
+
+        Args:
+            similarity_engine: SimilarityEngine used for scoring
+            candidate_k: Candidates per student (default: Config.LOCAL_SEARCH_CANDIDATES)
+            time_limit: 2-opt time budget in seconds (default: Config.LOCAL_SEARCH_TIME_LIMIT)
+            progress: Optional callable receiving progress keyword arguments
+            allowed: Optional callable (rows, cols) -> boolean array telling which
+                pairs of cohort positions may be matched (see MatchConstraints.pair_filter)
+        """
+        self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.candidate_k = candidate_k or Config.LOCAL_SEARCH_CANDIDATES
+        self.time_limit = time_limit if time_limit is not None else Config.LOCAL_SEARCH_TIME_LIMIT
+        self.progress = progress
+        self.allowed = allowed
+        self.passes = 0
+        self.swaps = 0
+        self.greedy_score = 0.0
+        self.stop_reason = None
+
+    @staticmethod
+    def subset(encoded, positions):
+        """Encoded arrays of a subset of the students"""
+        return {
+            'ids': encoded['ids'][positions],
+            'ordinals': encoded['ordinals'][positions],
+            'hobbies': encoded['hobbies'][positions],
+            'hobby_counts': encoded['hobby_counts'][positions],
+            'vocabulary': encoded['vocabulary']
+        }
+
+    def restrict(self, candidates, positions=None):
+        """
+        Drop forbidden pairs from candidate lists, keeping each list best first
+
+        Args:
+            candidates: (indices, scores) from top_k_candidates
+            positions: Cohort positions of the candidate rows and indices, if
+                they were computed for a subset
+        """
+        if self.allowed is None:
+            return candidates
+        indices, scores = candidates
+        rows = np.repeat(np.arange(len(indices)), indices.shape[1]).reshape(indices.shape)
+        cols = np.maximum(indices, 0)
+        if positions is not None:
+            rows, cols = positions[rows], positions[cols]
+        keep = (indices >= 0) & self.allowed(rows, cols)
+        indices = np.where(keep, indices, -1)
+        scores = np.where(keep, scores, -np.inf)
+        ranked = np.argsort(-scores, axis=1, kind='stable')
+        return np.take_along_axis(indices, ranked, axis=1), np.take_along_axis(scores, ranked, axis=1)
+
+    def candidate_lists(self, encoded, k, positions=None):
+        """
+        Top-k allowed partners of every student of an encoded cohort
+
+        With a pair filter, OVERSAMPLE times as many candidates are fetched
+        and the forbidden ones dropped, so students with many forbidden
+        neighbours still keep about k candidates.
+        """
+        if self.allowed is None:
+            return top_k_candidates(self.similarity_engine, encoded, k)
+        candidates = top_k_candidates(self.similarity_engine, encoded, k * self.OVERSAMPLE)
+        indices, scores = self.restrict(candidates, positions)
+        return indices[:, :k], scores[:, :k]
+
+    def greedy(self, encoded, candidates):
+        """
+        Greedy best-pair-first matching over candidate edges
+
+        Args:
+            encoded: Encoded cohort
+            candidates: (indices, scores) from top_k_candidates
+
+        Returns:
+            mate array: mate[i] is the index matched to i, or -1
+        """
+        n = len(encoded['ids'])
+        mate = np.full(n, -1, dtype=np.int64)
+        free = np.arange(n)
+        indices, scores = candidates
+        k = self.candidate_k
+        while len(free) >= 2:
+            # Edges of the current free set, best first (ties by lower index pair)
+            rows = np.repeat(np.arange(len(free)), indices.shape[1])
+            cols = indices.ravel()
+            edge_scores = scores.ravel()
+            keep = cols >= 0
+            rows, cols, edge_scores = rows[keep], cols[keep], edge_scores[keep]
+            order = np.lexsort((cols, rows, -edge_scores))
+
+            local = np.full(len(free), -1, dtype=np.int64)
+            for i, j in zip(rows[order].tolist(), cols[order].tolist()):
+                if local[i] < 0 and local[j] < 0:
+                    local[i], local[j] = j, i
+            matched = local >= 0
+            if matched.any():
+                mate[free[matched]] = free[local[matched]]
+                free = free[~matched]
+            elif k >= len(free) - 1:
+                # Every pair left is forbidden
+                break
+            else:
+                # Every candidate left is forbidden: look further down the lists
+                k *= 4
+
+            # Students whose candidates were all taken are matched among themselves
+            if len(free) >= 2:
+                indices, scores = self.candidate_lists(self.subset(encoded, free), k, free)
+        return mate
+
+    def pair_scores(self, encoded, mate):
+        """Score of each student with its partner (0 when unmatched)"""
+        scores = np.zeros(len(mate))
+        matched = np.nonzero(mate >= 0)[0]
+        scores[matched] = self.similarity_engine.calculate_pair_scores(encoded, matched, mate[matched])
+        return scores
+
+    def two_opt(self, encoded, mate, candidates, deadline=None, max_passes=None):
+        """
+        Improve a matching with candidate-restricted 2-opt pair swaps
+
+        Args:
+            encoded: Encoded cohort
+            mate: Matching to improve (modified in place)
+            candidates: (indices, scores) from top_k_candidates
+            deadline: time.monotonic() value to stop at (None: no limit)
+            max_passes: Maximum passes (default: Config.LOCAL_SEARCH_MAX_PASSES)
+
+        Returns:
+            The improved mate array
+        """
+        max_passes = max_passes or Config.LOCAL_SEARCH_MAX_PASSES
+        indices, scores = candidates
+        n, k = indices.shape
+        current = self.pair_scores(encoded, mate)
+        a_all = np.repeat(np.arange(n), k)
+        c_all = indices.ravel()
+        ac_all = scores.ravel()
+        self.stop_reason = 'converged'
+
+        while True:
+            if self.passes >= max_passes:
+                self.stop_reason = 'max_passes'
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stop_reason = 'time_limit'
+                break
+            self.passes += 1
+
+            # Evaluate every (a, c) candidate move: a takes c, their partners b and d pair up
+            valid = (c_all >= 0) & (mate[a_all] != c_all)
+            a, c, s_ac = a_all[valid], c_all[valid], ac_all[valid]
+            b, d = mate[a], mate[c]
+            both = (b >= 0) & (d >= 0) & (b != d)
+            if self.allowed is not None:
+                # Partners that may not room together are both left alone instead
+                both[both] = self.allowed(b[both], d[both])
+            s_bd = np.zeros(len(a))
+            s_bd[both] = self.similarity_engine.calculate_pair_scores(encoded, b[both], d[both])
+            gain = s_ac + s_bd - current[a] - current[c]
+            improving = np.nonzero(gain > 1e-9)[0]
+
+            # Apply the best moves first; a student moves at most once per pass
+            moved = np.zeros(n, dtype=bool)
+            applied = 0
+            for t in improving[np.argsort(-gain[improving], kind='stable')].tolist():
+                group = [x for x in (a[t], b[t], c[t], d[t]) if x >= 0]
+                if moved[group].any():
+                    continue
+                moved[group] = True
+                mate[a[t]], mate[c[t]] = c[t], a[t]
+                current[a[t]] = current[c[t]] = s_ac[t]
+                if both[t]:
+                    mate[b[t]], mate[d[t]] = d[t], b[t]
+                    current[b[t]] = current[d[t]] = s_bd[t]
+                else:
+                    # Partners that cannot pair up are left alone
+                    for x in (b[t], d[t]):
+                        if x >= 0:
+                            mate[x] = -1
+                            current[x] = 0.0
+                applied += 1
+            applied += self.augment(mate, current, candidates)
+            self.swaps += applied
+            if not applied:
+                break
+
+            if self.progress:
+                self.progress(passes=self.passes, swaps=self.swaps,
+                              total_score=round(float(current.sum()) / 2, 2))
+        return mate
+
+    def augment(self, mate, current, candidates, depth=3):
+        """
+        Match unmatched students along short augmenting paths
+
+        From an unmatched student a the path takes a candidate c1; if c1 was
+        matched, its former partner d1 takes a candidate c2 of its own, and so
+        on, until a candidate is unmatched too. Paths of up to depth new
+        pairs are searched over the candidate lists and the one with the best
+        gain is applied. Swaps alone never grow the matching, so without this
+        move students left over by greedy (e.g. because their remaining
+        partners are forbidden) would stay unmatched.
+
+        Returns:
+            Number of paths applied (mate and current are updated in place)
+        """
+        indices, scores = candidates
+        applied = 0
+        for a in np.nonzero(mate < 0)[0].tolist():
+            if mate[a] >= 0:
+                continue
+            best = [1e-9, None]
+
+            def extend(x, path, gain, visited):
+                for y, s_xy in zip(indices[x].tolist(), scores[x].tolist()):
+                    if y < 0:
+                        break
+                    if y in visited:
+                        continue
+                    z = int(mate[y])
+                    if z < 0:
+                        if gain + s_xy > best[0]:
+                            best[:] = [gain + s_xy, path + [(x, y, s_xy)]]
+                    elif len(path) + 1 < depth:
+                        extend(z, path + [(x, y, s_xy)], gain + s_xy - current[y], visited | {y, z})
+
+            extend(a, [], 0.0, {a})
+            if best[1] is None:
+                continue
+            for x, y, s_xy in best[1]:
+                mate[x], mate[y] = y, x
+                current[x] = current[y] = s_xy
+            applied += 1
+        return applied
+
+    def score_rows(self, encoded, rows):
+        """Scores of some students against the whole cohort (0 for forbidden pairs)"""
+        block = self.similarity_engine.calculate_similarity_block(encoded, rows)
+        if self.allowed is not None:
+            rows = np.asarray(rows)
+            block[~self.allowed(rows[:, None], np.arange(block.shape[1])[None, :])] = 0.0
+        return block
+
+    def upper_bound(self, encoded, candidates):
+        """
+        Upper bound on the total score of any matching, from feasible LP duals
+
+        Returns:
+            (bound, heuristic name)
+        """
+        n = len(encoded['ids'])
+        if n <= Config.LOCAL_SEARCH_DENSE_BOUND_MAX:
+            scores = self.similarity_engine.calculate_similarity_matrix(None, encoded=encoded)
+            if self.allowed is not None:
+                # A forbidden pair is worth no more than leaving both students alone
+                positions = np.arange(n)
+                scores[~self.allowed(positions[:, None], positions[None, :])] = 0.0
+            heuristic = make_heuristic(Config.ASTAR_HEURISTIC, scores.tolist())
+            duals = np.array(list(heuristic.prepare((1 << n) - 1)[1].values()))
+            name = heuristic.name
+        else:
+            best = candidates[1][:, 0]
+            duals = np.where(best > -np.inf, best, 0.0) / 2
+            name = 'best_partner'
+        # With an odd cohort one student stays unmatched and its dual drops out
+        bound = float(duals.sum()) - (float(duals.min()) if n % 2 else 0.0)
+        return bound, name
+
+    def match_students(self, student_vectors, score_matrix=None, encoded=None):
+        """
+        Match students with greedy construction and 2-opt local search
+
+        Args:
+            student_vectors: List of student vector dictionaries
+            score_matrix: Unused; accepted for interface compatibility with the other matchers
+            encoded: Optional pre-encoded cohort aligned with student_vectors
+                (e.g. FeatureStore.load_encoded), saving the encoding step
+
+        Returns:
+            Dictionary with matches and statistics
+        """
+        started = time.perf_counter()
+        self.passes = 0
+        self.swaps = 0
+        n = len(student_vectors)
+        if n < 2:
+            return {
+                'matches': [],
+                'total_score': 0.0,
+                'average_score': 0.0,
+                'greedy_score': 0.0,
+                'upper_bound': 0.0,
+                'optimality_gap': 0.0,
+                'bound_heuristic': None,
+                'passes': 0,
+                'swaps': 0,
+                'search_time': 0.0,
+                'stop_reason': 'converged',
+                'unmatched': [s['id'] for s in student_vectors],
+                'alternatives': {}
+            }
+
+        if encoded is None:
+            encoded = self.similarity_engine.encode_students(student_vectors)
+        candidates = self.candidate_lists(encoded, self.candidate_k)
+
+        mate = self.greedy(encoded, candidates)
+        self.greedy_score = float(self.pair_scores(encoded, mate).sum()) / 2
+        if self.progress:
+            self.progress(phase_detail='2-opt', total_score=round(self.greedy_score, 2))
+
+        deadline = time.monotonic() + self.time_limit if self.time_limit else None
+        mate = self.two_opt(encoded, mate, candidates, deadline)
+        bound, bound_heuristic = self.upper_bound(encoded, candidates)
+
+        ids = encoded['ids'].tolist()
+        unmatched = [ids[i] for i in np.nonzero(mate < 0)[0].tolist()]
+        first = np.nonzero((mate >= 0) & (np.arange(n) < mate))[0]
+        pair_scores = self.similarity_engine.calculate_pair_scores(encoded, first, mate[first])
+        matched_pairs = [(ids[i], ids[j], score)
+                         for i, j, score in zip(first.tolist(), mate[first].tolist(), pair_scores.tolist())]
+        matched_pairs = self.similarity_engine.attach_reasons(matched_pairs, student_vectors)
+
+        total_score = sum(pair[2] for pair in matched_pairs)
+        average_score = total_score / len(matched_pairs) if matched_pairs else 0.0
+        gap = 100.0 * (bound - total_score) / bound if bound > 0 else 0.0
+
+        return {
+            'matches': matched_pairs,
+            'total_score': round(total_score, 2),
+            'average_score': round(average_score, 2),
+            'greedy_score': round(self.greedy_score, 2),
+            'upper_bound': round(bound, 2),
+            'optimality_gap': round(max(gap, 0.0), 2),
+            'bound_heuristic': bound_heuristic,
+            'candidate_k': self.candidate_k,
+            'passes': self.passes,
+            'swaps': self.swaps,
+            'search_time': round(time.perf_counter() - started, 3),
+            'stop_reason': self.stop_reason,
+            'unmatched': unmatched,
+            'alternatives': self.similarity_engine.unmatched_alternatives(
+                unmatched, student_vectors, matched_pairs, lambda rows: self.score_rows(encoded, rows))
+        }
@@ -0,0 +1,183 @@
+"""
+Match Jobs Module
+Background execution of matching runs
+
+A POST to /match only validates the selection and submits a job. A small
+thread pool runs the matching inside an application context while the
+browser polls /match/jobs/<id> for the job's status, phase and search
+progress. Every job stores its pairs under its own MatchRun in a single
+transaction once it completes, so concurrent runs never overwrite each
+other; writes are serialized, and a reset stops in-flight jobs from saving.
+"""
+from config import Config
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MatchJob:
+    """Status and progress of one matching run"""
+
+    def __init__(self, mode, student_ids, sequence, options=None):
+        """Create a queued job for a selection of student ids"""
+        self.id = uuid.uuid4().hex
+        self.sequence = sequence  # Submission order
+        self.mode = mode
+        self.student_ids = list(student_ids)
+        self.options = dict(options or {})  # Mode-specific settings from the form
+        self.status = 'queued'  # queued, running, done or failed
+        self.phase = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.messages = []  # (category, text) flash messages for the user
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def update(self, phase=None, **progress):
+        """Record the current phase and/or progress counters (thread-safe)"""
+        with self._lock:
+            if phase is not None:
+                self.phase = phase
+            self.progress.update(progress)
+
+    def add_message(self, text, category='info'):
+        """Queue a message to flash once the user collects the job"""
+        self.messages.append((category, text))
+
+    def to_dict(self):
+        """JSON-serializable snapshot of the job"""
+        with self._lock:
+            progress = dict(self.progress)
+            phase = self.phase
+        now = self.finished_at or time.time()
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'status': self.status,
+            'phase': phase,
+            'progress': progress,
+            'students': len(self.student_ids),
+            'result': self.result,
+            'error': self.error,
+            'elapsed': round(now - (self.started_at or now), 3),
+            'queued_for': round((self.started_at or now) - self.submitted_at, 3)
+        }
+
+
+class MatchJobQueue:
+    """Thread pool running MatchJobs, with an in-memory job registry"""
+
+    def __init__(self, app=None, workers=None, history=None):
+        """Initialize the queue; call init_app before submitting jobs"""
+        self.workers = workers or Config.MATCH_JOB_WORKERS
+        self.history = history or Config.MATCH_JOB_HISTORY
+        self.jobs = OrderedDict()
+        self.app = None
+        self.executor = None
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+
+        # Serializes result writes; jobs submitted before the barrier may not write
+        self.persist_lock = threading.Lock()
+        self.barrier = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Bind the queue to a Flask app and start the worker pool"""
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix='match-job')
+
+    def submit(self, mode, student_ids, runner, options=None):
+        """
+        Queue a matching run
+
+        Args:
+            mode: Matching mode name
+            student_ids: Selected student ids
+            runner: Callable runner(job) doing the work; its return value
+                becomes job.result and must be JSON-serializable
+            options: Optional mode-specific settings, available as job.options
+
+        Returns:
+            The queued MatchJob
+        """
+        with self._lock:
+            job = MatchJob(mode, student_ids, next(self._sequence), options)
+            self.jobs[job.id] = job
+            self._trim()
+        self.executor.submit(self._run, job, runner)
+        return job
+
+    def get(self, job_id):
+        """Look up a job by id (None if unknown or expired)"""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def status_counts(self):
+        """Number of known jobs in each status, keyed by (status,)"""
+        with self._lock:
+            counts = {(status,): 0 for status in ('queued', 'running', 'done', 'failed')}
+            for job in self.jobs.values():
+                counts[(job.status,)] += 1
+            return counts
+
+    def persist(self, job, write):
+        """
+        Store a job's results unless the data was reset after it was submitted
+
+        Args:
+            job: The MatchJob whose results are being written
+            write: Callable performing the write in one transaction
+
+        Returns:
+            True if write() ran, False if the job was superseded
+        """
+        with self.persist_lock:
+            if job.sequence < self.barrier:
+                return False
+            write()
+            return True
+
+    def supersede_all(self, write):
+        """Run write() and prevent every job submitted so far from storing results"""
+        with self.persist_lock:
+            write()
+            with self._lock:
+                self.barrier = max([job.sequence + 1 for job in self.jobs.values()] + [self.barrier])
+
+    def _run(self, job, runner):
+        """Execute a job on a worker thread"""
+        job.status = 'running'
+        job.started_at = time.time()
+        job.update(phase='starting')
+        with self.app.app_context():
+            try:
+                job.result = runner(job)
+                job.status = 'done'
+                job.update(phase='done')
+            except Exception as e:
+                job.error = str(e)
+                job.status = 'failed'
+                job.update(phase='failed')
+                job.add_message(f'Error during matching: {str(e)}', 'error')
+            finally:
+                job.finished_at = time.time()
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond the history limit"""
+        excess = len(self.jobs) - self.history
+        for job_id in [jid for jid, job in self.jobs.items() if job.finished][:max(excess, 0)]:
+            del self.jobs[job_id]
@@ -0,0 +1,330 @@
+"""
+Metrics Module
+Instrumentation of matching runs: Prometheus metrics, structured logs and profiles
+
+Every matching run is wrapped in a RunMetrics context that times its phases
+(load, vectors, scoring, matching, saving), records the search statistics
+(nodes explored, peak open-list size, closed-set size) and the process' peak
+RSS, and then:
+
+    - updates the process-wide REGISTRY, which /metrics renders in the
+      Prometheus text exposition format
+    - writes one JSON log line per phase and per finished run to the
+      'matching' logger
+    - if Config.MATCH_PROFILE_DIR is set, dumps a cProfile of the run to
+      <dir>/run-<id>-<mode>.prof (view it with python -m pstats or snakeviz)
+
+The registry is a small dependency-free implementation of counters, gauges
+and histograms with labels.
+"""
+from config import Config
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger('matching')
+
+# Upper bounds (seconds) of the phase and run duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_value(value):
+    """Prometheus sample value"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values):
+    """{name="value",...} label set (empty string without labels)"""
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric:
+    """One metric family: a value per combination of label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(labels[name] for name in self.labelnames)
+
+    def set_function(self, function):
+        """Compute the value at scrape time: function() returns a number, or {label values: number}"""
+        self._function = function
+
+    def samples(self):
+        """(suffix, label names, label values, value) tuples"""
+        if self._function is not None:
+            values = self._function()
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [('', self.labelnames, key, value) for key, value in sorted(values.items())
+                if value is not None]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, names, values, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing total"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        samples = []
+        names = self.labelnames + ('le',)
+        for key, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                samples.append(('_bucket', names, key + (_format_value(bound),), count))
+            samples.append(('_sum', self.labelnames, key, total))
+            samples.append(('_count', self.labelnames, key, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """Named metric families rendered together"""
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def peak_rss_bytes():
+    """High-water mark of the process' resident set size (None if unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes():
+    """Current resident set size (None if unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+REGISTRY = MetricsRegistry()
+
+RUNS = REGISTRY.counter('matching_runs_total', 'Matching runs by mode and final status', ('mode', 'status'))
+RUN_SECONDS = REGISTRY.histogram('matching_run_seconds', 'Wall time of matching runs', ('mode',))
+PHASE_SECONDS = REGISTRY.histogram('matching_phase_seconds', 'Wall time of matching run phases',
+                                   ('mode', 'phase'))
+STUDENTS = REGISTRY.counter('matching_students_total', 'Students submitted to matching runs', ('mode',))
+NODES = REGISTRY.counter('matching_nodes_explored_total', 'Search nodes expanded by A* runs', ('mode',))
+LAST_RUN = REGISTRY.gauge('matching_last_run_info', 'Statistics of the most recent run of each mode',
+                          ('mode', 'stat'))
+PEAK_RSS = REGISTRY.gauge('process_peak_resident_memory_bytes', 'Peak resident set size of the process')
+PEAK_RSS.set_function(peak_rss_bytes)
+RSS = REGISTRY.gauge('process_resident_memory_bytes', 'Resident set size of the process')
+RSS.set_function(current_rss_bytes)
+
+# Search statistics copied from a matcher's result into the last-run gauges
+SEARCH_STATS = ('nodes_explored', 'peak_open_size', 'closed_size', 'rounds', 'edges_used',
+                'total_score', 'average_score', 'optimality_gap')
+
+# cProfile can only profile one run at a time in a process
+_profile_lock = threading.Lock()
+
+
+def log_event(event, **fields):
+    """Write one structured (JSON) log line"""
+    if Config.MATCH_STRUCTURED_LOGS:
+        logger.info(json.dumps({'event': event, 'time': round(time.time(), 3), **fields},
+                               default=str, sort_keys=True))
+
+
+def init_logging():
+    """Send the 'matching' logger's JSON lines to stderr unless logging is already configured"""
+    if Config.MATCH_STRUCTURED_LOGS and not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+class RunMetrics:
+    """Timers and statistics of one matching run (use as a context manager)"""
+
+    def __init__(self, mode, students, run_id=None, profile_dir=None):
+        """
+        Initialize the run's instrumentation
+
+        Args:
+            mode: Matching mode
+            students: Number of selected students
+            run_id: MatchRun id, used in logs and the profile file name
+            profile_dir: Dump a cProfile here (default: Config.MATCH_PROFILE_DIR)
+        """
+        self.mode = mode
+        self.students = students
+        self.run_id = run_id
+        self.profile_dir = profile_dir if profile_dir is not None else Config.MATCH_PROFILE_DIR
+        self.phases = OrderedDict()  # phase -> seconds
+        self.search = {}
+        self.status = None
+        self.profile_path = None
+        self._profiler = None
+        self._started = None
+
+    @contextmanager
+    def phase(self, name):
+        """Time one phase of the run"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            PHASE_SECONDS.observe(seconds, mode=self.mode, phase=name)
+            log_event('matching_phase', run_id=self.run_id, mode=self.mode, phase=name,
+                      seconds=round(seconds, 6))
+
+    def record_search(self, result):
+        """Keep the search statistics of a matcher's result dictionary"""
+        self.search = {key: result[key] for key in SEARCH_STATS if result.get(key) is not None}
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        if self.profile_dir:
+            if _profile_lock.acquire(blocking=False):
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+            else:
+                logger.info('Not profiling run %s: another run is being profiled', self.run_id)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler is not None:
+            self._profiler.disable()
+            try:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                self.profile_path = os.path.join(self.profile_dir, f'run-{self.run_id}-{self.mode}.prof')
+                self._profiler.dump_stats(self.profile_path)
+            except OSError as e:
+                logger.warning('Could not write profile of run %s: %s', self.run_id, e)
+                self.profile_path = None
+            finally:
+                self._profiler = None
+                _profile_lock.release()
+
+        elapsed = time.perf_counter() - self._started
+        self.status = self.status or ('failed' if exc_type else 'done')
+        RUNS.inc(mode=self.mode, status=self.status)
+        RUN_SECONDS.observe(elapsed, mode=self.mode)
+        STUDENTS.inc(self.students, mode=self.mode)
+        if 'nodes_explored' in self.search:
+            NODES.inc(self.search['nodes_explored'], mode=self.mode)
+        for stat, value in [('students', self.students), ('seconds', elapsed)] + list(self.search.items()):
+            LAST_RUN.set(value, mode=self.mode, stat=stat)
+
+        log_event('matching_run', run_id=self.run_id, mode=self.mode, status=self.status,
+                  students=self.students, seconds=round(elapsed, 6),
+                  phases={name: round(seconds, 6) for name, seconds in self.phases.items()},
+                  peak_rss_bytes=peak_rss_bytes(), profile=self.profile_path,
+                  error=str(exc) if exc else None, **self.search)
+        return False
@@ -1,9 +1,10 @@
 """
 Database Models for Roommate Matching System
-Defines Student and Match entities
+Defines Student, Hobby, MatchRun, Match and MatchGroup entities
 """
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import json
 
 db = SQLAlchemy()
 
@@ -12,7 +13,7 @@ class Student(db.Model):
     __tablename__ = 'students'
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     age = db.Column(db.Integer, nullable=False)
     gender = db.Column(db.String(20), nullable=False)
@@ -27,12 +28,21 @@ class Student(db.Model):
     # Hobbies stored as comma-separated string
     hobbies = db.Column(db.String(500), nullable=False)
     
+    # Normalized at write time (see FeatureStore): the five ordinal features
+    # packed as uint8 and the sorted Hobby ids packed as uint32
+    features = db.Column(db.LargeBinary, nullable=True)
+    hobby_ids = db.Column(db.LargeBinary, nullable=True)
+    
     # Timestamp
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Relationship to matches
     matches = db.relationship('Match', foreign_keys='Match.student1_id', backref='student1', lazy=True)
     
+    # Cached compatibility row (evicted together with the student)
+    compatibility = db.relationship('CompatibilityRow', uselist=False, lazy=True,
+                                    cascade='all, delete-orphan')
+    
     def get_hobbies_list(self):
         """Convert comma-separated hobbies to list"""
         if self.hobbies:
@@ -44,6 +54,8 @@ class Student(db.Model):
         return {
             'id': self.id,
             'name': self.name,
+            'age': self.age,
+            'gender': self.gender,
             'sleep_time': self.sleep_time,
             'study_time': self.study_time,
             'cleanliness': self.cleanliness,
@@ -56,16 +68,28 @@ class Student(db.Model):
         return f'<Student {self.name}>'
 
 
+class Hobby(db.Model):
+    """Hobby model - canonical vocabulary of normalized hobby names"""
+    __tablename__ = 'hobbies'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(500), unique=True, nullable=False)
+    
+    def __repr__(self):
+        return f'<Hobby {self.name}>'
+
+
 class Match(db.Model):
     """Match model - stores roommate pair assignments"""
     __tablename__ = 'matches'
     
     id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('match_runs.id'), nullable=True)
     student1_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     student2_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     
     # Compatibility score (0-100)
-    compatibility_score = db.Column(db.Float, nullable=False)
+    compatibility_score = db.Column(db.Float, nullable=False, index=True)
     
     # Match reasons (JSON-like string)
     reasons = db.Column(db.Text, nullable=True)
@@ -76,5 +100,143 @@ class Match(db.Model):
     # Get second student reference
     student2 = db.relationship('Student', foreign_keys=[student2_id], backref='matched_with')
     
+    # A run's pairs best first (results page), and a student's pair in a run (profile page)
+    __table_args__ = (
+        db.Index('ix_matches_run_score', 'run_id', 'compatibility_score'),
+        db.Index('ix_matches_student1_run', 'student1_id', 'run_id'),
+        db.Index('ix_matches_student2_run', 'student2_id', 'run_id'),
+    )
+    
     def __repr__(self):
         return f'<Match {self.student1_id}-{self.student2_id}: {self.compatibility_score}%>'
+
+
+class MatchGroup(db.Model):
+    """MatchGroup model - stores a room of three or more students"""
+    __tablename__ = 'match_groups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('match_runs.id'), nullable=False)
+    room_size = db.Column(db.Integer, nullable=False)
+    
+    # Average pair score inside the room (0-100) and the sum of its pair scores
+    compatibility_score = db.Column(db.Float, nullable=False)
+    total_score = db.Column(db.Float, nullable=False)
+    
+    # Match reasons (JSON-like string)
+    reasons = db.Column(db.Text, nullable=True)
+    
+    # Timestamp
+    matched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    members = db.relationship('MatchGroupMember', backref='group', lazy=True,
+                              cascade='all, delete-orphan')
+    
+    # A run's rooms best first (results page)
+    __table_args__ = (
+        db.Index('ix_match_groups_run_score', 'run_id', 'compatibility_score'),
+    )
+    
+    def __repr__(self):
+        return f'<MatchGroup {self.id} ({self.room_size}): {self.compatibility_score}%>'
+
+
+class MatchGroupMember(db.Model):
+    """MatchGroupMember model - one student's place in a MatchGroup"""
+    __tablename__ = 'match_group_members'
+    
+    group_id = db.Column(db.Integer, db.ForeignKey('match_groups.id'), primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True, index=True)
+    
+    student = db.relationship('Student')
+    
+    def __repr__(self):
+        return f'<MatchGroupMember {self.group_id}: {self.student_id}>'
+
+
+class MatchRun(db.Model):
+    """MatchRun model - one execution of a matching algorithm and its statistics"""
+    __tablename__ = 'match_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    mode = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, done, failed
+    
+    # Algorithm parameters and result statistics (JSON strings)
+    parameters = db.Column(db.Text, nullable=True)
+    stats = db.Column(db.Text, nullable=True)
+    
+    # Aggregates over the stored pairs
+    student_count = db.Column(db.Integer, nullable=False, default=0)
+    pair_count = db.Column(db.Integer, nullable=False, default=0)
+    group_count = db.Column(db.Integer, nullable=True)  # Rooms of a group run
+    total_score = db.Column(db.Float, nullable=True)
+    average_score = db.Column(db.Float, nullable=True)
+    min_score = db.Column(db.Float, nullable=True)
+    max_score = db.Column(db.Float, nullable=True)
+    
+    # Phase timings in seconds
+    load_time = db.Column(db.Float, nullable=True)
+    scoring_time = db.Column(db.Float, nullable=True)
+    matching_time = db.Column(db.Float, nullable=True)
+    saving_time = db.Column(db.Float, nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Pairs produced by this run
+    matches = db.relationship('Match', backref='run', lazy='dynamic', cascade='all, delete-orphan')
+    
+    # Rooms produced by a group run
+    groups = db.relationship('MatchGroup', backref='run', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def get_parameters(self):
+        """Decode the parameters JSON"""
+        return json.loads(self.parameters) if self.parameters else {}
+    
+    def get_stats(self):
+        """Decode the stats JSON"""
+        return json.loads(self.stats) if self.stats else {}
+    
+    def __repr__(self):
+        return f'<MatchRun {self.id} {self.mode} {self.status}>'
+
+
+class CompatibilityRow(db.Model):
+    """Cached compatibility scores of one student against every student with a smaller id"""
+    __tablename__ = 'compatibility_rows'
+    
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    
+    # Fingerprint of the weights the scores were computed with
+    version = db.Column(db.String(40), nullable=False, index=True)
+    
+    # Packed arrays: partner ids (int64) and scores in hundredths (uint16)
+    partner_ids = db.Column(db.LargeBinary, nullable=False)
+    scores = db.Column(db.LargeBinary, nullable=False)
+    
+    def __repr__(self):
+        return f'<CompatibilityRow {self.student_id} v{self.version[:8]}>'
+
+
+def upgrade_schema():
+    """
+    Add columns introduced after a database was created
+    
+    db.create_all() only creates missing tables, so columns added to an
+    existing table (all nullable) are appended here with ALTER TABLE, and
+    indexes declared since are created.
+    """
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    conn.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
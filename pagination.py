@@ -0,0 +1,109 @@
+"""
+Pagination Module
+Keyset (seek) pagination for large listings
+
+OFFSET pagination makes the database walk and discard every skipped row, so
+deep pages get slower as tables grow. Keyset pagination instead remembers the
+sort key of the last row shown and asks for the rows strictly after it, which
+an index on the sort columns answers in constant time for any page.
+
+The position is carried between requests as an opaque URL-safe cursor.
+"""
+from config import Config
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, cursor, next_cursor, per_page):
+        self.items = items
+        self.cursor = cursor  # Cursor this page was loaded with (None for the first page)
+        self.next_cursor = next_cursor  # Cursor of the following page (None on the last page)
+        self.per_page = per_page
+
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    """Encode sort-key values as a URL-safe cursor string"""
+    payload = [
+        {'dt': value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor string (None if it is missing or malformed)"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return [
+            datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+            for value in payload
+        ]
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def after_condition(order, values):
+    """
+    Rows strictly after values in the given ordering
+
+    Expands (a, b, c) > (x, y, z) into
+    a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z),
+    flipping the comparison for descending columns.
+    """
+    clauses = []
+    for k, (column, descending) in enumerate(order):
+        equal = [order[i][0] == values[i] for i in range(k)]
+        beyond = column < values[k] if descending else column > values[k]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, order, cursor=None, per_page=None):
+    """
+    Fetch one page of a query with keyset pagination
+
+    Args:
+        query: Filtered SQLAlchemy query
+        order: List of (column, descending) pairs; the last column must be
+            unique (e.g. the primary key) so the order is total
+        cursor: Cursor of the page to load (None for the first page)
+        per_page: Rows per page (default: Config.PAGE_SIZE)
+
+    Returns:
+        KeysetPage
+    """
+    per_page = per_page or Config.PAGE_SIZE
+    values = decode_cursor(cursor)
+    if values is not None and len(values) == len(order):
+        query = query.filter(after_condition(order, values))
+    else:
+        cursor = None
+
+    query = query.order_by(*[column.desc() if descending else column.asc()
+                             for column, descending in order])
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column, _ in order])
+    return KeysetPage(items, cursor, next_cursor, per_page)
@@ -0,0 +1,120 @@
+"""
+Parallel Scoring Module
+Multiprocess computation of the pairwise score matrix for large cohorts
+
+The upper triangle of the n x n matrix is cut into square tiles that a
+process pool scores independently. Workers write their tiles (and the
+mirrored lower-triangle tiles) straight into a shared-memory buffer, so no
+scores are pickled back to the parent. Every entry is written by exactly one
+tile and computed by SimilarityEngine.calculate_similarity_block, so the
+result is deterministic and bit-identical to the serial path regardless of
+worker count or scheduling.
+"""
+from config import Config
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+from similarity_engine import SimilarityEngine
+
+# Per-process state installed by _init_worker
+_worker = {}
+
+
+def resolve_workers(workers=None):
+    """Number of scoring processes (0 means one per CPU core)"""
+    if workers is None:
+        workers = Config.SCORING_WORKERS
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    return max(int(workers), 1)
+
+
+def process_pool(workers, initializer=None, initargs=()):
+    """
+    Process pool whose workers are spawned rather than forked
+
+    Matching runs on MatchJobQueue threads, and forking a multithreaded
+    process copies whatever locks the other threads hold into the child.
+    Spawned workers start from a fresh interpreter instead.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=initializer, initargs=initargs)
+
+
+def upper_triangle_tiles(n, tile_size):
+    """(row_start, row_stop, col_start, col_stop) tiles covering i <= j, in a fixed order"""
+    starts = range(0, n, tile_size)
+    return [
+        (r0, min(r0 + tile_size, n), c0, min(c0 + tile_size, n))
+        for r0 in starts for c0 in starts if c0 >= r0
+    ]
+
+
+def _init_worker(weights, encoded, shm_name, n):
+    """Attach a worker to the shared result buffer"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['matrix'] = np.ndarray((n, n), dtype=np.float64, buffer=shm.buf)
+    _worker['engine'] = SimilarityEngine(weights)
+    _worker['encoded'] = encoded
+
+
+def _score_tile(tile):
+    """Score one tile and write it (and its mirror) into the shared matrix"""
+    r0, r1, c0, c1 = tile
+    matrix = _worker['matrix']
+    block = _worker['engine'].calculate_similarity_block(
+        _worker['encoded'], slice(r0, r1), slice(c0, c1)
+    )
+    matrix[r0:r1, c0:c1] = block
+    if c0 != r0:
+        matrix[c0:c1, r0:r1] = block.T
+    return tile
+
+
+def calculate_similarity_matrix_parallel(similarity_engine, student_vectors,
+                                         workers=None, tile_size=None, encoded=None):
+    """
+    Calculate the full n x n score matrix on a process pool
+
+    Args:
+        similarity_engine: SimilarityEngine whose weights are used
+        student_vectors: List of student vector dictionaries
+        workers: Number of processes (default: Config.SCORING_WORKERS)
+        tile_size: Tile edge length (default: Config.SCORING_TILE_SIZE)
+        encoded: Optional pre-encoded cohort; student_vectors is then ignored
+
+    Returns:
+        Float64 array identical to SimilarityEngine.calculate_similarity_matrix
+    """
+    workers = resolve_workers(workers)
+    tile_size = tile_size or Config.SCORING_TILE_SIZE
+    if encoded is None:
+        encoded = similarity_engine.encode_students(student_vectors)
+    n = len(encoded['ids'])
+    if n == 0:
+        return np.zeros((0, 0), dtype=np.float64)
+
+    shm = shared_memory.SharedMemory(create=True, size=n * n * np.dtype(np.float64).itemsize)
+    try:
+        shared = np.ndarray((n, n), dtype=np.float64, buffer=shm.buf)
+        tiles = upper_triangle_tiles(n, tile_size)
+        with process_pool(
+            min(workers, len(tiles)),
+            initializer=_init_worker,
+            initargs=(similarity_engine.weights, encoded, shm.name, n)
+        ) as pool:
+            for _ in pool.map(_score_tile, tiles):
+                pass
+
+        matrix = shared.copy()
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+
+    np.fill_diagonal(matrix, 0.0)
+    return matrix
@@ -0,0 +1,227 @@
+"""
+Partitioned Matcher Module
+Constrained matching: the cohort's independent blocks matched in parallel
+
+MatchConstraints.partition splits a cohort into blocks that no allowed pair
+crosses, so the optimal constrained matching is the union of the optimal
+matchings of the blocks. Each block is scored and matched on its own by the
+selected matcher (A*, blossom, greedy or stable), either serially or on a process
+pool, and the per-block results are merged into one result dictionary of
+the usual shape:
+
+    - scores are computed per block only; no cross-block pair is scored
+    - forbidden pairs left inside a block (age gaps along a long age chain)
+      score 0 in the block's matrix, worth exactly as much as leaving both
+      students unmatched, and are dropped from the block's result, so the
+      exact matchers stay exact for the constrained problem
+    - students alone in their block are reported as unmatched
+"""
+from config import Config
+import time
+
+from similarity_engine import SimilarityEngine, AStarMatcher
+from blossom_matcher import BlossomMatcher
+from local_search import LocalSearchMatcher
+from stable_roommates import StableRoommatesMatcher, BLOCKING_EXAMPLES
+from parallel_scoring import process_pool, resolve_workers
+from constraints import MatchConstraints
+
+# Statistics summed, and statistics maximized, over the blocks
+SUMMED_STATS = ('nodes_explored', 'closed_size', 'edges_used', 'swaps', 'upper_bound', 'greedy_score',
+                'proposals', 'rotations', 'blocking_pairs')
+MAXIMIZED_STATS = ('peak_open_size', 'rounds', 'passes')
+
+# Stop reasons of a block that finished its search
+COMPLETE_REASONS = ('optimal', 'converged', 'stable')
+
+# Statistics of a run whose blocks all had fewer than two students
+EMPTY_STATS = {
+    'astar': {'nodes_explored': 0, 'optimal': True, 'stop_reason': 'optimal', 'optimality_gap': 0.0},
+    'blossom': {'rounds': 0, 'edges_used': 0},
+    'greedy': {'greedy_score': 0.0, 'upper_bound': 0.0, 'optimality_gap': 0.0,
+               'bound_heuristic': 'best_partner', 'passes': 0, 'swaps': 0, 'stop_reason': 'converged'},
+    'stable': {'stable': True, 'stop_reason': 'stable', 'blocking_pairs': 0, 'blocking_scope': 'all_pairs',
+               'blocking_examples': [], 'proposals': 0, 'rotations': 0, 'candidate_k': Config.STABLE_CANDIDATES}
+}
+
+
+def match_block(mode, constraints, block_vectors, encoded, weights=None, progress=None):
+    """
+    Score and match one block (runs in a worker process when parallel)
+
+    Args:
+        mode: 'astar', 'blossom', 'greedy' or 'stable'
+        constraints: MatchConstraints of the run
+        block_vectors: Student vectors of the block
+        encoded: The block's encoded features, aligned with block_vectors
+        weights: Scoring weights (default: Config.WEIGHTS)
+        progress: Optional progress callable (serial runs only)
+
+    Returns:
+        The matcher's result dictionary with forbidden pairs removed
+    """
+    similarity_engine = SimilarityEngine(weights)
+    if mode == 'greedy':
+        matcher = LocalSearchMatcher(similarity_engine, progress=progress,
+                                     allowed=constraints.pair_filter(block_vectors))
+        return matcher.match_students(block_vectors, encoded=encoded)
+    if mode == 'stable':
+        matcher = StableRoommatesMatcher(similarity_engine, progress=progress,
+                                         allowed=constraints.pair_filter(block_vectors))
+        return matcher.match_students(block_vectors, encoded=encoded)
+
+    score_matrix = similarity_engine.calculate_similarity_matrix(None, workers=1, encoded=encoded)
+    forbidden = constraints.forbidden_mask(block_vectors)
+    if forbidden is not None:
+        score_matrix[forbidden] = 0.0
+
+    if mode == 'blossom':
+        result = BlossomMatcher(similarity_engine).match_students(block_vectors, score_matrix)
+    else:
+        result = AStarMatcher(similarity_engine, progress=progress).match_students(block_vectors, score_matrix)
+
+    if forbidden is not None:
+        position = {student['id']: p for p, student in enumerate(block_vectors)}
+        kept = []
+        for pair in result['matches']:
+            if forbidden[position[pair[0]], position[pair[1]]]:
+                result['unmatched'].extend(pair[:2])
+            else:
+                kept.append(pair)
+        result['matches'] = kept
+        result['alternatives'] = similarity_engine.unmatched_alternatives(
+            result['unmatched'], block_vectors, kept, lambda rows: score_matrix[rows])
+    return result
+
+
+class PartitionedMatcher:
+    """Runs a matcher on each independent block of a constrained cohort"""
+
+    def __init__(self, mode, constraints=None, similarity_engine=None, workers=None, progress=None):
+        """
+        Initialize the partitioned matcher
+
+        Args:
+            mode: 'astar', 'blossom', 'greedy' or 'stable'
+            constraints: MatchConstraints (default: from Config)
+            similarity_engine: SimilarityEngine providing weights and reasons
+            workers: Processes matching blocks (default: Config.MATCH_BLOCK_WORKERS;
+                1 = serial, 0 = one per CPU core)
+            progress: Optional callable receiving progress keyword arguments
+        """
+        self.mode = mode
+        self.constraints = constraints or MatchConstraints()
+        self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.workers = resolve_workers(Config.MATCH_BLOCK_WORKERS if workers is None else workers)
+        self.progress = progress
+
+    def match_students(self, student_vectors, encoded=None):
+        """
+        Match every block of a cohort and merge the results
+
+        Args:
+            student_vectors: List of student vector dictionaries
+            encoded: Optional pre-encoded cohort aligned with student_vectors
+                (e.g. FeatureStore.load_encoded)
+
+        Returns:
+            Dictionary with matches and statistics, as returned by the mode's
+            matcher, plus the number of blocks and the largest block's size
+        """
+        started = time.perf_counter()
+        if encoded is None:
+            encoded = self.similarity_engine.encode_students(student_vectors)
+        blocks = self.constraints.partition(student_vectors)
+        jobs = [(b, block) for b, block in enumerate(blocks) if len(block) >= 2]
+        results = [None] * len(blocks)
+
+        def arguments(block):
+            block_vectors = [student_vectors[p] for p in block]
+            return (self.mode, self.constraints, block_vectors,
+                    LocalSearchMatcher.subset(encoded, block), self.similarity_engine.weights)
+
+        if self.progress:
+            self.progress(blocks=len(blocks), blocks_done=len(blocks) - len(jobs))
+        workers = min(self.workers, len(jobs))
+        if workers <= 1 or len(student_vectors) < Config.MATCH_BLOCK_PARALLEL_THRESHOLD:
+            for done, (b, block) in enumerate(jobs, 1):
+                results[b] = match_block(*arguments(block), progress=self.progress)
+                if self.progress:
+                    self.progress(blocks_done=len(blocks) - len(jobs) + done)
+        else:
+            # Largest blocks first, so no worker is left with a big block at the end
+            jobs.sort(key=lambda job: -len(job[1]))
+            with process_pool(workers) as pool:
+                futures = [(b, pool.submit(match_block, *arguments(block))) for b, block in jobs]
+                for done, (b, future) in enumerate(futures, 1):
+                    results[b] = future.result()
+                    if self.progress:
+                        self.progress(blocks_done=len(blocks) - len(jobs) + done)
+
+        return self.merge(student_vectors, blocks, results, time.perf_counter() - started)
+
+    def merge(self, student_vectors, blocks, results, elapsed):
+        """Combine per-block results (None for single-student blocks) into one"""
+        matches = []
+        unmatched = []
+        alternatives = {}
+        merged = {}
+        stop_reasons = []
+        for block, result in zip(blocks, results):
+            if result is None:
+                # Nobody in the block: no allowed partner at all
+                unmatched.extend(student_vectors[p]['id'] for p in block)
+                alternatives.update((student_vectors[p]['id'], []) for p in block)
+                continue
+            matches.extend(result['matches'])
+            unmatched.extend(result['unmatched'])
+            alternatives.update(result['alternatives'])
+            for key in SUMMED_STATS:
+                if key in result:
+                    merged[key] = merged.get(key, 0) + result[key]
+            for key in MAXIMIZED_STATS:
+                if key in result:
+                    merged[key] = max(merged.get(key, 0), result[key])
+            for key in ('heuristic', 'bound_heuristic', 'candidate_k'):
+                if result.get(key) is not None:
+                    merged.setdefault(key, result[key])
+            if result.get('stop_reason'):
+                stop_reasons.append(result['stop_reason'])
+            for key in ('optimal', 'stable'):
+                if key in result:
+                    merged[key] = merged.get(key, True) and result[key]
+            if result.get('blocking_scope') and merged.get('blocking_scope') != 'preference_lists':
+                # A single block checked only against its lists narrows the whole run's claim
+                merged['blocking_scope'] = result['blocking_scope']
+            if result.get('blocking_examples'):
+                merged['blocking_examples'] = (merged.get('blocking_examples', [])
+                                               + result['blocking_examples'])[:BLOCKING_EXAMPLES]
+
+        total_score = sum(pair[2] for pair in matches)
+        merged.update({
+            'matches': matches,
+            'total_score': round(total_score, 2),
+            'average_score': round(total_score / len(matches), 2) if matches else 0.0,
+            'search_time': round(elapsed, 3),
+            'unmatched': unmatched,
+            'alternatives': alternatives,
+            'blocks': len(blocks),
+            'largest_block': max((len(block) for block in blocks), default=0),
+            'constraints': self.constraints.to_dict()
+        })
+        if stop_reasons:
+            # The first block that did not finish its search explains the run
+            incomplete = [reason for reason in stop_reasons if reason not in COMPLETE_REASONS]
+            merged['stop_reason'] = incomplete[0] if incomplete else stop_reasons[0]
+        if 'upper_bound' in merged:
+            bound = merged['upper_bound']
+            gap = 100.0 * (bound - total_score) / bound if bound > 0 else 0.0
+            merged['upper_bound'] = round(bound, 2)
+            merged['optimality_gap'] = round(max(gap, 0.0), 2)
+        if 'greedy_score' in merged:
+            merged['greedy_score'] = round(merged['greedy_score'], 2)
+        for key, value in EMPTY_STATS[self.mode].items():
+            merged.setdefault(key, value)
+        if self.mode == 'astar':
+            merged.setdefault('heuristic', Config.ASTAR_HEURISTIC)
+        return merged
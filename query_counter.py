@@ -0,0 +1,71 @@
+"""
+Query Counter Module
+Instrumentation hook counting the SQL statements issued by the app
+
+QueryCounter is a context manager that records every statement executed on
+the database engine while it is active, so a test or a benchmark can assert
+that a page takes a constant number of queries:
+
+    with app.app_context(), QueryCounter() as counter:
+        client.get('/results')
+    assert counter.count <= 3
+
+init_query_counting additionally counts the statements of every request and
+reports the total in an X-Query-Count response header when
+Config.QUERY_COUNT_HEADER is enabled.
+"""
+import threading
+
+from flask import g, has_app_context
+from sqlalchemy import event
+
+from models import db
+
+
+class QueryCounter:
+    """Count the SQL statements executed on an engine (thread-local)"""
+
+    def __init__(self, engine=None):
+        """Initialize the counter (default engine: the Flask-SQLAlchemy one)"""
+        self.engine = engine
+        self.statements = []
+        self._thread = None
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        if self.engine is None:
+            self.engine = db.engine
+        self._thread = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+def init_query_counting(app):
+    """Count statements per request and expose the count as X-Query-Count"""
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_app_context():
+            g.query_count = g.get('query_count', 0) + 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+
+    @app.before_request
+    def reset_query_count():
+        g.query_count = 0
+
+    @app.after_request
+    def add_query_count_header(response):
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        return response
@@ -0,0 +1,148 @@
+"""
+Response Cache Module
+In-process cache of rendered read-only pages, invalidated by a data version
+
+The home, students, results and profile pages are read far more often than
+anything is written, yet every view re-ran its count and list queries and
+re-rendered its template. ResponseCache keeps the rendered pages in an LRU
+keyed by path and query string:
+
+    - every write (registration, import, a saved matching run, reset) calls
+      bump(), which increments the data version and drops every entry, so a
+      page is never served from before the last write in this process
+    - entries also expire after Config.RESPONSE_CACHE_TTL seconds, which
+      bounds staleness after writes made by another process (e.g. the
+      import-students CLI command)
+    - responses carry an ETag (hash of the body) and a Last-Modified date
+      (time of the last write), and conditional GETs are answered with 304
+
+A hit is served without running the view, so it issues no SQL at all.
+Requests with pending flash messages bypass the cache: the page has to
+render (and consume) them.
+
+    response_cache = ResponseCache()
+
+    @app.route('/results')
+    @response_cache.cached
+    def results():
+        ...
+"""
+from config import Config
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+from metrics import REGISTRY
+
+REQUESTS = REGISTRY.counter('response_cache_requests_total', 'Cacheable page requests by outcome',
+                            ('result',))
+
+
+class CachedPage:
+    """A rendered page and its validators"""
+
+    def __init__(self, body, mimetype, version):
+        self.body = body
+        self.mimetype = mimetype
+        self.version = version
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.stored_at = time.monotonic()
+
+
+class ResponseCache:
+    """LRU of rendered pages, valid for one data version and at most TTL seconds"""
+
+    def __init__(self, max_entries=None, ttl=None, enabled=None):
+        """
+        Initialize an empty cache
+
+        Args:
+            max_entries: Pages kept at most (default: Config.RESPONSE_CACHE_SIZE)
+            ttl: Seconds a page stays valid (default: Config.RESPONSE_CACHE_TTL; 0 = no limit)
+            enabled: Serve pages from the cache (default: Config.RESPONSE_CACHE_ENABLED);
+                validators and 304 answers are sent either way
+        """
+        self.max_entries = Config.RESPONSE_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = Config.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.enabled = Config.RESPONSE_CACHE_ENABLED if enabled is None else enabled
+        self.version = 0
+        self.modified_at = self._now()
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _now():
+        # HTTP dates have one-second resolution
+        return datetime.now(timezone.utc).replace(microsecond=0)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def bump(self):
+        """Record a write: every cached page is stale from now on"""
+        with self._lock:
+            self.version += 1
+            self.modified_at = self._now()
+            self._pages.clear()
+
+    def get(self, key):
+        """Cached page for a key, or None if missing, from an older version or expired"""
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                return None
+            if page.version != self.version or (self.ttl and time.monotonic() - page.stored_at > self.ttl):
+                del self._pages[key]
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def put(self, key, page):
+        """Store a page unless the data changed while it was rendered"""
+        with self._lock:
+            if page.version != self.version:
+                return
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def respond(self, page):
+        """Response for a cached page, 304 if the client's copy is current"""
+        response = Response(page.body, mimetype=page.mimetype)
+        response.set_etag(page.etag)
+        response.last_modified = self.modified_at
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def cached(self, view):
+        """Decorator caching a view's successful GET responses"""
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or '_flashes' in session:
+                REQUESTS.inc(result='bypass')
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            page = self.get(key) if self.enabled else None
+            if page is not None:
+                REQUESTS.inc(result='hit')
+                return self.respond(page)
+
+            REQUESTS.inc(result='miss')
+            version = self.version
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            page = CachedPage(response.get_data(), response.mimetype, version)
+            if self.enabled:
+                self.put(key, page)
+            return self.respond(page)
+
+        return wrapper
@@ -5,8 +5,21 @@ Previously used KNN-style distance calculation, now upgraded to A* for optimal s
 """
 from config import Config
 import heapq
+import time
+import numpy as np
 from typing import List, Dict, Tuple, Set
 
+from astar_heuristics import make_heuristic, mask_indices
+
+# Ordinal features in vector order with the range used to normalize each difference
+ORDINAL_FEATURES = (
+    ('sleep_time', 2.0),
+    ('study_time', 3.0),
+    ('cleanliness', 4.0),
+    ('noise_tolerance', 4.0),
+    ('personality', 2.0),
+)
+
 class SimilarityEngine:
     """Calculate similarity scores between students using weighted distance metrics"""
     
@@ -70,31 +83,59 @@ class SimilarityEngine:
         
         return intersection / union if union > 0 else 0.0
     
-    def calculate_similarity_score(self, student1_vector, student2_vector):
+    def calculate_ordinal_distance(self, student1_vector, student2_vector):
+        """Weighted distance over the five ordinal features only (hobbies excluded)"""
+        weights = self.weights
+        total_distance = 0.0
+        for name, scale in ORDINAL_FEATURES:
+            diff = abs(student1_vector[name] - student2_vector[name]) / scale
+            total_distance += weights[name] * diff
+        return total_distance
+    
+    def score_from_parts(self, ordinal_distance, hobby_overlap):
         """
-        Convert distance to similarity score (0-100 scale)
-        Also generate reasons for the match
+        Combine an ordinal distance and a hobby overlap into the final score
+        
+        The score is non-decreasing in hobby_overlap, so passing 1.0 gives an
+        upper bound for every student with the same ordinal features.
         """
-        distance = self.calculate_distance(student1_vector, student2_vector)
+        total_distance = ordinal_distance + self.weights['hobbies'] * (1.0 - hobby_overlap)
         
         # Convert distance (0-1) to similarity score (100-0)
-        # Apply bonus for high hobby overlap
-        base_score = (1.0 - distance) * 100
-        
-        hobby_overlap = self.calculate_hobby_overlap(
-            student1_vector['hobbies'], 
-            student2_vector['hobbies']
-        )
+        base_score = (1.0 - total_distance) * 100
         
         # Apply bonus multiplier if hobby overlap is high
         if hobby_overlap > 0.5:
             base_score *= Config.HOBBY_OVERLAP_BONUS
             base_score = min(base_score, 100)  # Cap at 100
         
+        return round(base_score, 2)
+    
+    def calculate_score(self, student1_vector, student2_vector):
+        """
+        Scoring-only fast path: similarity score (0-100 scale) without reasons
+        
+        Computes the hobby overlap once and reuses it for both the distance
+        and the bonus rule. Returns the same value as calculate_similarity_score.
+        """
+        hobby_overlap = self.calculate_hobby_overlap(
+            student1_vector['hobbies'], 
+            student2_vector['hobbies']
+        )
+        ordinal_distance = self.calculate_ordinal_distance(student1_vector, student2_vector)
+        return self.score_from_parts(ordinal_distance, hobby_overlap)
+    
+    def calculate_similarity_score(self, student1_vector, student2_vector):
+        """
+        Convert distance to similarity score (0-100 scale)
+        Also generate reasons for the match
+        """
+        score = self.calculate_score(student1_vector, student2_vector)
+        
         # Generate match reasons
         reasons = self.generate_match_reasons(student1_vector, student2_vector)
         
-        return round(base_score, 2), reasons
+        return score, reasons
     
     def generate_match_reasons(self, student1_vector, student2_vector):
         """Generate human-readable reasons for why two students are compatible"""
@@ -127,37 +168,304 @@ class SimilarityEngine:
             reasons.append(f"Both have {personality_labels[student1_vector['personality']]} personality")
         
         # Hobby overlap
-        hobby_overlap = self.calculate_hobby_overlap(
-            student1_vector['hobbies'], 
-            student2_vector['hobbies']
-        )
-        if hobby_overlap > 0:
-            common_hobbies = set(student1_vector['hobbies']).intersection(
-                set(student2_vector['hobbies'])
-            )
-            if len(common_hobbies) > 0:
-                reasons.append(f"Share hobbies: {', '.join(list(common_hobbies)[:3])}")
+        common_hobbies = set(student1_vector['hobbies']).intersection(student2_vector['hobbies'])
+        if common_hobbies:
+            reasons.append(f"Share hobbies: {', '.join(list(common_hobbies)[:3])}")
         
         return reasons if reasons else ["Balanced overall compatibility"]
+
+    def generate_group_reasons(self, student_vectors):
+        """Generate human-readable reasons for why a room of students is compatible"""
+        reasons = []
+
+        sleep_times = {s['sleep_time'] for s in student_vectors}
+        if len(sleep_times) == 1:
+            sleep_labels = {0: "early birds", 1: "moderate sleepers", 2: "night owls"}
+            reasons.append(f"All are {sleep_labels[sleep_times.pop()]}")
+
+        study_times = {s['study_time'] for s in student_vectors}
+        if len(study_times) == 1:
+            study_labels = {0: "morning studiers", 1: "afternoon studiers",
+                          2: "evening studiers", 3: "night studiers"}
+            reasons.append(f"All prefer {study_labels[study_times.pop()]}")
+
+        cleanliness = [s['cleanliness'] for s in student_vectors]
+        if max(cleanliness) - min(cleanliness) <= 1:
+            reasons.append("Similar cleanliness standards")
+
+        noise = [s['noise_tolerance'] for s in student_vectors]
+        if max(noise) - min(noise) <= 1:
+            reasons.append("Compatible noise tolerance levels")
+
+        personalities = {s['personality'] for s in student_vectors}
+        if len(personalities) == 1:
+            personality_labels = {0: "introverted", 1: "balanced", 2: "extroverted"}
+            reasons.append(f"All have {personality_labels[personalities.pop()]} personality")
+
+        # Hobbies shared by at least two roommates, most widely shared first
+        hobby_counts = {}
+        for student in student_vectors:
+            for hobby in set(student['hobbies']):
+                hobby_counts[hobby] = hobby_counts.get(hobby, 0) + 1
+        shared = sorted((h for h, c in hobby_counts.items() if c >= 2), key=lambda h: -hobby_counts[h])
+        if shared:
+            reasons.append(f"Share hobbies: {', '.join(shared[:3])}")
+
+        return reasons if reasons else ["Balanced overall compatibility"]
+
+    def attach_reasons(self, pairs, student_vectors):
+        """
+        Generate reasons on demand for a list of selected pairs
+        
+        Args:
+            pairs: List of (student1_id, student2_id, score) tuples
+            student_vectors: Student vectors covering every id in pairs
+        
+        Returns:
+            List of (student1_id, student2_id, score, reasons) tuples
+        """
+        by_id = {s['id']: s for s in student_vectors}
+        return [
+            (id1, id2, score, self.generate_match_reasons(by_id[id1], by_id[id2]))
+            for id1, id2, score in pairs
+        ]
     
-    def calculate_all_similarities(self, student_vectors):
+    def unmatched_alternatives(self, unmatched, student_vectors, matches, score_rows, k=None):
         """
-        Calculate similarity scores between all pairs of students
-        Returns a dictionary: {(id1, id2): (score, reasons)}
+        Best partners an unmatched student could have had
+        
+        Args:
+            unmatched: Ids of the unmatched students
+            student_vectors: Student vectors of the cohort
+            matches: The run's (student1_id, student2_id, score, ...) pairs
+            score_rows: Callable mapping a list of cohort positions to their
+                score rows against the whole cohort (non-positive scores,
+                e.g. forbidden pairs, are never suggested)
+            k: Alternatives per student (default: Config.UNMATCHED_ALTERNATIVES)
+        
+        Returns:
+            {student_id: [{'id', 'name', 'score', 'partner_id'}, ...]}, best
+            first; partner_id is who the alternative was matched with instead
+        """
+        k = k or Config.UNMATCHED_ALTERNATIVES
+        if not unmatched:
+            return {}
+        position = {s['id']: p for p, s in enumerate(student_vectors)}
+        partner = {}
+        for pair in matches:
+            partner[pair[0]], partner[pair[1]] = pair[1], pair[0]
+        
+        rows = np.asarray(score_rows([position[sid] for sid in unmatched]), dtype=np.float64)
+        alternatives = {}
+        for sid, row in zip(unmatched, rows):
+            row = row.copy()
+            row[position[sid]] = -np.inf
+            best = np.argsort(-row, kind='stable')[:k]
+            alternatives[sid] = [{
+                'id': student_vectors[j]['id'],
+                'name': student_vectors[j]['name'],
+                'score': round(float(row[j]), 2),
+                'partner_id': partner.get(student_vectors[j]['id'])
+            } for j in best.tolist() if row[j] > 0]
+        return alternatives
+    
+    def encode_students(self, student_vectors):
+        """
+        Encode student vectors into NumPy arrays for batch scoring
+        
+        Returns a dictionary with:
+            ids: student ids, shape (n,)
+            ordinals: the five ordinal features, shape (n, 5)
+            hobbies: multi-hot hobby matrix, shape (n, n_hobbies)
+            hobby_counts: number of distinct hobbies per student, shape (n,)
+            vocabulary: hobby name for each hobby column
         """
-        similarities = {}
         n = len(student_vectors)
+        ordinals = np.array(
+            [[s[name] for name, _ in ORDINAL_FEATURES] for s in student_vectors],
+            dtype=np.int64
+        ).reshape(n, len(ORDINAL_FEATURES))
+        
+        vocabulary = {}
+        rows, cols = [], []
+        for i, student in enumerate(student_vectors):
+            for hobby in set(student['hobbies']):
+                rows.append(i)
+                cols.append(vocabulary.setdefault(hobby, len(vocabulary)))
+        
+        # float32 keeps the matrix product on BLAS; counts stay exact integers
+        hobbies = np.zeros((n, len(vocabulary)), dtype=np.float32)
+        hobbies[rows, cols] = 1.0
+        
+        return {
+            'ids': np.array([s['id'] for s in student_vectors], dtype=np.int64),
+            'ordinals': ordinals,
+            'hobbies': hobbies,
+            'hobby_counts': hobbies.sum(axis=1).astype(np.int64),
+            'vocabulary': list(vocabulary)
+        }
+    
+    def calculate_similarity_block(self, encoded, rows, cols=None):
+        """
+        Score a block of the pairwise matrix with NumPy broadcasting
         
-        for i in range(n):
-            for j in range(i + 1, n):
-                student1 = student_vectors[i]
-                student2 = student_vectors[j]
-                
-                score, reasons = self.calculate_similarity_score(student1, student2)
-                
+        Performs the same floating-point operations in the same order as
+        calculate_distance/calculate_similarity_score, so every entry is
+        bit-identical to the scalar score.
+        
+        Args:
+            encoded: Output of encode_students
+            rows: Slice or index array selecting the block rows
+            cols: Slice or index array selecting the block columns (default: all)
+        
+        Returns:
+            Float64 array of scores (0-100, two decimals)
+        """
+        if cols is None:
+            cols = slice(None)
+        ord_r = encoded['ordinals'][rows]
+        ord_c = encoded['ordinals'][cols]
+        
+        distance = np.zeros((ord_r.shape[0], ord_c.shape[0]), dtype=np.float64)
+        for k, (name, scale) in enumerate(ORDINAL_FEATURES):
+            diff = np.abs(ord_r[:, k, None] - ord_c[None, :, k]) / scale
+            distance += self.weights[name] * diff
+        
+        # Jaccard similarity from a matrix product of the multi-hot rows
+        hob_r = encoded['hobbies'][rows]
+        hob_c = encoded['hobbies'][cols]
+        intersection = (hob_r @ hob_c.T).astype(np.int64)
+        cnt_r = encoded['hobby_counts'][rows][:, None]
+        cnt_c = encoded['hobby_counts'][cols][None, :]
+        return self.combine_scores(distance, intersection, cnt_r, cnt_c)
+    
+    def calculate_pair_scores(self, encoded, rows, cols):
+        """
+        Score the pairs (rows[t], cols[t]) elementwise
+        
+        Same operations as calculate_similarity_block, for a list of pairs
+        instead of a full block, so scores are identical to the matrix entries.
+        
+        Args:
+            encoded: Output of encode_students
+            rows: Index array of the first students
+            cols: Index array of the second students (same length)
+        
+        Returns:
+            Float64 array of scores (0-100, two decimals)
+        """
+        ord_r = encoded['ordinals'][rows]
+        ord_c = encoded['ordinals'][cols]
+        
+        distance = np.zeros(ord_r.shape[0], dtype=np.float64)
+        for k, (name, scale) in enumerate(ORDINAL_FEATURES):
+            diff = np.abs(ord_r[:, k] - ord_c[:, k]) / scale
+            distance += self.weights[name] * diff
+        
+        intersection = np.einsum('ij,ij->i', encoded['hobbies'][rows], encoded['hobbies'][cols]).astype(np.int64)
+        cnt_r = encoded['hobby_counts'][rows]
+        cnt_c = encoded['hobby_counts'][cols]
+        return self.combine_scores(distance, intersection, cnt_r, cnt_c)
+    
+    def combine_scores(self, distance, intersection, cnt_r, cnt_c):
+        """
+        Finish a batch of scores from ordinal distances and hobby set sizes
+        
+        Args:
+            distance: Weighted ordinal distances
+            intersection: Shared hobby counts
+            cnt_r, cnt_c: Hobby counts of both students (broadcastable)
+        
+        Returns:
+            Float64 array of scores (0-100, two decimals)
+        """
+        union = cnt_r + cnt_c - intersection
+        with np.errstate(divide='ignore', invalid='ignore'):
+            overlap = np.where(union > 0, intersection / np.maximum(union, 1), 0.0)
+        overlap = np.where((cnt_r == 0) | (cnt_c == 0), 0.0, overlap)
+        overlap = np.where((cnt_r == 0) & (cnt_c == 0), 0.5, overlap)
+        
+        distance += self.weights['hobbies'] * (1.0 - overlap)
+        
+        base_score = (1.0 - distance) * 100
+        bonus = overlap > 0.5
+        base_score[bonus] = np.minimum(base_score[bonus] * Config.HOBBY_OVERLAP_BONUS, 100)
+        
+        return self.round_scores(base_score)
+    
+    @staticmethod
+    def round_scores(scores):
+        """
+        Round scores to two decimals exactly like Python's round()
+        
+        np.round scales by 100 before rounding, which can pick a different
+        neighbour than round() when the scaled value sits on a .5 boundary.
+        Those rare entries are re-rounded with the builtin.
+        """
+        rounded = np.round(scores, 2)
+        scaled = scores * 100
+        frac = np.abs(scaled - np.floor(scaled) - 0.5)
+        for idx in zip(*np.nonzero(frac < 1e-6)):
+            rounded[idx] = round(float(scores[idx]), 2)
+        return rounded
+    
+    def calculate_similarity_matrix(self, student_vectors, block_size=1024, workers=None, encoded=None):
+        """
+        Calculate the full n x n similarity score matrix in vectorized blocks
+        
+        Cohorts of at least Config.SCORING_PARALLEL_THRESHOLD students are
+        scored on a process pool (see parallel_scoring) when more than one
+        worker is configured; the result is identical either way.
+        
+        Args:
+            student_vectors: List of student vector dictionaries
+            block_size: Number of rows scored per block (bounds temporary memory)
+            workers: Scoring processes (default: Config.SCORING_WORKERS, 0 = all cores)
+            encoded: Optional pre-encoded cohort (e.g. FeatureStore.load_encoded);
+                student_vectors is then ignored
+        
+        Returns:
+            Float64 array where entry [i, j] is the score between students
+            i and j (the diagonal is zero)
+        """
+        if encoded is None:
+            encoded = self.encode_students(student_vectors)
+        n = len(encoded['ids'])
+        if n >= Config.SCORING_PARALLEL_THRESHOLD:
+            from parallel_scoring import calculate_similarity_matrix_parallel, resolve_workers
+            if resolve_workers(workers) > 1:
+                return calculate_similarity_matrix_parallel(self, student_vectors, workers, encoded=encoded)
+        
+        matrix = np.empty((n, n), dtype=np.float64)
+        for start in range(0, n, block_size):
+            rows = slice(start, min(start + block_size, n))
+            matrix[rows] = self.calculate_similarity_block(encoded, rows)
+        np.fill_diagonal(matrix, 0.0)
+        return matrix
+    
+    def calculate_all_similarities(self, student_vectors, score_matrix=None):
+        """
+        Calculate similarity scores between all pairs of students
+        Returns a dictionary: {(id1, id2): score}
+        
+        Reasons are not generated here; use attach_reasons() for the pairs
+        that are actually selected. A precomputed score_matrix (e.g. from
+        the compatibility cache) skips the scoring step. The dictionary
+        holds 2n^2 entries; for large cohorts a SimilarityStore answers the
+        same store[id1, id2] lookups from a memory-mapped file.
+        """
+        similarities = {}
+        ids = [s['id'] for s in student_vectors]
+        if score_matrix is None:
+            score_matrix = self.calculate_similarity_matrix(student_vectors)
+        scores = score_matrix.tolist()
+        
+        for i, id1 in enumerate(ids):
+            row = scores[i]
+            for j in range(i + 1, len(ids)):
                 # Store bidirectionally for easy lookup
-                similarities[(student1['id'], student2['id'])] = (score, reasons)
-                similarities[(student2['id'], student1['id'])] = (score, reasons)
+                similarities[(id1, ids[j])] = row[j]
+                similarities[(ids[j], id1)] = row[j]
         
         return similarities
 
@@ -169,172 +477,262 @@ class AStarMatcher:
     State Space: Different matching arrangements of students
     Goal State: All students matched with maximum total compatibility
     Heuristic: Optimistic estimate of remaining compatibility potential
+               (pluggable, see astar_heuristics and Config.ASTAR_HEURISTIC)
     Cost: Negative of total compatibility (to minimize cost = maximize compatibility)
+    
+    Internally students are dense indices 0..n-1, the unmatched set is a
+    bitmask integer and each search node stores only its newest pair plus a
+    parent pointer, so expanding a node allocates one small object.
     """
     
-    def __init__(self, similarity_engine=None):
-        """Initialize A* matcher with similarity engine"""
+    def __init__(self, similarity_engine=None, heuristic=None, progress=None):
+        """
+        Initialize A* matcher with similarity engine and heuristic name
+        
+        progress, if given, is called as progress(nodes_explored=..., open_size=...,
+        best_score=...) every Config.ASTAR_PROGRESS_INTERVAL nodes.
+        """
         self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.heuristic_name = heuristic or Config.ASTAR_HEURISTIC
+        self.progress = progress
+        self.heuristic = None
         self.best_solution = None
         self.nodes_explored = 0
+        self.search_time = 0.0
+        self.upper_bound = 0.0
+        self.stop_reason = None
+        self.peak_open_size = 0
+        self.closed_size = 0
+    
+    class SearchNode:
+        """Represents a state in the A* search space (one pair + parent pointer)"""
+        __slots__ = ('parent', 'i', 'j', 'g', 'mask', 'depth')
+        
+        def __init__(self, parent, i, j, g, mask, depth):
+            self.parent = parent  # Parent node (None for the start state)
+            self.i = i  # Indices of the pair matched by this step
+            self.j = j
+            self.g = g  # Total compatibility score so far
+            self.mask = mask  # Bitmask of unmatched student indices
+            self.depth = depth  # Number of matched pairs
+        
+        def pairs(self):
+            """Reconstruct the matched (i, j) index pairs from the start state"""
+            pairs = []
+            node = self
+            while node.parent is not None:
+                pairs.append((node.i, node.j))
+                node = node.parent
+            pairs.reverse()
+            return pairs
     
-    class MatchingState:
-        """Represents a state in the A* search space"""
-        def __init__(self, matched_pairs, unmatched_students, total_score, g_cost, h_cost):
-            self.matched_pairs = matched_pairs  # List of (student1_id, student2_id, score, reasons)
-            self.unmatched_students = unmatched_students  # Set of unmatched student IDs
-            self.total_score = total_score  # Total compatibility score so far
-            self.g_cost = g_cost  # Actual cost (negative of total score)
-            self.h_cost = h_cost  # Heuristic cost estimate
-            self.f_cost = g_cost + h_cost  # Total estimated cost
-        
-        def __lt__(self, other):
-            """For priority queue comparison"""
-            return self.f_cost < other.f_cost
-        
-        def __eq__(self, other):
-            """Check if two states are equal"""
-            return (frozenset(self.matched_pairs) == frozenset(other.matched_pairs) and
-                    self.unmatched_students == other.unmatched_students)
-        
-        def __hash__(self):
-            """Make state hashable for visited set"""
-            return hash((frozenset(self.matched_pairs), frozenset(self.unmatched_students)))
+    mask_indices = staticmethod(mask_indices)
     
-    def calculate_heuristic(self, unmatched_students, similarity_matrix):
+    # Stand-in partner of the student left out of an odd cohort
+    DUMMY = {'id': None, 'name': None}
+    
+    def calculate_heuristic(self, mask, scores):
         """
         Admissible heuristic: Optimistic estimate of best possible remaining score
-        Takes maximum possible compatibility for each remaining student
+        Evaluates the configured heuristic on a single state
         """
-        if len(unmatched_students) <= 1:
-            return 0.0
-        
-        # For each unmatched student, find their best possible match score
-        max_possible_score = 0.0
-        remaining = list(unmatched_students)
-        
-        for i, student_id in enumerate(remaining):
-            best_score = 0.0
-            for j, other_id in enumerate(remaining):
-                if i != j and (student_id, other_id) in similarity_matrix:
-                    score = similarity_matrix[(student_id, other_id)][0]
-                    best_score = max(best_score, score)
-            max_possible_score += best_score
-        
-        # Divide by 2 since each pair is counted twice
-        max_possible_score /= 2
-        
-        # Return negative (since we minimize cost)
-        return -max_possible_score
+        heuristic = self.heuristic
+        if heuristic is None or heuristic.scores is not scores:
+            heuristic = make_heuristic(self.heuristic_name, scores)
+        return heuristic.bound(mask)
     
-    def generate_successors(self, state, similarity_matrix):
+    def generate_successors(self, node, scores):
         """Generate all possible next states by matching one more pair"""
-        successors = []
-        unmatched_list = list(state.unmatched_students)
-        
-        if len(unmatched_list) < 2:
-            return successors
+        if node.mask & (node.mask - 1) == 0:
+            return []
         
-        # Try matching the first unmatched student with each other unmatched student
-        first_student = unmatched_list[0]
-        
-        for i in range(1, len(unmatched_list)):
-            second_student = unmatched_list[i]
-            
-            # Get compatibility score
-            if (first_student, second_student) in similarity_matrix:
-                score, reasons = similarity_matrix[(first_student, second_student)]
-            else:
-                score, reasons = 0.0, []
-            
-            # Create new state
-            new_matched_pairs = state.matched_pairs + [(first_student, second_student, score, reasons)]
-            new_unmatched = state.unmatched_students - {first_student, second_student}
-            new_total_score = state.total_score + score
-            new_g_cost = -new_total_score  # Negative because we minimize cost
-            new_h_cost = self.calculate_heuristic(new_unmatched, similarity_matrix)
-            
-            new_state = self.MatchingState(
-                matched_pairs=new_matched_pairs,
-                unmatched_students=new_unmatched,
-                total_score=new_total_score,
-                g_cost=new_g_cost,
-                h_cost=new_h_cost
-            )
-            
-            successors.append(new_state)
+        # Match the lowest unmatched student with each other unmatched student
+        low = node.mask & -node.mask
+        first = low.bit_length() - 1
+        rest = node.mask ^ low
+        row = scores[first]
         
+        successors = []
+        for second in self.mask_indices(rest):
+            successors.append(self.SearchNode(
+                node, first, second, node.g + row[second],
+                rest & ~(1 << second), node.depth + 1
+            ))
         return successors
     
-    def is_goal_state(self, state):
-        """Check if all students are matched"""
-        return len(state.unmatched_students) == 0
+    def greedy_completion(self, node, scores):
+        """
+        Complete a partial matching greedily (best remaining pair first)
+        
+        Used to seed and improve the incumbent solution of the anytime search.
+        
+        Returns:
+            Tuple (total_score, index_pairs)
+        """
+        remaining = self.mask_indices(node.mask)
+        candidate_pairs = sorted(
+            ((scores[a][b], a, b) for k, a in enumerate(remaining) for b in remaining[k + 1:]),
+            reverse=True
+        )
+        
+        pairs = node.pairs()
+        total_score = node.g
+        mask = node.mask
+        for score, a, b in candidate_pairs:
+            bits = (1 << a) | (1 << b)
+            if mask & bits == bits:
+                pairs.append((a, b))
+                total_score += score
+                mask ^= bits
+        return total_score, pairs
     
-    def a_star_search(self, student_vectors):
+    def a_star_search(self, student_vectors, score_matrix=None,
+                      max_nodes=None, time_limit=None, beam_width=None):
         """
         A* Search to find optimal roommate matching
         
+        Anytime variant: the search stops when the node budget, the wall-clock
+        deadline or the open list runs out. A state's bound is computed once,
+        when it is expanded; its successors inherit it incrementally, and a
+        state whose own bound turns out tighter than the inherited one is put
+        back on the heap instead of being expanded. A greedy matching seeds the
+        incumbent, so a complete matching is always returned; if the search
+        stops early, self.upper_bound holds the best total any matching could
+        still reach, which bounds the optimality gap of the returned one.
+        
         Args:
             student_vectors: List of student vector dictionaries
+            score_matrix: Optional precomputed score matrix aligned with student_vectors
+            max_nodes: Node budget (default: Config.ASTAR_MAX_NODES)
+            time_limit: Wall-clock limit in seconds (default: Config.ASTAR_TIME_LIMIT)
+            beam_width: Keep only this many open states (default: Config.ASTAR_BEAM_WIDTH)
         
         Returns:
-            List of matched pairs with scores and reasons
+            List of matched (student1_id, student2_id, score) pairs
         """
+        started = time.perf_counter()
         self.nodes_explored = 0
-        
-        # Calculate all pairwise similarities first
-        similarity_matrix = self.similarity_engine.calculate_all_similarities(student_vectors)
+        max_nodes = max_nodes or Config.ASTAR_MAX_NODES
+        time_limit = time_limit if time_limit is not None else Config.ASTAR_TIME_LIMIT
+        beam_width = beam_width if beam_width is not None else Config.ASTAR_BEAM_WIDTH
+        deadline = time.monotonic() + time_limit if time_limit else None
+        
+        # Calculate all pairwise similarities first (dense rows indexed 0..n-1)
+        if score_matrix is None:
+            score_matrix = self.similarity_engine.calculate_similarity_matrix(student_vectors)
+        scores = score_matrix.tolist()
+        ids = [student['id'] for student in student_vectors]
+        n = len(ids)
+        heuristic = self.heuristic = make_heuristic(self.heuristic_name, scores)
         
         # Initialize start state
-        all_student_ids = {student['id'] for student in student_vectors}
-        initial_state = self.MatchingState(
-            matched_pairs=[],
-            unmatched_students=all_student_ids,
-            total_score=0.0,
-            g_cost=0.0,
-            h_cost=self.calculate_heuristic(all_student_ids, similarity_matrix)
-        )
+        start = self.SearchNode(None, -1, -1, 0.0, (1 << n) - 1, 0)
         
-        # Priority queue (min-heap) for A* search
-        open_list = []
-        heapq.heappush(open_list, initial_state)
+        # Seed the incumbent so a complete matching exists from the start
+        incumbent = self.greedy_completion(start, scores)
         
-        # Closed set to track visited states
+        # Heap of (-f, tiebreak, node); the tiebreak prefers deeper nodes, then FIFO
+        open_list = [(-heuristic.bound(start.mask), 0, start)]
+        sequence = 0
+        depth_shift = 1 << 40
+        
+        # Best score reaching each unmatched-set, and the sets already expanded
+        best_g = {start.mask: 0.0}
         closed_set = set()
         
+        # Heuristic contexts of states that were re-queued with a tighter bound
+        prepared = {}
+        
+        # Best optimistic total among states discarded by the beam
+        pruned_bound = float('-inf')
+        deepest = 0
+        self.stop_reason = 'exhausted'
+        self.peak_open_size = 1
+        
         # A* search loop
         while open_list:
+            if self.nodes_explored >= max_nodes:
+                self.stop_reason = 'node_budget'
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stop_reason = 'time_limit'
+                break
+            
             # Get state with lowest f_cost
-            current_state = heapq.heappop(open_list)
+            neg_f, tiebreak, node = heapq.heappop(open_list)
             self.nodes_explored += 1
+            if self.progress and self.nodes_explored % Config.ASTAR_PROGRESS_INTERVAL == 0:
+                self.progress(nodes_explored=self.nodes_explored, open_size=len(open_list),
+                              best_score=round(incumbent[0], 2))
             
-            # Check if goal reached
-            if self.is_goal_state(current_state):
-                self.best_solution = current_state
-                return current_state.matched_pairs
+            # Check if goal reached: no open state can do better
+            if node.mask == 0:
+                if node.g >= incumbent[0]:
+                    incumbent = (node.g, node.pairs())
+                self.stop_reason = 'optimal' if pruned_bound <= incumbent[0] else 'beam'
+                self.upper_bound = max(incumbent[0], pruned_bound)
+                break
             
-            # Skip if already visited
-            if current_state in closed_set:
+            # Skip stale entries and states that were already expanded
+            if node.g < best_g[node.mask] or node.mask in closed_set:
                 continue
             
-            closed_set.add(current_state)
+            # Tighten the inherited bound; re-queue if another state now looks better
+            context = prepared.pop(node.mask, None)
+            if context is None:
+                context = heuristic.prepare(node.mask)
+                f_cost = node.g + context[0]
+                if open_list and f_cost < -open_list[0][0] - 1e-9 and f_cost < -neg_f - 1e-9:
+                    prepared[node.mask] = context
+                    heapq.heappush(open_list, (-f_cost, tiebreak, node))
+                    continue
+            closed_set.add(node.mask)
+            
+            # Improve the incumbent each time the search reaches a new depth
+            if node.depth > deepest:
+                deepest = node.depth
+                completion = self.greedy_completion(node, scores)
+                if completion[0] > incumbent[0]:
+                    incumbent = completion
             
             # Generate and explore successors
-            successors = self.generate_successors(current_state, similarity_matrix)
+            for successor in self.generate_successors(node, scores):
+                mask = successor.mask
+                if successor.g <= best_g.get(mask, -1.0):
+                    continue
+                best_g[mask] = successor.g
+                closed_set.discard(mask)
+                sequence += 1
+                f_cost = successor.g + heuristic.child_bound(context, mask, successor.i, successor.j)
+                heapq.heappush(open_list, (-f_cost, sequence - successor.depth * depth_shift, successor))
             
-            for successor in successors:
-                if successor not in closed_set:
-                    heapq.heappush(open_list, successor)
-        
-        # No solution found (shouldn't happen with even number of students)
-        return []
+            # Beam search: keep only the most promising states (a sorted list is a heap)
+            if beam_width and len(open_list) > beam_width:
+                open_list.sort()
+                pruned_bound = max(pruned_bound, -open_list[beam_width][0])
+                del open_list[beam_width:]
+            
+            self.peak_open_size = max(self.peak_open_size, len(open_list))
+        
+        if self.stop_reason not in ('optimal', 'beam'):
+            # Stopped early: the frontier bounds what any matching could still reach
+            frontier_bound = -open_list[0][0] if open_list else float('-inf')
+            self.upper_bound = max(incumbent[0], frontier_bound, pruned_bound)
+        self.closed_size = len(closed_set)
+        self.search_time = time.perf_counter() - started
+        
+        matched_pairs = [(ids[i], ids[j], scores[i][j]) for i, j in incumbent[1]]
+        self.best_solution = matched_pairs
+        return matched_pairs
     
-    def match_students(self, student_vectors):
+    def match_students(self, student_vectors, score_matrix=None, **search_limits):
         """
         Main method to match students using A* algorithm
         
         Args:
             student_vectors: List of student vector dictionaries
+            score_matrix: Optional precomputed score matrix aligned with student_vectors
+            search_limits: max_nodes, time_limit and beam_width for a_star_search
         
         Returns:
             Dictionary with matches and statistics
@@ -345,27 +743,54 @@ class AStarMatcher:
                 'total_score': 0.0,
                 'average_score': 0.0,
                 'nodes_explored': 0,
-                'unmatched': [s['id'] for s in student_vectors]
+                'heuristic': self.heuristic_name,
+                'search_time': 0.0,
+                'optimal': True,
+                'optimality_gap': 0.0,
+                'stop_reason': 'optimal',
+                'unmatched': [s['id'] for s in student_vectors],
+                'alternatives': {}
             }
         
-        # Handle odd number of students
-        unmatched_students = []
+        if score_matrix is None:
+            score_matrix = self.similarity_engine.calculate_similarity_matrix(student_vectors)
+        
+        # Odd cohort: a dummy student scoring 0 with everyone lets the same search
+        # choose who sits out; whoever is paired with it stays unmatched
+        search_vectors, search_matrix = student_vectors, score_matrix
         if len(student_vectors) % 2 == 1:
-            # Leave out the last student
-            unmatched_students = [student_vectors[-1]['id']]
-            student_vectors = student_vectors[:-1]
+            search_vectors = student_vectors + [self.DUMMY]
+            search_matrix = np.pad(score_matrix, ((0, 1), (0, 1)))
         
-        # Run A* search
-        matched_pairs = self.a_star_search(student_vectors)
+        # Run A* search, then generate reasons only for the selected pairs
+        matched_pairs = self.a_star_search(search_vectors, search_matrix, **search_limits)
+        unmatched_students = [id1 if id2 is None else id2 for id1, id2, _ in matched_pairs
+                              if None in (id1, id2)]
+        matched_pairs = [pair for pair in matched_pairs if None not in pair[:2]]
+        matched_pairs = self.similarity_engine.attach_reasons(matched_pairs, student_vectors)
         
         # Calculate statistics
         total_score = sum(pair[2] for pair in matched_pairs)
         average_score = total_score / len(matched_pairs) if matched_pairs else 0.0
         
+        # Optimality gap: how far the returned total may be below the optimum (%)
+        gap = self.upper_bound - total_score
+        optimality_gap = 100.0 * gap / self.upper_bound if self.upper_bound > 0 else 0.0
+        
         return {
             'matches': matched_pairs,
             'total_score': round(total_score, 2),
             'average_score': round(average_score, 2),
             'nodes_explored': self.nodes_explored,
-            'unmatched': unmatched_students
+            'heuristic': self.heuristic_name,
+            'search_time': round(self.search_time, 3),
+            'optimal': self.stop_reason == 'optimal',
+            'upper_bound': round(self.upper_bound, 2),
+            'optimality_gap': round(max(optimality_gap, 0.0), 2),
+            'stop_reason': self.stop_reason,
+            'peak_open_size': self.peak_open_size,
+            'closed_size': self.closed_size,
+            'unmatched': unmatched_students,
+            'alternatives': self.similarity_engine.unmatched_alternatives(
+                unmatched_students, student_vectors, matched_pairs, lambda rows: score_matrix[rows])
         }
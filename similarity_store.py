@@ -0,0 +1,441 @@
+"""
+Similarity Store Module
+Memory-mapped, upper-triangular score matrix for cohorts that exceed RAM
+
+The compatibility cache keeps its rows in SQLite and every run assembles a
+float64 matrix from them, and calculate_all_similarities builds a dictionary
+of 2n^2 tuples; both stop fitting in memory long before 50k students. The
+store instead keeps every pair exactly once in a flat file that is mapped
+with np.memmap, so scores are paged in by the OS on demand and shared by
+every process that maps the same file:
+
+    <path>      header, then the upper triangle column by column: column j
+                holds the scores of student j against students 0..j-1 (id
+                order), so pair (i, j) with i < j sits at j(j-1)/2 + i
+    <path>.ids  header, then the student ids (int64) in store order
+
+Scores are kept as float32, which converts back to the exact two-decimal
+score, or quantized to whole points as uint8 (a quarter of the size).
+Students only ever join with a larger id, so a registration appends one
+column without touching the rest; anything else (changed weights, a reset)
+rebuilds the file next to the old one and swaps it in atomically, so readers
+that still map the old file are not disturbed. One process writes the store
+(sync), any number of processes read it.
+
+Blossom and incremental matching read a selection through cohort(), a
+CohortScores view that gathers blocks of rows or single pairs from the map,
+so blossom runs above Config.SIMILARITY_STORE_DENSE_MAX never build an n x n
+matrix. Greedy and stable matching only need each student's top-K partners,
+which candidate_index.top_k_candidates finds from the features without
+touching most pairs, so they do not use the store.
+"""
+from config import Config
+import hashlib
+import json
+import os
+import struct
+import threading
+import uuid
+import numpy as np
+
+from models import db, Student
+from similarity_engine import SimilarityEngine
+from feature_store import FeatureStore
+
+
+class SimilarityStore:
+    """Read and maintain the memory-mapped score matrix"""
+
+    MAGIC = b'SIMSTORE'
+    IDS_MAGIC = b'SIMIDS\0\0'
+
+    # magic, weights fingerprint, build token, number of students
+    HEADER = struct.Struct('<8s40s16sq')
+    IDS_HEADER = struct.Struct('<8s16s')
+    HEADER_SIZE = 128
+    IDS_HEADER_SIZE = 64
+
+    # Bump when the file layout or the scoring formula changes
+    FORMAT_VERSION = 1
+
+    DTYPES = {'float32': np.float32, 'uint8': np.uint8}
+
+    def __init__(self, path=None, similarity_engine=None, feature_store=None, dtype=None):
+        """
+        Initialize the store
+
+        Args:
+            path: File holding the matrix (default: Config.SIMILARITY_STORE_PATH)
+            similarity_engine: SimilarityEngine used to score new columns
+            feature_store: FeatureStore loading the students' features
+            dtype: 'float32' or 'uint8' (default: Config.SIMILARITY_STORE_DTYPE)
+        """
+        self.path = path or Config.SIMILARITY_STORE_PATH
+        self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.feature_store = feature_store or FeatureStore()
+        self.dtype = dtype or Config.SIMILARITY_STORE_DTYPE
+        if self.dtype not in self.DTYPES:
+            raise ValueError(f'Unknown similarity store dtype {self.dtype!r}')
+
+        # Background matching jobs and registrations may sync concurrently
+        self._lock = threading.RLock()
+        self._encoded = None  # Encoded cohort in store order, as of this process's last write
+        self._close()
+
+    def __getstate__(self):
+        """Pickle by path, so worker processes map the file themselves"""
+        return {'path': self.path, 'weights': self.similarity_engine.weights, 'dtype': self.dtype}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], SimilarityEngine(state['weights']), dtype=state['dtype'])
+
+    @property
+    def version(self):
+        """Fingerprint of everything the stored scores depend on"""
+        payload = json.dumps({
+            'format': self.FORMAT_VERSION,
+            'weights': self.similarity_engine.weights,
+            'bonus': Config.HOBBY_OVERLAP_BONUS,
+            'dtype': self.dtype
+        }, sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    @property
+    def ids_path(self):
+        return self.path + '.ids'
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def offsets(rows, cols):
+        """Positions of the pairs (rows[t], cols[t]) in the triangle (rows != cols)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        lo = np.minimum(rows, cols)
+        hi = np.maximum(rows, cols)
+        return hi * (hi - 1) // 2 + lo
+
+    # ----------------------------------------------------------------- reading
+
+    def _close(self):
+        """Drop the current mapping"""
+        self.ids = np.empty(0, dtype=np.int64)
+        self.scores = np.empty(0, dtype=self.DTYPES[self.dtype])
+        self._token = None
+        self._stored_version = None
+
+    def open(self):
+        """
+        Map the file as it is on disk now
+
+        The header is read first and only the students it counts are mapped,
+        so a column being appended concurrently is simply not seen yet.
+
+        Returns:
+            self (empty when the file does not exist or belongs to another build)
+        """
+        with self._lock:
+            self._close()
+            try:
+                with open(self.path, 'rb') as f:
+                    magic, version, token, n = self.HEADER.unpack(f.read(self.HEADER.size))
+                with open(self.ids_path, 'rb') as f:
+                    ids_magic, ids_token = self.IDS_HEADER.unpack(f.read(self.IDS_HEADER.size))
+            except (OSError, struct.error):
+                return self
+            if magic != self.MAGIC or ids_magic != self.IDS_MAGIC or token != ids_token:
+                return self  # Torn rebuild swap or foreign file; the next sync rebuilds it
+
+            if n > 0:
+                self.ids = np.memmap(self.ids_path, dtype=np.int64, mode='r',
+                                     offset=self.IDS_HEADER_SIZE, shape=(n,))
+            if n > 1:
+                self.scores = np.memmap(self.path, dtype=self.DTYPES[self.dtype], mode='r',
+                                        offset=self.HEADER_SIZE, shape=(n * (n - 1) // 2,))
+            self._token = token
+            self._stored_version = version.decode()
+            return self
+
+    def decode(self, values):
+        """Stored values as float64 scores (two decimals, or whole points for uint8)"""
+        values = np.asarray(values, dtype=np.float64)
+        if self.dtype == 'float32':
+            # float32 keeps 7 significant digits, so rounding restores the exact score
+            return np.round(values, 2)
+        return values
+
+    def column(self, j):
+        """Stored scores of the student at position j against positions 0..j-1 (a view of the map)"""
+        start = j * (j - 1) // 2
+        return self.scores[start:start + j]
+
+    def positions(self, ids):
+        """Store positions of student ids; raises KeyError for ids not in the store"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) and not len(self.ids):
+            raise KeyError(f'Students not in the similarity store: {ids[:5].tolist()}')
+        pos = np.searchsorted(self.ids, ids)
+        pos[pos == len(self.ids)] = 0
+        if len(ids) and not np.array_equal(self.ids[pos], ids):
+            missing = ids[self.ids[pos] != ids]
+            raise KeyError(f'Students not in the similarity store: {missing[:5].tolist()}')
+        return pos
+
+    def pair_scores(self, rows, cols):
+        """Scores of the pairs (rows[t], cols[t]) given as store positions (0 where equal)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        same = rows == cols
+        scores = self.decode(self.scores[self.offsets(np.where(same, 0, rows), np.where(same, 1, cols))]
+                             if len(self.scores) else np.zeros(len(rows)))
+        scores[same] = 0.0
+        return scores
+
+    def block(self, rows, cols=None):
+        """
+        Scores of a block of the matrix, by store positions
+
+        Args:
+            rows: Index array of store positions
+            cols: Index array of store positions (default: every student)
+
+        Returns:
+            Float64 array of shape (len(rows), len(cols)), zero where a row
+            and a column are the same student
+        """
+        rows = np.asarray(rows, dtype=np.int64)[:, None]
+        cols = (np.arange(len(self.ids)) if cols is None else np.asarray(cols, dtype=np.int64))[None, :]
+        if not len(self.scores):
+            return np.zeros((rows.shape[0], cols.shape[1]))
+        same = rows == cols
+        # Offsets of (lo, hi) computed in place; the diagonal reads pair (0, 1) and is zeroed after
+        hi = np.maximum(rows, cols)
+        lo = np.minimum(rows, cols)
+        hi[same] = 1
+        lo[same] = 0
+        hi *= hi - 1
+        hi //= 2
+        hi += lo
+        scores = self.decode(self.scores[hi])
+        scores[same] = 0.0
+        return scores
+
+    def cohort(self, student_vectors):
+        """
+        Row-block view of the scores of a selection, synced first
+
+        Args:
+            student_vectors: List of student vector dictionaries (or student ids)
+
+        Returns:
+            CohortScores indexed by position in student_vectors
+        """
+        self.sync()
+        ids = [s['id'] if isinstance(s, dict) else s for s in student_vectors]
+        return CohortScores(self, self.positions(ids))
+
+    def score(self, id1, id2):
+        """Score of one pair of students, by id (O(1) once the positions are found)"""
+        i, j = self.positions([id1, id2])
+        return float(self.pair_scores([i], [j])[0])
+
+    def __getitem__(self, pair):
+        """store[id1, id2]: drop-in for the dictionary of calculate_all_similarities"""
+        return self.score(*pair)
+
+    # ----------------------------------------------------------------- writing
+
+    def add_student(self, student):
+        """
+        Append the column of a newly registered student (O(n))
+
+        The column is scored from the encoded cohort kept since this
+        process's last write plus the new student's own encoded row, so a
+        registration loads one student's features. A store that is missing,
+        stale or behind the students table is left for sync() to repair.
+
+        Args:
+            student: Student instance that has already been committed
+        """
+        with self._lock:
+            self.open()
+            n = len(self.ids)
+            if (self._token is None or self._stored_version != self.version
+                    or (n and self.ids[-1] >= student.id)
+                    or db.session.query(Student.id).filter(Student.id < student.id).count() != n):
+                return
+            if self._encoded is None or not np.array_equal(self._encoded['ids'], self.ids):
+                # First registration in this process, or another process wrote the store
+                self._encoded = self.feature_store.load_encoded(self.ids.tolist())
+                if not np.array_equal(self._encoded['ids'], self.ids):
+                    self._encoded = None
+                    return
+            encoded = self._extend(self._encoded, self.feature_store.load_encoded([student.id]))
+            self._append(encoded, n)
+            self._encoded = encoded
+            self.open()
+
+    @staticmethod
+    def _extend(encoded, new):
+        """Encoded cohort with the students of another one appended (hobby columns matched by name)"""
+        vocabulary = list(encoded['vocabulary'])
+        column = {name: c for c, name in enumerate(vocabulary)}
+        for name in new['vocabulary']:
+            if name not in column:
+                column[name] = len(vocabulary)
+                vocabulary.append(name)
+        n = len(encoded['ids'])
+        hobbies = np.zeros((n + len(new['ids']), len(vocabulary)), dtype=np.float32)
+        hobbies[:n, :encoded['hobbies'].shape[1]] = encoded['hobbies']
+        hobbies[n:, [column[name] for name in new['vocabulary']]] = new['hobbies']
+        return {
+            'ids': np.concatenate([encoded['ids'], new['ids']]),
+            'ordinals': np.concatenate([encoded['ordinals'], new['ordinals']]),
+            'hobbies': hobbies,
+            'hobby_counts': np.concatenate([encoded['hobby_counts'], new['hobby_counts']]),
+            'vocabulary': vocabulary
+        }
+
+    def clear(self):
+        """Delete the store files"""
+        with self._lock:
+            self._close()
+            self._encoded = None
+            for path in (self.path, self.ids_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def sync(self):
+        """
+        Bring the store up to date with the students table
+
+        Rebuilds everything if the weights changed or students were removed;
+        otherwise only scores the columns of students that joined since.
+        """
+        with self._lock:
+            student_ids = np.array([sid for (sid,) in db.session.query(Student.id).order_by(Student.id)],
+                                   dtype=np.int64)
+            self.open()
+            stored = len(self.ids)
+            if (self._token is None or self._stored_version != self.version or stored > len(student_ids)
+                    or not np.array_equal(self.ids, student_ids[:stored])):
+                self.rebuild()
+            elif stored < len(student_ids):
+                encoded = self.feature_store.load_encoded()
+                self._append(encoded, stored)
+                self._encoded = encoded
+                self.open()
+
+    def rebuild(self):
+        """Rewrite the whole store with the current students and weights"""
+        with self._lock:
+            encoded = self.feature_store.load_encoded()
+            token = uuid.uuid4().bytes
+            target, target_ids = self.path, self.ids_path
+            self.path = target + '.tmp'
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+                with open(self.path, 'wb') as f:
+                    f.write(self.HEADER.pack(self.MAGIC, self.version.encode(), token, 0).ljust(self.HEADER_SIZE, b'\0'))
+                with open(self.ids_path, 'wb') as f:
+                    f.write(self.IDS_HEADER.pack(self.IDS_MAGIC, token).ljust(self.IDS_HEADER_SIZE, b'\0'))
+                self._append(encoded, 0)
+                # ids first: until the main file is swapped too, the build tokens differ
+                os.replace(self.ids_path, target_ids)
+                os.replace(self.path, target)
+            finally:
+                self.path = target
+            self._encoded = encoded
+            self.open()
+
+    def _append(self, encoded, start, block_size=512):
+        """
+        Score and append the columns of positions start.. of an id-ordered cohort
+
+        Columns are written before their ids, and the header's student count
+        last, so readers never map a column that is not complete.
+        """
+        ids = encoded['ids']
+        store_dtype = self.DTYPES[self.dtype]
+        with open(self.path, 'r+b') as f:
+            f.seek(self.HEADER_SIZE + start * (start - 1) // 2 * np.dtype(store_dtype).itemsize)
+            for first in range(start, len(ids), block_size):
+                last = min(first + block_size, len(ids))
+                block = self.similarity_engine.calculate_similarity_block(
+                    encoded, slice(first, last), slice(0, last))
+                for k, j in enumerate(range(first, last)):
+                    values = block[k, :j]
+                    if self.dtype == 'uint8':
+                        values = np.rint(values)
+                    f.write(values.astype(store_dtype).tobytes())
+            f.flush()
+
+            with open(self.ids_path, 'r+b') as ids_file:
+                ids_file.seek(self.IDS_HEADER_SIZE + start * 8)
+                ids_file.write(np.asarray(ids[start:], dtype=np.int64).tobytes())
+                ids_file.flush()
+
+            f.seek(self.HEADER.size - 8)
+            f.write(struct.pack('<q', len(ids)))
+
+    def get_score_matrix(self, student_vectors):
+        """
+        Assemble the n x n score matrix for a selection from the store
+
+        Each selected student's column is a contiguous slice of the map, so
+        the matrix is filled with one gather per student.
+
+        Args:
+            student_vectors: List of student vector dictionaries
+
+        Returns:
+            Float64 array aligned with student_vectors (diagonal is zero);
+            bit-identical to SimilarityEngine.calculate_similarity_matrix for
+            float32 stores
+        """
+        self.sync()
+
+        ids = np.array([s['id'] for s in student_vectors], dtype=np.int64)
+        n = len(ids)
+        order = np.argsort(ids)
+        pos = self.positions(ids[order])
+
+        matrix = np.zeros((n, n), dtype=np.float64)
+        for k in range(1, n):
+            t = order[k]
+            values = self.decode(self.column(pos[k])[pos[:k]])
+            matrix[order[:k], t] = values
+            matrix[t, order[:k]] = values
+        return matrix
+
+
+class CohortScores:
+    """
+    Scores of a selection of students, read from a SimilarityStore in row blocks
+
+    Positions are indices into the selection. Every read gathers straight
+    from the map, so matchers can scan a cohort far larger than an n x n
+    float64 matrix would allow.
+    """
+
+    def __init__(self, store, positions):
+        self.store = store
+        self.positions = np.asarray(positions, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def pair_scores(self, rows, cols):
+        """Scores of the pairs (rows[t], cols[t]) (0 where equal)"""
+        return self.store.pair_scores(self.positions[rows], self.positions[cols])
+
+    def block(self, rows, cols=None):
+        """Float64 scores of rows against cols (default: every student); rows and cols may be slices"""
+        return self.store.block(self.positions[rows], self.positions if cols is None else self.positions[cols])
+
+    def matrix(self):
+        """The dense n x n matrix (only for small selections)"""
+        return self.block(slice(None))
@@ -0,0 +1,406 @@
+"""
+Stable Roommates Module
+Irving's stable roommates algorithm over truncated preference lists
+
+The weighted matchers maximize the total score, which can leave two students
+who would both rather room with each other than with their assigned
+roommates (a blocking pair). This matcher returns a stable matching instead.
+
+Preference lists are built from the top-K candidates of every student
+(candidate_index.top_k_candidates), made symmetric: a pair is acceptable when
+either student lists the other. Memory therefore stays O(n * k). Every list
+is ordered by one global ranking of the pairs (score, then ids), so ties are
+broken consistently on both sides.
+
+Irving's algorithm runs in two phases:
+
+    1. Proposals: every student proposes down their list; a student holding a
+       proposal rejects everybody they like less than the proposer.
+    2. Rotations: while some list has two or more entries, a rotation is
+       found by walking second choices and last choices, and eliminated.
+
+Both phases only ever cut lists from the back, so a pair is alive exactly
+while each student lies within the other's uncut prefix. A list emptied in
+phase 2 means no stable matching exists. In that case the matching is built
+greedily, best pair first, and its blocking pairs are reported.
+
+Truncated lists leave some students unmatched in every stable matching (all
+they listed prefer others). No two of them list each other, so they are
+matched among themselves in further rounds with fresh top-K lists; against
+the first round's lists the result stays free of blocking pairs.
+
+Stability over the lists does not rule out a blocking pair that neither
+student listed. Cohorts of up to STABLE_FULL_CHECK_MAX students are
+therefore checked against every allowed pair, a block of rows at a time;
+larger ones are only checked against the first round's lists, and the
+result says which (blocking_scope).
+"""
+from config import Config
+import time
+from collections import deque
+import numpy as np
+
+from similarity_engine import SimilarityEngine
+from local_search import LocalSearchMatcher
+
+# Blocking pairs listed by id in a result (all are counted)
+BLOCKING_EXAMPLES = 10
+
+
+class StableRoommatesMatcher:
+    """Stable matching of a cohort with Irving's algorithm"""
+
+    # Scores computed per block of rows when checking every pair for blocking
+    BLOCK_ENTRIES = 1 << 22
+
+    def __init__(self, similarity_engine=None, candidate_k=None, progress=None, allowed=None):
+        """
+        Initialize the matcher
+
+        Args:
+            similarity_engine: SimilarityEngine used for scoring
+            candidate_k: Length of each student's own preference list
+                (default: Config.STABLE_CANDIDATES)
+            progress: Optional callable receiving progress keyword arguments
+            allowed: Optional callable (rows, cols) -> boolean array telling which
+                pairs of cohort positions may be matched (see MatchConstraints.pair_filter)
+        """
+        self.similarity_engine = similarity_engine or SimilarityEngine()
+        self.candidate_k = candidate_k or Config.STABLE_CANDIDATES
+        self.progress = progress
+        self.allowed = allowed
+
+    def preference_lists(self, encoded, positions=None):
+        """
+        Symmetric preference lists in compressed sparse row form
+
+        Args:
+            encoded: Encoded students
+            positions: Cohort positions of the encoded students, if they are
+                a subset of the cohort (for the pair filter)
+
+        Returns:
+            Dictionary of arrays:
+                offsets: list of student i is entries offsets[i]:offsets[i + 1]
+                partner: the student listed by each entry
+                reverse: position of the list's owner in the partner's list
+                pair: index of the entry's pair (both directions share it)
+                pair_rank: global rank of every pair (0 = best)
+                pair_score: score of every pair
+        """
+        n = len(encoded['ids'])
+        lister = LocalSearchMatcher(self.similarity_engine, allowed=self.allowed)
+        indices, scores = lister.candidate_lists(encoded, min(self.candidate_k, max(n - 1, 1)), positions)
+        rows = np.repeat(np.arange(n), indices.shape[1])
+        cols = indices.ravel()
+        keep = cols >= 0
+        rows, cols, pair_score = rows[keep], cols[keep], scores.ravel()[keep]
+
+        # Each pair once, ranked best first (ties by lower ids)
+        lo, hi = np.minimum(rows, cols), np.maximum(rows, cols)
+        _, first = np.unique(lo * n + hi, return_index=True)
+        lo, hi, pair_score = lo[first], hi[first], pair_score[first]
+        pair_rank = np.empty(len(lo), dtype=np.int64)
+        pair_rank[np.lexsort((hi, lo, -pair_score))] = np.arange(len(lo))
+
+        # Both directions, grouped by owner and ordered by the pair ranking
+        pairs = np.arange(len(lo))
+        owner = np.concatenate([lo, hi])
+        partner = np.concatenate([hi, lo])
+        pair = np.concatenate([pairs, pairs])
+        order = np.lexsort((pair_rank[pair], owner))
+        owner, partner, pair = owner[order], partner[order], pair[order]
+        offsets = np.searchsorted(owner, np.arange(n + 1))
+        position = np.arange(len(owner)) - offsets[owner]
+
+        # The two entries of a pair are adjacent once sorted by pair
+        by_pair = np.argsort(pair, kind='stable').reshape(-1, 2)
+        twin = np.empty(len(owner), dtype=np.int64)
+        twin[by_pair[:, 0]], twin[by_pair[:, 1]] = by_pair[:, 1], by_pair[:, 0]
+
+        return {
+            'offsets': offsets,
+            'partner': partner,
+            'reverse': position[twin],
+            'pair': pair,
+            'pair_rank': pair_rank,
+            'pair_score': pair_score
+        }
+
+    def irving(self, lists, n):
+        """
+        Run both phases of Irving's algorithm
+
+        Returns:
+            (mate, proposals, rotations): mate[i] is i's roommate or -1, and
+            mate is None if no stable matching exists
+        """
+        offsets = lists['offsets'].tolist()
+        partner = lists['partner'].tolist()
+        reverse = lists['reverse'].tolist()
+        head = [0] * n
+        second_at = [1] * n
+        tail = [offsets[i + 1] - offsets[i] - 1 for i in range(n)]
+
+        def alive(i, t):
+            e = offsets[i] + t
+            return reverse[e] <= tail[partner[e]]
+
+        def first(i):
+            t = head[i]
+            while t <= tail[i] and not alive(i, t):
+                t += 1
+            head[i] = t
+            return t if t <= tail[i] else None
+
+        def second(i):
+            t = max(second_at[i], head[i] + 1)
+            while t <= tail[i] and not alive(i, t):
+                t += 1
+            second_at[i] = t
+            return t if t <= tail[i] else None
+
+        def last(i):
+            t = tail[i]
+            while t >= head[i] and not alive(i, t):
+                t -= 1
+            tail[i] = t
+            return t
+
+        # Phase 1: proposals
+        proposals = 0
+        holder = [-1] * n
+        queue = deque(range(n))
+        while queue:
+            x = queue.popleft()
+            t = first(x)
+            if t is None:
+                continue
+            proposals += 1
+            e = offsets[x] + t
+            y = partner[e]
+            previous = holder[y]
+            holder[y] = x
+            tail[y] = reverse[e]
+            if previous >= 0:
+                queue.append(previous)
+        if self.progress:
+            self.progress(proposals=proposals)
+
+        # Phase 2: eliminate rotations, reusing the walked path between rotations
+        rotations = 0
+        stack = []
+        on_stack = {}
+        for start in range(n):
+            while True:
+                if not stack:
+                    if first(start) is None or second(start) is None:
+                        break
+                    stack.append(start)
+                    on_stack[start] = 0
+                p = stack[-1]
+                t = second(p)
+                if t is None:
+                    # p's list shrank to one entry: walk again from scratch
+                    stack.clear()
+                    on_stack.clear()
+                    continue
+                q = partner[offsets[p] + t]
+                nxt = partner[offsets[q] + last(q)]
+                if nxt not in on_stack:
+                    on_stack[nxt] = len(stack)
+                    stack.append(nxt)
+                    continue
+
+                # Rotation found: each x loses its first choice to the one before it
+                cycle = stack[on_stack[nxt]:]
+                cuts = []
+                for x in cycle:
+                    e = offsets[x] + second(x)
+                    cuts.append((partner[e], reverse[e]))
+                for x in cycle:
+                    del on_stack[x]
+                del stack[len(stack) - len(cycle):]
+                for q, r in cuts:
+                    old_tail = tail[q]
+                    tail[q] = r
+                    for s in range(r + 1, old_tail + 1):
+                        z = partner[offsets[q] + s]
+                        if first(z) is None:
+                            return None, proposals, rotations
+                rotations += 1
+                if self.progress and rotations % 1000 == 0:
+                    self.progress(rotations=rotations)
+
+        mate = np.full(n, -1, dtype=np.int64)
+        for i in range(n):
+            t = first(i)
+            if t is not None:
+                mate[i] = partner[offsets[i] + t]
+        return mate, proposals, rotations
+
+    def greedy(self, lists, n):
+        """Best-pair-first matching over the acceptable pairs"""
+        mate = np.full(n, -1, dtype=np.int64)
+        offsets, partner, pair = lists['offsets'], lists['partner'], lists['pair']
+        owner = np.repeat(np.arange(n), np.diff(offsets))
+        ends = {}
+        for e in np.argsort(lists['pair_rank'][pair], kind='stable').tolist():
+            ends.setdefault(int(pair[e]), (int(owner[e]), int(partner[e])))
+        for p in np.argsort(lists['pair_rank']).tolist():
+            i, j = ends[p]
+            if mate[i] < 0 and mate[j] < 0:
+                mate[i], mate[j] = j, i
+        return mate
+
+    def blocking_pairs(self, lists, mate):
+        """
+        Acceptable pairs whose students both prefer each other to their roommates
+
+        Returns:
+            Array of (i, j) cohort positions
+        """
+        n = len(mate)
+        offsets, partner, pair, pair_rank = lists['offsets'], lists['partner'], lists['pair'], lists['pair_rank']
+        owner = np.repeat(np.arange(n), np.diff(offsets))
+        entry_rank = pair_rank[pair]
+
+        # Rank of each student's own pair (unmatched students accept anybody)
+        current = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        matched = mate[owner] == partner
+        current[owner[matched]] = entry_rank[matched]
+
+        blocking = (entry_rank < current[owner]) & (entry_rank < current[partner]) & (owner < partner)
+        return np.stack([owner[blocking], partner[blocking]], axis=1)
+
+    def full_blocking_pairs(self, encoded, mate):
+        """
+        Allowed pairs, listed or not, whose students both prefer each other to their roommates
+
+        Pairs are compared like in the preference lists: by score, then by
+        the lower and higher position of the pair.
+
+        Returns:
+            Array of (i, j) cohort positions
+        """
+        n = len(mate)
+        positions = np.arange(n)
+        matched = mate >= 0
+        current = np.full(n, -np.inf)
+        current[matched] = self.similarity_engine.calculate_pair_scores(encoded, positions[matched], mate[matched])
+        lo = np.where(matched, np.minimum(positions, mate), n)
+        hi = np.where(matched, np.maximum(positions, mate), n)
+
+        def prefers(i, j, scores, owner):
+            """Whether owner (i or j) ranks the pair (i, j), i < j, above its own pair"""
+            tied = (scores == current[owner]) & ((i < lo[owner]) | ((i == lo[owner]) & (j < hi[owner])))
+            return (scores > current[owner]) | tied
+
+        blocking = []
+        step = max(1, self.BLOCK_ENTRIES // n)
+        for start in range(0, n - 1, step):
+            rows = positions[start:start + step]
+            i, j = rows[:, None], positions[None, start + 1:]
+            scores = self.similarity_engine.calculate_similarity_block(encoded, rows, slice(start + 1, None))
+            found = (j > i) & prefers(i, j, scores, i) & prefers(i, j, scores, j)
+            if self.allowed is not None:
+                found &= self.allowed(i, j)
+            r, c = np.nonzero(found)
+            blocking.append(np.stack([rows[r], c + start + 1], axis=1))
+        return np.concatenate(blocking) if blocking else np.zeros((0, 2), dtype=np.int64)
+
+    def match_students(self, student_vectors, score_matrix=None, encoded=None):
+        """
+        Find a stable matching
+
+        Args:
+            student_vectors: List of student vector dictionaries
+            score_matrix: Unused; preference lists come from top-K candidates
+            encoded: Optional pre-encoded cohort aligned with student_vectors
+
+        Returns:
+            Dictionary with matches and statistics, including whether the
+            matching is stable and its blocking pairs otherwise; blocking_scope
+            is 'all_pairs' or 'preference_lists' (cohorts above
+            Config.STABLE_FULL_CHECK_MAX)
+        """
+        started = time.perf_counter()
+        n = len(student_vectors)
+        if n < 2:
+            return {
+                'matches': [],
+                'total_score': 0.0,
+                'average_score': 0.0,
+                'stable': True,
+                'stop_reason': 'stable',
+                'blocking_pairs': 0,
+                'blocking_scope': 'all_pairs',
+                'blocking_examples': [],
+                'candidate_k': self.candidate_k,
+                'proposals': 0,
+                'rotations': 0,
+                'unmatched': [s['id'] for s in student_vectors],
+                'alternatives': {}
+            }
+        if encoded is None:
+            encoded = self.similarity_engine.encode_students(student_vectors)
+
+        # Students left over are matched among themselves in further rounds; no two
+        # of them list each other, so the first round's lists stay free of blocking pairs
+        mate = np.full(n, -1, dtype=np.int64)
+        positions = np.arange(n)
+        solved = True
+        proposals = rotations = rounds = 0
+        lists = None
+        while len(positions) >= 2:
+            subset = encoded if lists is None else LocalSearchMatcher.subset(encoded, positions)
+            round_lists = self.preference_lists(subset, positions)
+            local_mate, round_proposals, round_rotations = self.irving(round_lists, len(positions))
+            if local_mate is None:
+                solved = False
+                local_mate = self.greedy(round_lists, len(positions))
+            lists = lists or round_lists
+            proposals += round_proposals
+            rotations += round_rotations
+            rounds += 1
+            matched = local_mate >= 0
+            if not matched.any():
+                break
+            mate[positions[matched]] = positions[local_mate[matched]]
+            positions = positions[~matched]
+        if n <= Config.STABLE_FULL_CHECK_MAX:
+            scope = 'all_pairs'
+            blocking = self.full_blocking_pairs(encoded, mate)
+        else:
+            scope = 'preference_lists'
+            blocking = self.blocking_pairs(lists, mate)
+
+        matched = np.flatnonzero(mate > np.arange(n))
+        scores = self.similarity_engine.calculate_pair_scores(encoded, matched, mate[matched])
+        pairs = [(student_vectors[i]['id'], student_vectors[j]['id'], float(s))
+                 for i, j, s in zip(matched.tolist(), mate[matched].tolist(), scores.tolist())]
+        matches = self.similarity_engine.attach_reasons(pairs, student_vectors)
+        unmatched = [student_vectors[i]['id'] for i in np.flatnonzero(mate < 0).tolist()]
+        lister = LocalSearchMatcher(self.similarity_engine, allowed=self.allowed)
+
+        total_score = sum(pair[2] for pair in matches)
+        return {
+            'matches': matches,
+            'total_score': round(total_score, 2),
+            'average_score': round(total_score / len(matches), 2) if matches else 0.0,
+            'stable': solved and not len(blocking),
+            'stop_reason': 'stable' if solved else 'no_stable_matching',
+            'blocking_pairs': int(len(blocking)),
+            'blocking_scope': scope,
+            'blocking_examples': [[student_vectors[i]['id'], student_vectors[j]['id']]
+                                  for i, j in blocking[:BLOCKING_EXAMPLES].tolist()],
+            'proposals': proposals,
+            'rotations': rotations,
+            'rounds': rounds,
+            'candidate_k': self.candidate_k,
+            'list_entries': int(len(lists['partner'])),
+            'search_time': round(time.perf_counter() - started, 3),
+            'unmatched': unmatched,
+            'alternatives': self.similarity_engine.unmatched_alternatives(
+                unmatched, student_vectors, matches, lambda rows: lister.score_rows(encoded, rows))
+        }
@@ -0,0 +1,259 @@
+"""
+Student Import Module
+Streaming bulk import of students from CSV or JSONL files
+
+Registering a whole intake through /register costs a request, an email
+lookup and a commit per student. The importer instead reads the file one
+record at a time, validates the fields register reads, and writes the
+students in batches: each batch checks its emails against the database in
+one IN query and is inserted with a single executemany in its own
+transaction. Invalid rows and duplicate emails are reported with their line
+number and skipped; they never abort the rest of the file.
+
+Compatibility rows for the new students are computed by the next
+CompatibilityCache.sync, and the candidate index rebuilds itself once it
+notices the new student count.
+"""
+from config import Config
+import csv
+import json
+import os
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Student
+
+# Text fields: column -> maximum length
+TEXT_FIELDS = {
+    'name': 100,
+    'email': 120,
+    'gender': 20,
+    'hobbies': 500
+}
+
+# Integer fields: column -> (minimum, maximum), as offered by the register form
+INTEGER_FIELDS = {
+    'age': (16, 100),
+    'sleep_time': (0, 2),
+    'study_time': (0, 3),
+    'cleanliness': (1, 5),
+    'noise_tolerance': (1, 5),
+    'personality': (0, 2)
+}
+
+GENDERS = ('Male', 'Female', 'Other')
+
+FORMATS = ('csv', 'jsonl')
+
+
+def detect_format(filename, fmt=None):
+    """
+    Resolve the file format from an explicit value or the file extension
+
+    Raises:
+        ValueError: If the format is unknown
+    """
+    if not fmt:
+        extension = os.path.splitext(filename or '')[1].lower()
+        fmt = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(extension)
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown import format for {filename!r} (expected .csv or .jsonl)')
+    return fmt
+
+
+def iter_records(stream, fmt):
+    """
+    Yield (line number, record) pairs from a text stream
+
+    A record is a dict, or the exception raised while parsing its line.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        missing = [field for field in list(TEXT_FIELDS) + list(INTEGER_FIELDS)
+                   if field not in (reader.fieldnames or [])]
+        if missing:
+            yield 1, ValueError(f'Missing columns: {", ".join(missing)}')
+            return
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f'Invalid JSON: {e}')
+                continue
+            if not isinstance(record, dict):
+                record = ValueError('Expected a JSON object')
+            yield line_number, record
+
+
+def validate_record(record):
+    """
+    Convert a raw record into Student column values
+
+    Raises:
+        ValueError: Describing the first invalid field
+    """
+    values = {}
+    for field, max_length in TEXT_FIELDS.items():
+        value = record.get(field)
+        if field == 'hobbies' and isinstance(value, list):
+            value = ', '.join(str(hobby) for hobby in value)
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            raise ValueError(f'{field} is required')
+        if len(value) > max_length:
+            raise ValueError(f'{field} is longer than {max_length} characters')
+        values[field] = value
+
+    if '@' not in values['email']:
+        raise ValueError(f'Invalid email {values["email"]!r}')
+    if values['gender'] not in GENDERS:
+        raise ValueError(f'gender must be one of {", ".join(GENDERS)}')
+
+    for field, (low, high) in INTEGER_FIELDS.items():
+        value = record.get(field)
+        try:
+            value = int(str(value).strip())
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be an integer, got {value!r}')
+        if not low <= value <= high:
+            raise ValueError(f'{field} must be between {low} and {high}, got {value}')
+        values[field] = value
+    return values
+
+
+class ImportReport:
+    """Counters and per-row errors of one import"""
+
+    def __init__(self, max_errors=None):
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []  # First max_errors problems as {'line', 'error'}
+        self.max_errors = max_errors if max_errors is not None else Config.IMPORT_MAX_ERRORS
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add_error(self, line, message, duplicate=False):
+        """Record a skipped row"""
+        if duplicate:
+            self.duplicates += 1
+        else:
+            self.invalid += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': message})
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self):
+        """JSON-serializable summary"""
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'errors': self.errors,
+            'errors_truncated': self.duplicates + self.invalid > len(self.errors),
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1)
+        }
+
+
+class StudentImporter:
+    """Stream students from a file into the database in batched transactions"""
+
+    def __init__(self, feature_store, batch_size=None):
+        """
+        Initialize the importer
+
+        Args:
+            feature_store: FeatureStore that normalizes the new students
+            batch_size: Students per transaction (default: Config.IMPORT_BATCH_SIZE)
+        """
+        self.feature_store = feature_store
+        self.batch_size = batch_size or Config.IMPORT_BATCH_SIZE
+
+    def import_stream(self, stream, fmt):
+        """
+        Import every record of a text stream
+
+        Args:
+            stream: Text stream of CSV (with a header row) or JSONL records
+            fmt: 'csv' or 'jsonl'
+
+        Returns:
+            ImportReport
+        """
+        report = ImportReport()
+        seen = {}  # email -> line it was first read from
+        batch = []
+        try:
+            for line, record in iter_records(stream, fmt):
+                if isinstance(record, Exception):
+                    report.rows += 1
+                    report.add_error(line, str(record))
+                    continue
+                report.rows += 1
+                try:
+                    values = validate_record(record)
+                except ValueError as e:
+                    report.add_error(line, str(e))
+                    continue
+                if values['email'] in seen:
+                    report.add_error(line, f'Email {values["email"]} already appears on line {seen[values["email"]]}',
+                                     duplicate=True)
+                    continue
+                seen[values['email']] = line
+                batch.append((line, values))
+                if len(batch) >= self.batch_size:
+                    self._write_batch(batch, report)
+                    batch = []
+        except (csv.Error, UnicodeDecodeError) as e:
+            report.add_error(None, f'Could not read the rest of the file: {e}')
+        self._write_batch(batch, report)
+        report.finish()
+        return report
+
+    def _write_batch(self, batch, report):
+        """Insert the batch's students whose email is not registered yet"""
+        if not batch:
+            return
+        for attempt in range(2):
+            emails = [values['email'] for _, values in batch]
+            existing = set()
+            for start in range(0, len(emails), self.feature_store.QUERY_CHUNK):
+                chunk = emails[start:start + self.feature_store.QUERY_CHUNK]
+                existing.update(email for (email,) in
+                                db.session.query(Student.email).filter(Student.email.in_(chunk)))
+            fresh = [(line, values) for line, values in batch if values['email'] not in existing]
+
+            students = [Student(**values) for _, values in fresh]
+            self.feature_store.normalize(students)
+            columns = list(TEXT_FIELDS) + list(INTEGER_FIELDS) + ['features', 'hobby_ids']
+            rows = [{column: getattr(student, column) for column in columns} for student in students]
+            try:
+                if rows:
+                    db.session.execute(Student.__table__.insert(), rows)
+                db.session.commit()
+                break
+            except IntegrityError:
+                # An email was registered concurrently; the next pass skips it
+                db.session.rollback()
+                if attempt:
+                    raise
+
+        for line, values in batch:
+            if values['email'] in existing:
+                report.add_error(line, f'Email {values["email"]} is already registered', duplicate=True)
+        report.imported += len(fresh)